@@ -91,28 +91,22 @@ def image_ec2_id(image_id, image_type='ami'):
         return "ami-00000000"
 
 
-def get_ip_info_for_instance_from_nw_info(nw_info):
-    ip_info = {}
-    fixed_ips = nw_info.fixed_ips()
-    ip_info['fixed_ips'] = [ip['address'] for ip in fixed_ips
-                                          if ip['version'] == 4]
-    ip_info['fixed_ip6s'] = [ip['address'] for ip in fixed_ips
-                                           if ip['version'] == 6]
-    ip_info['floating_ips'] = [ip['address'] for ip in nw_info.floating_ips()]
-
-    return ip_info
-
-
 def get_ip_info_for_instance(context, instance):
     """Return a dictionary of IP information for an instance"""
 
     info_cache = instance['info_cache'] or {}
-    cached_nwinfo = info_cache.get('network_info')
-    # Make sure empty response is turned into []
-    if not cached_nwinfo:
-        cached_nwinfo = []
-    nw_info = network_model.NetworkInfo.hydrate(cached_nwinfo)
-    return get_ip_info_for_instance_from_nw_info(nw_info)
+    addresses = network_model.get_addresses(info_cache.get('network_info'))
+
+    ip_info = {'fixed_ips': [], 'fixed_ip6s': [], 'floating_ips': []}
+    for _label, fixed_ips, floating_ips in addresses:
+        for version, address in fixed_ips:
+            if version == 4:
+                ip_info['fixed_ips'].append(address)
+            elif version == 6:
+                ip_info['fixed_ip6s'].append(address)
+        ip_info['floating_ips'].extend(address
+                                       for _version, address in floating_ips)
+    return ip_info
 
 
 def get_availability_zone_by_host(services, host):
@@ -83,6 +83,11 @@ class InvalidMetadataPath(Exception):
 class InstanceMetadata():
     """Instance metadata."""
 
+    # Rendered EC2 and OpenStack metadata trees by version, filled in on
+    # first use, see get_ec2_metadata() and _get_openstack_metadata().
+    _ec2_metadata = None
+    _openstack_metadata = None
+
     def __init__(self, instance, address=None, content=[], extra_md=None):
         """Creation of this object should basically cover all time consuming
         collection.  Methods after that should not cause time delays due to
@@ -167,12 +172,24 @@ class InstanceMetadata():
             self.content[key] = contents
 
     def get_ec2_metadata(self, version):
+        """Return the EC2 metadata tree of a version.
+
+        The tree is only built once per version and shared by the calls,
+        so it must not be modified.
+        """
         if version == "latest":
             version = VERSIONS[-1]
 
         if version not in VERSIONS:
             raise InvalidMetadataVersion(version)
 
+        if self._ec2_metadata is None:
+            self._ec2_metadata = {}
+        if version not in self._ec2_metadata:
+            self._ec2_metadata[version] = self._build_ec2_metadata(version)
+        return self._ec2_metadata[version]
+
+    def _build_ec2_metadata(self, version):
         hostname = self._get_hostname()
 
         floating_ips = self.ip_info['floating_ips']
@@ -283,6 +300,25 @@ class InstanceMetadata():
             raise KeyError(path)
 
         # right now, the only valid path is metadata.json
+        if self._openstack_metadata is None:
+            self._openstack_metadata = {}
+        if version not in self._openstack_metadata:
+            self._openstack_metadata[version] = \
+                    self._build_openstack_metadata(version)
+        metadata = self._openstack_metadata[version]
+
+        if self._check_os_version(GRIZZLY, version):
+            # A new seed on every request.
+            metadata = dict(metadata,
+                            random_seed=base64.b64encode(os.urandom(512)))
+
+        data = {
+            MD_JSON_NAME: json.dumps(metadata),
+        }
+
+        return data[path]
+
+    def _build_openstack_metadata(self, version):
         metadata = {}
         metadata['uuid'] = self.uuid
 
@@ -312,14 +348,7 @@ class InstanceMetadata():
         metadata['launch_index'] = self.instance['launch_index']
         metadata['availability_zone'] = self.availability_zone
 
-        if self._check_os_version(GRIZZLY, version):
-            metadata['random_seed'] = base64.b64encode(os.urandom(512))
-
-        data = {
-            MD_JSON_NAME: json.dumps(metadata),
-        }
-
-        return data[path]
+        return metadata
 
     def _check_version(self, required, requested, versions=VERSIONS):
         return versions.index(requested) >= versions.index(required)
@@ -378,7 +407,7 @@ class InstanceMetadata():
             if version in CONF.config_drive_skip_versions.split(' '):
                 continue
 
-            data = self.get_ec2_metadata(version)
+            data = dict(self.get_ec2_metadata(version))
             if 'user-data' in data:
                 filepath = os.path.join('ec2', version, 'user-data')
                 yield (filepath, data['user-data'])
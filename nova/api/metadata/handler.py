@@ -20,11 +20,14 @@
 import hashlib
 import hmac
 import os
+import sys
 
+import eventlet.event
 import webob.dec
 import webob.exc
 
 from nova.api.metadata import base
+from nova.common import memorycache
 from nova import exception
 from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
@@ -48,54 +51,114 @@ metadata_proxy_opts = [
          help='Shared secret to validate proxies Quantum metadata requests')
 ]
 
+metadata_cache_opts = [
+    cfg.IntOpt('metadata_local_cache_size',
+               default=1000,
+               help='Maximum number of entries of the in-process metadata '
+                    'cache kept in front of memcached'),
+    cfg.IntOpt('metadata_negative_cache_expiration',
+               default=5,
+               help='Number of seconds the absence of metadata for an '
+                    'address or instance id is cached. 0 disables it'),
+]
+
 CONF.register_opts(metadata_proxy_opts)
+CONF.register_opts(metadata_cache_opts)
 
 LOG = logging.getLogger(__name__)
 
-if CONF.memcached_servers:
-    import memcache
-else:
-    from nova.common import memorycache as memcache
+# Cached in place of the metadata of an address or instance id that has
+# none.
+NOT_FOUND = 'metadata-not-found'
 
 
 class MetadataRequestHandler(wsgi.Application):
     """Serve metadata."""
 
     def __init__(self):
-        self._cache = memcache.Client(CONF.memcached_servers, debug=0)
-
-    def get_metadata_by_remote_address(self, address):
-        if not address:
-            raise exception.FixedIpNotFoundForAddress(address=address)
-
-        cache_key = 'metadata-%s' % address
-        data = self._cache.get(cache_key)
-        if data:
-            return data
+        # Metadata is looked up in an in-process LRU cache first and then
+        # in memcached, if configured, which is shared by the API workers.
+        self._local_cache = memorycache.Client(
+                max_size=CONF.metadata_local_cache_size)
+        self._cache = None
+        if CONF.memcached_servers:
+            import memcache
+            self._cache = memcache.Client(CONF.memcached_servers, debug=0)
+        # cache key -> Event of the lookup in progress for it, which the
+        # requests missing the cache for the same key wait for.
+        self._lookups = {}
+
+    def _cache_get(self, cache_key):
+        data = self._local_cache.get(cache_key)
+        if data is None and self._cache is not None:
+            data = self._cache.get(cache_key)
+            if data is not None:
+                self._local_cache.set(cache_key, data,
+                                      self._cache_expiration(data))
+        return data
 
+    def _cache_set(self, cache_key, data):
+        expiration = self._cache_expiration(data)
+        if not expiration:
+            return
+        self._local_cache.set(cache_key, data, expiration)
+        if self._cache is not None:
+            self._cache.set(cache_key, data, expiration)
+
+    @staticmethod
+    def _cache_expiration(data):
+        if data == NOT_FOUND:
+            return CONF.metadata_negative_cache_expiration
+        return CACHE_EXPIRATION
+
+    def _load_metadata(self, cache_key, get_metadata, *args):
         try:
-            data = base.get_metadata_by_address(address)
+            data = get_metadata(*args)
         except exception.NotFound:
-            return None
-
-        self._cache.set(cache_key, data, CACHE_EXPIRATION)
-
+            data = NOT_FOUND
+        self._cache_set(cache_key, data)
         return data
 
-    def get_metadata_by_instance_id(self, instance_id, address):
-        cache_key = 'metadata-%s' % instance_id
-        data = self._cache.get(cache_key)
-        if data:
-            return data
-
-        try:
-            data = base.get_metadata_by_instance_id(instance_id, address)
-        except exception.NotFound:
+    def _get_metadata(self, cache_key, get_metadata, *args):
+        """Return the metadata cached under cache_key, or get it with
+        get_metadata(*args).  Only one lookup at a time is done for a key.
+
+        Returns None if there is no metadata.
+        """
+        data = self._cache_get(cache_key)
+        if data is None:
+            lookup = self._lookups.get(cache_key)
+            if lookup is not None:
+                data = lookup.wait()
+            else:
+                lookup = eventlet.event.Event()
+                self._lookups[cache_key] = lookup
+                try:
+                    data = self._load_metadata(cache_key, get_metadata,
+                                               *args)
+                except Exception:
+                    exc_info = sys.exc_info()
+                    lookup.send_exception(*exc_info)
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                else:
+                    lookup.send(data)
+                finally:
+                    del self._lookups[cache_key]
+        if data == NOT_FOUND:
             return None
+        return data
 
-        self._cache.set(cache_key, data, CACHE_EXPIRATION)
+    def get_metadata_by_remote_address(self, address):
+        if not address:
+            raise exception.FixedIpNotFoundForAddress(address=address)
 
-        return data
+        return self._get_metadata('metadata-%s' % address,
+                                  base.get_metadata_by_address, address)
+
+    def get_metadata_by_instance_id(self, instance_id, address):
+        return self._get_metadata('metadata-%s' % instance_id,
+                                  base.get_metadata_by_instance_id,
+                                  instance_id, address)
 
     @webob.dec.wsgify(RequestClass=wsgi.Request)
     def __call__(self, req):
@@ -26,9 +26,9 @@ from xml.dom import minidom
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
 from nova.compute import task_states
-from nova.compute import utils as compute_utils
 from nova.compute import vm_states
 from nova import exception
+from nova.network import model as network_model
 from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova import quota
@@ -310,20 +310,6 @@ def dict_to_query_str(params):
     return param_str.rstrip('&')
 
 
-def get_networks_for_instance_from_nw_info(nw_info):
-    networks = {}
-    for vif in nw_info:
-        ips = vif.fixed_ips()
-        floaters = vif.floating_ips()
-        label = vif['network']['label']
-        if label not in networks:
-            networks[label] = {'ips': [], 'floating_ips': []}
-
-        networks[label]['ips'].extend(ips)
-        networks[label]['floating_ips'].extend(floaters)
-    return networks
-
-
 def get_networks_for_instance(context, instance):
     """Returns a prepared nw_info list for passing into the view builders
 
@@ -335,8 +321,20 @@ def get_networks_for_instance(context, instance):
                                      {'addr': '172.16.2.1', 'version': 4}]},
          ...}
     """
-    nw_info = compute_utils.get_nw_info_for_instance(instance)
-    return get_networks_for_instance_from_nw_info(nw_info)
+    info_cache = instance['info_cache'] or {}
+    addresses = network_model.get_addresses(info_cache.get('network_info'))
+
+    networks = {}
+    for label, fixed_ips, floating_ips in addresses:
+        if label not in networks:
+            networks[label] = {'ips': [], 'floating_ips': []}
+        networks[label]['ips'].extend(
+                {'version': version, 'address': address}
+                for version, address in fixed_ips)
+        networks[label]['floating_ips'].extend(
+                {'version': version, 'address': address}
+                for version, address in floating_ips)
+    return networks
 
 
 def raise_http_conflict_for_instance_invalid_state(exc, action):
@@ -226,7 +226,8 @@ class HypervisorsController(object):
         if hypervisors:
             return dict(hypervisors=[self._view_hypervisor(hyp, False,
                                      db.instance_get_all_by_host(context,
-                                                       hyp['service']['host']))
+                                                       hyp['service']['host'],
+                                                       columns_to_join=[]))
                                      for hyp in hypervisors])
         else:
             msg = _("No hypervisor matching '%s' could be found.") % id
@@ -0,0 +1,103 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""The image pre-fetch admin API extension."""
+
+import webob.exc
+
+from nova.api.openstack import extensions
+from nova.api.openstack import wsgi
+from nova.api.openstack import xmlutil
+from nova.compute import api as compute_api
+from nova import exception
+from nova.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+authorize = extensions.extension_authorizer('compute', 'image_prefetch')
+
+
+class ImagePrefetchTemplate(xmlutil.TemplateBuilder):
+    def construct(self):
+        root = xmlutil.TemplateElement('prefetch', selector='prefetch')
+        root.set('image_id')
+        hosts = xmlutil.SubTemplateElement(root, 'hosts')
+        host = xmlutil.SubTemplateElement(hosts, 'host', selector='hosts')
+        host.set('host')
+        host.set('status')
+        return xmlutil.MasterTemplate(root, 1)
+
+
+class ImagePrefetchController(object):
+    """Pre-fetch images into the image cache of compute hosts."""
+
+    def __init__(self):
+        self.api = compute_api.HostAPI()
+
+    @wsgi.serializers(xml=ImagePrefetchTemplate)
+    def create(self, req, body):
+        """Pre-fetch an image on a list of hosts or an aggregate.
+
+        The body names the image and either the hosts or the aggregate:
+        {"prefetch": {"image_id": ..., "hosts": [...]}} or
+        {"prefetch": {"image_id": ..., "aggregate_id": ...}}
+        The response gives the status of every host once they are done.
+        """
+        context = req.environ['nova.context']
+        authorize(context)
+
+        try:
+            prefetch = body['prefetch']
+            image_id = prefetch['image_id']
+        except (KeyError, TypeError):
+            msg = _("prefetch with an image_id is required")
+            raise webob.exc.HTTPBadRequest(explanation=msg)
+
+        hosts = prefetch.get('hosts')
+        aggregate_id = prefetch.get('aggregate_id')
+        if (hosts is None) == (aggregate_id is None):
+            msg = _("Exactly one of hosts and aggregate_id is required")
+            raise webob.exc.HTTPBadRequest(explanation=msg)
+        if hosts is not None and (not isinstance(hosts, list) or
+                not all(isinstance(host, basestring) for host in hosts)):
+            msg = _("hosts must be a list of host names")
+            raise webob.exc.HTTPBadRequest(explanation=msg)
+
+        try:
+            hosts = self.api.prefetch_image(context, image_id, hosts=hosts,
+                                            aggregate_id=aggregate_id)
+        except exception.NotFound as e:
+            raise webob.exc.HTTPNotFound(explanation=unicode(e))
+        except exception.Invalid as e:
+            raise webob.exc.HTTPBadRequest(explanation=unicode(e))
+
+        return {'prefetch': {'image_id': image_id, 'hosts': hosts}}
+
+
+class Image_prefetch(extensions.ExtensionDescriptor):
+    """Admin-only image pre-fetch into compute host image caches"""
+
+    name = "ImagePrefetch"
+    alias = "os-image-prefetch"
+    namespace = "http://docs.openstack.org/compute/ext/image_prefetch/api/v2"
+    updated = "2013-01-30T00:00:00+00:00"
+
+    def get_resources(self):
+        resources = []
+        resource = extensions.ResourceExtension('os-image-prefetch',
+                                                ImagePrefetchController())
+        resources.append(resource)
+        return resources
@@ -22,6 +22,7 @@ from nova.api.openstack import extensions
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
 from nova.compute import api
+from nova.compute import tenant_usage
 from nova import exception
 from nova.openstack.common import timeutils
 
@@ -65,124 +66,30 @@ class SimpleTenantUsagesTemplate(xmlutil.TemplateBuilder):
 
 
 class SimpleTenantUsageController(object):
-    def _hours_for(self, instance, period_start, period_stop):
-        launched_at = instance['launched_at']
-        terminated_at = instance['terminated_at']
-        if terminated_at is not None:
-            if not isinstance(terminated_at, datetime.datetime):
-                terminated_at = timeutils.parse_strtime(terminated_at,
-                                                        "%Y-%m-%d %H:%M:%S.%f")
-
-        if launched_at is not None:
-            if not isinstance(launched_at, datetime.datetime):
-                launched_at = timeutils.parse_strtime(launched_at,
-                                                      "%Y-%m-%d %H:%M:%S.%f")
-
-        if terminated_at and terminated_at < period_start:
-            return 0
-        # nothing if it started after the usage report ended
-        if launched_at and launched_at > period_stop:
-            return 0
-        if launched_at:
-            # if instance launched after period_started, don't charge for first
-            start = max(launched_at, period_start)
-            if terminated_at:
-                # if instance stopped before period_stop, don't charge after
-                stop = min(period_stop, terminated_at)
-            else:
-                # instance is still running, so charge them up to current time
-                stop = period_stop
-            dt = stop - start
-            seconds = (dt.days * 3600 * 24 + dt.seconds +
-                       dt.microseconds / 100000.0)
-
-            return seconds / 3600.0
-        else:
-            # instance hasn't launched, so no charge
-            return 0
-
     def _tenant_usages_for_period(self, context, period_start,
                                   period_stop, tenant_id=None, detailed=True):
 
         compute_api = api.API()
-        instances = compute_api.get_active_by_window(context,
-                                                     period_start,
-                                                     period_stop,
-                                                     tenant_id)
-        rval = {}
-        flavors = {}
-
-        for instance in instances:
-            info = {}
-            info['hours'] = self._hours_for(instance,
-                                            period_start,
-                                            period_stop)
-            flavor_type = instance['instance_type_id']
-
-            if not flavors.get(flavor_type):
-                try:
-                    it_ref = compute_api.get_instance_type(context,
-                                                           flavor_type)
-                    flavors[flavor_type] = it_ref
-                except exception.InstanceTypeNotFound:
-                    # can't bill if there is no instance type
-                    continue
-
-            flavor = flavors[flavor_type]
-
-            info['instance_id'] = instance['uuid']
-            info['name'] = instance['display_name']
-
-            info['memory_mb'] = flavor['memory_mb']
-            info['local_gb'] = flavor['root_gb'] + flavor['ephemeral_gb']
-            info['vcpus'] = flavor['vcpus']
-
-            info['tenant_id'] = instance['project_id']
-
-            info['flavor'] = flavor['name']
-
-            info['started_at'] = instance['launched_at']
-
-            info['ended_at'] = instance['terminated_at']
-
-            if info['ended_at']:
-                info['state'] = 'terminated'
-            else:
-                info['state'] = instance['vm_state']
-
-            now = timeutils.utcnow()
-
-            if info['state'] == 'terminated':
-                delta = info['ended_at'] - info['started_at']
-            else:
-                delta = now - info['started_at']
-
-            info['uptime'] = delta.days * 24 * 3600 + delta.seconds
-
-            if not info['tenant_id'] in rval:
-                summary = {}
-                summary['tenant_id'] = info['tenant_id']
-                if detailed:
-                    summary['server_usages'] = []
-                summary['total_local_gb_usage'] = 0
-                summary['total_vcpus_usage'] = 0
-                summary['total_memory_mb_usage'] = 0
-                summary['total_hours'] = 0
-                summary['start'] = period_start
-                summary['stop'] = period_stop
-                rval[info['tenant_id']] = summary
-
-            summary = rval[info['tenant_id']]
-            summary['total_local_gb_usage'] += info['local_gb'] * info['hours']
-            summary['total_vcpus_usage'] += info['vcpus'] * info['hours']
-            summary['total_memory_mb_usage'] += (info['memory_mb'] *
-                                                 info['hours'])
-
-            summary['total_hours'] += info['hours']
-            if detailed:
-                summary['server_usages'].append(info)
+        if detailed:
+            columns = tenant_usage.SERVER_COLUMNS
+        else:
+            columns = tenant_usage.USAGE_COLUMNS
+        rows = compute_api.get_active_by_window_columns(context, columns,
+                                                        period_start,
+                                                        period_stop,
+                                                        tenant_id)
 
-        return rval.values()
+        flavors = {}
+        for flavor_type in set(row[1] for row in rows):
+            try:
+                flavors[flavor_type] = compute_api.get_instance_type(
+                        context, flavor_type)
+            except exception.InstanceTypeNotFound:
+                # can't bill if there is no instance type
+                continue
+
+        return tenant_usage.tenant_usages(rows, flavors, period_start,
+                                          period_stop, detailed=detailed)
 
     def _parse_datetime(self, dtstr):
         if not dtstr:
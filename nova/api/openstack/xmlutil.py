@@ -27,6 +27,18 @@ XMLNS_V11 = 'http://docs.openstack.org/compute/api/v1.1'
 XMLNS_COMMON_V10 = 'http://docs.openstack.org/common/api/v1.0'
 XMLNS_ATOM = 'http://www.w3.org/2005/Atom'
 
+# Compiled serializers are cached on the root template element for
+# each set of slave templates attached to it.  A changed template
+# element invalidates every compiled serializer, since the same element
+# may be shared by several templates.
+_MAX_COMPILED_TEMPLATES = 64
+_template_generation = 0
+
+
+def _template_changed():
+    global _template_generation
+    _template_generation += 1
+
 
 def validate_schema(xml, schema_name):
     if isinstance(xml, str):
@@ -172,6 +184,7 @@ class TemplateElement(object):
         self._text = None
         self._children = []
         self._childmap = {}
+        self._compiled = {}
 
         # Run the incoming attributes through set() so that they
         # become selectorized
@@ -219,6 +232,7 @@ class TemplateElement(object):
 
         self._children.append(elem)
         self._childmap[elem.tag] = elem
+        _template_changed()
 
     def extend(self, elems):
         """Append children to the element."""
@@ -240,6 +254,7 @@ class TemplateElement(object):
         # Update the children
         self._children.extend(elemlist)
         self._childmap.update(elemmap)
+        _template_changed()
 
     def insert(self, idx, elem):
         """Insert a child element at the given index."""
@@ -253,6 +268,7 @@ class TemplateElement(object):
 
         self._children.insert(idx, elem)
         self._childmap[elem.tag] = elem
+        _template_changed()
 
     def remove(self, elem):
         """Remove a child element."""
@@ -266,6 +282,7 @@ class TemplateElement(object):
 
         self._children.remove(elem)
         del self._childmap[elem.tag]
+        _template_changed()
 
     def get(self, key):
         """Get an attribute.
@@ -296,6 +313,7 @@ class TemplateElement(object):
             value = Selector(value)
 
         self.attrib[key] = value
+        _template_changed()
 
     def keys(self):
         """Return the attribute names."""
@@ -389,6 +407,9 @@ class TemplateElement(object):
         instance and the second item is the datum associated with that
         instance.
 
+        Only Template._serialize() calls this; make_tree() renders
+        through the function built by _compile_siblings() instead.
+
         :param parent: The parent for the etree.Element instances.
         :param obj: The object to render this template element
                     against.
@@ -453,9 +474,11 @@ class TemplateElement(object):
             value = Selector(value)
 
         self._text = value
+        _template_changed()
 
     def _text_del(self):
         self._text = None
+        _template_changed()
 
     text = property(_text_get, _text_set, _text_del)
 
@@ -512,6 +535,127 @@ def SubTemplateElement(parent, tag, attrib=None, selector=None,
     return elem
 
 
+def _compile_selector(selector):
+    """Compile a selector.
+
+    Returns a function equivalent to the selector.  Plain Selector
+    instances selecting the object itself or a single index are
+    replaced by functions doing just that; any other selector is
+    returned unchanged.
+    """
+
+    if type(selector) is not Selector or len(selector.chain) > 1:
+        return selector
+
+    if not selector.chain:
+        return lambda obj, do_raise=False: obj
+
+    key = selector.chain[0]
+    if callable(key):
+        return selector
+
+    def select(obj, do_raise=False):
+        try:
+            return obj[key]
+        except (KeyError, IndexError):
+            if do_raise:
+                raise KeyError(key)
+            return None
+
+    return select
+
+
+def _compile_siblings(siblings):
+    """Compile template elements into a serialization function.
+
+    Returns a function taking a parent etree.Element instance, an
+    object and an optional namespace dictionary, which renders the
+    object against the sibling template elements as
+    Template._serialize() does and returns the list of two-item
+    tuples rendered by the first sibling.  Merging the text,
+    attributes and children of the siblings is done here, once,
+    instead of for every object rendered.
+
+    :param siblings: The TemplateElement instances against which
+                     to render objects.
+    """
+
+    first = siblings[0]
+    tag = first.tag
+    selector = _compile_selector(first.selector)
+    subselector = first.subselector
+    if subselector is not None:
+        subselector = _compile_selector(subselector)
+    will_render = first.will_render
+
+    texts = [_compile_selector(sibling.text) for sibling in siblings
+             if sibling.text is not None]
+    attrs = [(key, _compile_selector(value)) for sibling in siblings
+             for key, value in sibling.attrib.items()]
+
+    # Merge the children of the siblings, in the order _serialize()
+    # renders them
+    children = []
+    seen = set()
+    for idx, sibling in enumerate(siblings):
+        for child in sibling:
+            if child.tag in seen:
+                continue
+            seen.add(child.tag)
+
+            nieces = [child]
+            for sib in siblings[idx + 1:]:
+                if child.tag in sib:
+                    nieces.append(sib[child.tag])
+            children.append(_compile_siblings(nieces))
+
+    def render(parent, datum, nsmap):
+        tagname = tag(datum) if callable(tag) else tag
+        elem = etree.Element(tagname, nsmap=nsmap)
+        if parent is not None:
+            parent.append(elem)
+
+        if datum is None:
+            return elem
+
+        for text in texts:
+            elem.text = unicode(text(datum))
+        for key, value in attrs:
+            try:
+                elem.set(key, unicode(value(datum, True)))
+            except KeyError:
+                # Attribute has no value, so don't include it
+                pass
+        return elem
+
+    def serialize(parent, obj, nsmap=None):
+        data = None if obj is None else selector(obj)
+
+        if not will_render(data):
+            return []
+        elif data is None:
+            elems = [(render(parent, None, nsmap), None)]
+        else:
+            if not isinstance(data, list):
+                data = [data]
+            elif parent is None:
+                raise ValueError(_('root element selecting a list'))
+
+            elems = []
+            for datum in data:
+                if subselector is not None:
+                    datum = subselector(datum)
+                elems.append((render(parent, datum, nsmap), datum))
+
+        for child in children:
+            for elem, datum in elems:
+                child(elem, datum)
+
+        return elems
+
+    return serialize
+
+
 class Template(object):
     """Represent a template."""
 
@@ -535,6 +679,11 @@ class Template(object):
         from an object based on the template.  Returns the first
         etree.Element instance rendered, or None.
 
+        make_tree() no longer walks the template this way.  The walk is
+        kept as the reference the compiled serializer is checked against,
+        and is only used by the tests and by
+        tools/xml_serialization_benchmark.py.
+
         :param parent: The parent etree.Element instance.  Can be
                        None.
         :param obj: The object to render.
@@ -605,12 +754,32 @@ class Template(object):
         if self.root is None:
             return None
 
-        # Get the siblings and nsmap of the root element
+        # Form the element tree
+        elems = self._compile()(None, obj, self._nsmap())
+        if elems:
+            return elems[0][0]
+
+    def _compile(self):
+        """Return the compiled serialization function.
+
+        The function rendering an object against the root siblings is
+        compiled once and cached on the root element, keyed by the
+        other siblings--that is, by the slave templates attached.  It
+        is compiled again if any template element has changed since.
+        """
+
         siblings = self._siblings()
-        nsmap = self._nsmap()
+        cache = siblings[0]._compiled
+        key = tuple(siblings[1:])
 
-        # Form the element tree
-        return self._serialize(None, obj, siblings, nsmap)
+        generation, serialize = cache.get(key, (None, None))
+        if generation != _template_generation:
+            if len(cache) >= _MAX_COMPILED_TEMPLATES:
+                cache.clear()
+            serialize = _compile_siblings(siblings)
+            cache[key] = (_template_generation, serialize)
+
+        return serialize
 
     def _siblings(self):
         """Hook method for computing root siblings.
@@ -16,49 +16,180 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-"""Super simple fake memcache client."""
+"""In-process replacement for a memcache client."""
 
+import heapq
+import threading
+
+from nova.openstack.common import cfg
 from nova.openstack.common import timeutils
 
+memorycache_opts = [
+    cfg.IntOpt('memorycache_max_size',
+               default=0,
+               help='Maximum number of keys held by the in-process cache '
+                    'used when memcached_servers is not set. The least '
+                    'recently used keys are evicted beyond that. 0 means '
+                    'unlimited'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(memorycache_opts)
+
 
 class Client(object):
-    """Replicates a tiny subset of memcached client interface."""
+    """Replicates a subset of memcached client interface.
+
+    The keys with a timeout are kept in a heap ordered by expiry time, so
+    expired keys are dropped without scanning the whole cache.  When the
+    size is bounded, the keys are also kept in a heap ordered by last use
+    to find the least recently used one.
+    """
 
     def __init__(self, *args, **kwargs):
-        """Ignores the passed in args."""
+        """Ignores the passed in args except max_size, which defaults to
+        the memorycache_max_size option.
+        """
+        self.max_size = kwargs.get('max_size', CONF.memorycache_max_size)
+        # key -> (timeout, value)
         self.cache = {}
+        # (timeout, key) of the keys set with a timeout.  Entries for keys
+        # set again or deleted since are skipped when they come up.
+        self._expiry_heap = []
+        # key -> use count when last used, and the (use count, key) heap
+        # of the uses, only maintained when max_size is set.
+        self._last_used = {}
+        self._lru_heap = []
+        self._uses = 0
+        self._lock = threading.Lock()
+        self.stats = dict(get_hits=0, get_misses=0, cmd_get=0, cmd_set=0,
+                          expirations=0, evictions=0)
 
-    def get(self, key):
-        """Retrieves the value for a key or None.
+    def _delete(self, key):
+        del self.cache[key]
+        self._last_used.pop(key, None)
 
-        this expunges expired keys during each get"""
+    def _expire(self, now):
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            timeout, key = heapq.heappop(heap)
+            item = self.cache.get(key)
+            if item is not None and item[0] == timeout:
+                self._delete(key)
+                self.stats['expirations'] += 1
+        # Don't let the entries of overwritten keys pile up.
+        if len(heap) > 2 * len(self.cache) + 64:
+            self._expiry_heap = [(t, k) for k, (t, _value)
+                                 in self.cache.iteritems() if t]
+            heapq.heapify(self._expiry_heap)
 
-        for k in self.cache.keys():
-            (timeout, _value) = self.cache[k]
-            if timeout and timeutils.utcnow_ts() >= timeout:
-                del self.cache[k]
+    def _touch(self, key):
+        if not self.max_size:
+            return
+        self._uses += 1
+        self._last_used[key] = self._uses
+        heapq.heappush(self._lru_heap, (self._uses, key))
+        if len(self._lru_heap) > 2 * len(self.cache) + 64:
+            self._lru_heap = [(u, k) for k, u
+                              in self._last_used.iteritems()]
+            heapq.heapify(self._lru_heap)
 
-        return self.cache.get(key, (0, None))[1]
+    def _evict(self):
+        while len(self.cache) > self.max_size:
+            uses, key = heapq.heappop(self._lru_heap)
+            if self._last_used.get(key) == uses:
+                self._delete(key)
+                self.stats['evictions'] += 1
 
-    def set(self, key, value, time=0, min_compress_len=0):
-        """Sets the value for a key."""
+    def _get(self, key):
+        self.stats['cmd_get'] += 1
+        item = self.cache.get(key)
+        if item is None:
+            self.stats['get_misses'] += 1
+            return None
+        self._touch(key)
+        self.stats['get_hits'] += 1
+        return item[1]
+
+    def _set(self, key, value, time, now):
+        self.stats['cmd_set'] += 1
         timeout = 0
         if time != 0:
-            timeout = timeutils.utcnow_ts() + time
+            timeout = now + time
+            heapq.heappush(self._expiry_heap, (timeout, key))
         self.cache[key] = (timeout, value)
-        return True
+        self._touch(key)
+        if self.max_size:
+            self._evict()
+
+    def get(self, key):
+        """Retrieves the value for a key or None."""
+        with self._lock:
+            self._expire(timeutils.utcnow_ts())
+            return self._get(key)
+
+    def get_multi(self, keys, key_prefix=''):
+        """Retrieves a dict of key to value for the keys that are set."""
+        with self._lock:
+            self._expire(timeutils.utcnow_ts())
+            values = {}
+            for key in keys:
+                value = self._get(key_prefix + key)
+                if value is not None:
+                    values[key] = value
+            return values
+
+    def set(self, key, value, time=0, min_compress_len=0):
+        """Sets the value for a key."""
+        with self._lock:
+            now = timeutils.utcnow_ts()
+            self._expire(now)
+            self._set(key, value, time, now)
+            return True
+
+    def set_multi(self, mapping, time=0, key_prefix='', min_compress_len=0):
+        """Sets the values for the keys of a dict.
+
+        Returns the list of keys that were not set, always empty.
+        """
+        with self._lock:
+            now = timeutils.utcnow_ts()
+            self._expire(now)
+            for key, value in mapping.iteritems():
+                self._set(key_prefix + key, value, time, now)
+            return []
 
     def add(self, key, value, time=0, min_compress_len=0):
         """Sets the value for a key if it doesn't exist."""
-        if not self.get(key) is None:
-            return False
-        return self.set(key, value, time, min_compress_len)
+        with self._lock:
+            now = timeutils.utcnow_ts()
+            self._expire(now)
+            if self._get(key) is not None:
+                return False
+            self._set(key, value, time, now)
+            return True
+
+    def delete(self, key, time=0):
+        """Deletes the value for a key."""
+        with self._lock:
+            if key in self.cache:
+                self._delete(key)
+            return 1
 
     def incr(self, key, delta=1):
         """Increments the value for a key."""
-        value = self.get(key)
-        if value is None:
-            return None
-        new_value = int(value) + delta
-        self.cache[key] = (self.cache[key][0], str(new_value))
-        return new_value
+        with self._lock:
+            self._expire(timeutils.utcnow_ts())
+            value = self._get(key)
+            if value is None:
+                return None
+            new_value = int(value) + delta
+            self.cache[key] = (self.cache[key][0], str(new_value))
+            return new_value
+
+    def get_stats(self):
+        """Returns the counters in the format of memcache.Client."""
+        with self._lock:
+            self._expire(timeutils.utcnow_ts())
+            stats = dict(self.stats, curr_items=len(self.cache))
+            return [('memorycache', stats)]
@@ -29,6 +29,8 @@ import time
 import urllib
 import uuid
 
+from eventlet import greenpool
+
 from nova import block_device
 from nova.compute import instance_types
 from nova.compute import power_state
@@ -84,6 +86,16 @@ compute_opts = [
     cfg.StrOpt('security_group_api',
                default='nova.compute.api.SecurityGroupAPI',
                help='The full class name of the security API class'),
+    cfg.IntOpt('image_prefetch_concurrency',
+               default=5,
+               help='Number of hosts that pre-fetch an image at once'),
+    cfg.IntOpt('image_prefetch_timeout',
+               default=1800,
+               help='Seconds to wait for a host to pre-fetch an image'),
+    cfg.IntOpt('image_prefetch_max_hosts',
+               default=20,
+               help='Maximum number of hosts to pre-fetch an image on in '
+                    'one request'),
 ]
 
 
@@ -1116,6 +1128,13 @@ class API(base.Base):
         return self.db.instance_get_active_by_window(context, begin, end,
                                                      project_id)
 
+    def get_active_by_window_columns(self, context, columns, begin, end=None,
+                                     project_id=None):
+        """Get columns of the instances active over a window, as a tuple
+        for each instance."""
+        return self.db.instance_get_active_by_window_columns(
+                context, columns, begin, end, project_id)
+
     #NOTE(bcwaldon): this doesn't really belong in this class
     def get_instance_type(self, context, instance_type_id):
         """Get an instance type by instance type id."""
@@ -2178,6 +2197,58 @@ class HostAPI(base.Base):
         return self.compute_rpcapi.host_maintenance_mode(context,
                 host_param=host, mode=mode, host=host)
 
+    def prefetch_image(self, context, image_id, hosts=None,
+                       aggregate_id=None):
+        """Fetch an image into the image cache of a set of compute hosts.
+
+        The hosts are given by name or as the members of an aggregate, at
+        most image_prefetch_max_hosts of them. At most
+        image_prefetch_concurrency hosts fetch the image at once. Waits for
+        every host and returns a dict per host, in order, with its status:
+        'fetched', 'unsupported' when its virt driver cannot pre-fetch
+        images, or 'failed'.
+        """
+        image_service = glance.get_default_image_service()
+        image_service.show(context, image_id)
+
+        if aggregate_id is not None:
+            self.db.aggregate_get(context, aggregate_id)
+            hosts = self.db.aggregate_host_get_all(context, aggregate_id)
+        hosts = list(hosts or [])
+        if len(hosts) > CONF.image_prefetch_max_hosts:
+            raise exception.ImagePrefetchTooManyHosts(
+                    count=len(hosts), max=CONF.image_prefetch_max_hosts)
+        for host in hosts:
+            self.db.service_get_all_compute_by_host(context, host)
+
+        return self._prefetch_image_on_hosts(context, image_id, hosts)
+
+    def _prefetch_image_on_hosts(self, context, image_id, hosts):
+        def prefetch_on_host(host):
+            try:
+                self.compute_rpcapi.prefetch_image(context, image_id, host,
+                        timeout=CONF.image_prefetch_timeout)
+            except NotImplementedError:
+                status = 'unsupported'
+            except Exception:
+                LOG.exception(_("Failed to pre-fetch image %(image_id)s on "
+                                "%(host)s") % locals())
+                status = 'failed'
+            else:
+                status = 'fetched'
+            return {'host': host, 'status': status}
+
+        pool = greenpool.GreenPool(CONF.image_prefetch_concurrency)
+        results = list(pool.imap(prefetch_on_host, hosts))
+
+        LOG.info(_("Pre-fetched image %(image_id)s on %(fetched)d of "
+                   "%(total)d hosts"),
+                 {'image_id': image_id,
+                  'fetched': len([r for r in results
+                                  if r['status'] == 'fetched']),
+                  'total': len(hosts)})
+        return results
+
 
 class AggregateAPI(base.Base):
     """Sub-set of the Compute Manager API for managing host aggregates."""
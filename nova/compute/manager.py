@@ -299,7 +299,7 @@ class ComputeVirtAPI(virtapi.VirtAPI):
 class ComputeManager(manager.SchedulerDependentManager):
     """Manages the running instances from creation to destruction."""
 
-    RPC_API_VERSION = '2.21'
+    RPC_API_VERSION = '2.22'
 
     def __init__(self, compute_driver=None, *args, **kwargs):
         """Load configuration options and connect to the hypervisor."""
@@ -412,9 +412,13 @@ class ComputeManager(manager.SchedulerDependentManager):
         # The driver doesn't support uuids listing, so we'll have
         # to brute force.
         driver_instances = self.driver.list_instances()
-        all_instances = self.conductor_api.instance_get_all(context)
-        name_map = dict([(instance['name'], instance)
-                         for instance in all_instances])
+        driver_names = set(driver_instances)
+        name_map = {}
+        filters = {'deleted': False, 'soft_deleted': True}
+        for instance in self.conductor_api.instance_iter_by_filters(context,
+                                                                    filters):
+            if instance['name'] in driver_names:
+                name_map[instance['name']] = instance
         local_instances = []
         for driver_instance in driver_instances:
             instance = name_map.get(driver_instance)
@@ -2255,6 +2259,12 @@ class ComputeManager(manager.SchedulerDependentManager):
         """Returns the result of calling "uptime" on the target host."""
         return self.driver.get_host_uptime(host)
 
+    @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
+    def prefetch_image(self, context, image_id):
+        """Fetch an image into the driver's image cache on this host."""
+        LOG.audit(_("Pre-fetching image %s"), image_id, context=context)
+        self.driver.prefetch_image(context, image_id)
+
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
     @wrap_instance_fault
     def get_diagnostics(self, context, instance):
@@ -3096,27 +3106,35 @@ class ComputeManager(manager.SchedulerDependentManager):
                 # they just don't get the info in the usage events.
                 return
 
+            if not bw_counters:
+                return
+
+            # Fetch the rows of both audit periods for every interface in
+            # one conductor call and write all of the new counters back in
+            # another, rather than two reads and a write per interface.
+            uuids = list(set(bw_ctr['uuid'] for bw_ctr in bw_counters))
+            curr_usages, prev_usages = [
+                dict(((usage['uuid'], usage['mac']), usage)
+                     for usage in usages)
+                for usages in self.conductor_api.bw_usage_get_by_periods(
+                    context, uuids, [start_time, prev_time])]
+
             refreshed = timeutils.utcnow()
+            updates = []
             for bw_ctr in bw_counters:
-                # Allow switching of greenthreads between queries.
-                greenthread.sleep(0)
+                key = (bw_ctr['uuid'], bw_ctr['mac_address'])
                 bw_in = 0
                 bw_out = 0
                 last_ctr_in = None
                 last_ctr_out = None
-                usage = self.conductor_api.bw_usage_get(context,
-                                                        bw_ctr['uuid'],
-                                                        start_time,
-                                                        bw_ctr['mac_address'])
+                usage = curr_usages.get(key)
                 if usage:
                     bw_in = usage['bw_in']
                     bw_out = usage['bw_out']
                     last_ctr_in = usage['last_ctr_in']
                     last_ctr_out = usage['last_ctr_out']
                 else:
-                    usage = self.conductor_api.bw_usage_get(
-                        context, bw_ctr['uuid'], prev_time,
-                        bw_ctr['mac_address'])
+                    usage = prev_usages.get(key)
                     if usage:
                         last_ctr_in = usage['last_ctr_in']
                         last_ctr_out = usage['last_ctr_out']
@@ -3135,15 +3153,16 @@ class ComputeManager(manager.SchedulerDependentManager):
                     else:
                         bw_out += (bw_ctr['bw_out'] - last_ctr_out)
 
-                self.conductor_api.bw_usage_update(context,
-                                                   bw_ctr['uuid'],
-                                                   bw_ctr['mac_address'],
-                                                   start_time,
-                                                   bw_in,
-                                                   bw_out,
-                                                   bw_ctr['bw_in'],
-                                                   bw_ctr['bw_out'],
-                                                   last_refreshed=refreshed)
+                updates.append({'uuid': bw_ctr['uuid'],
+                                'mac': bw_ctr['mac_address'],
+                                'bw_in': bw_in,
+                                'bw_out': bw_out,
+                                'last_ctr_in': bw_ctr['bw_in'],
+                                'last_ctr_out': bw_ctr['bw_out']})
+
+            self.conductor_api.bw_usage_update_multi(context, start_time,
+                                                     updates,
+                                                     last_refreshed=refreshed)
 
     def _get_host_volume_bdms(self, context, host):
         """Return all block device mappings on a compute host"""
@@ -3537,19 +3556,19 @@ class ComputeManager(manager.SchedulerDependentManager):
         if CONF.image_cache_manager_interval == 0:
             return
 
-        all_instances = self.conductor_api.instance_get_all(context)
-
         # Determine what other nodes use this storage
         storage_users.register_storage_use(CONF.instances_path, CONF.host)
         nodes = storage_users.get_storage_users(CONF.instances_path)
 
-        # Filter all_instances to only include those nodes which share this
+        # Filter all instances to only include those nodes which share this
         # storage path.
         # TODO(mikal): this should be further refactored so that the cache
         # cleanup code doesn't know what those instances are, just a remote
         # count, and then this logic should be pushed up the stack.
         filtered_instances = []
-        for instance in all_instances:
+        filters = {'deleted': False, 'soft_deleted': True}
+        for instance in self.conductor_api.instance_iter_by_filters(context,
+                                                                    filters):
             if instance['host'] in nodes:
                 filtered_instances.append(instance)
 
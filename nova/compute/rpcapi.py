@@ -155,6 +155,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         2.19 - Add node to run_instance
         2.20 - Add node to prep_resize
         2.21 - Add migrate_data dict param to pre_live_migration()
+        2.22 - Add prefetch_image()
     '''
 
     #
@@ -513,6 +514,11 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         topic = _compute_topic(self.topic, ctxt, host, None)
         return self.call(ctxt, self.make_msg('get_host_uptime'), topic)
 
+    def prefetch_image(self, ctxt, image_id, host, timeout=None):
+        topic = _compute_topic(self.topic, ctxt, host, None)
+        return self.call(ctxt, self.make_msg('prefetch_image',
+                image_id=image_id), topic, version='2.22', timeout=timeout)
+
     def reserve_block_device_name(self, ctxt, instance, device, volume_id):
         instance_p = jsonutils.to_primitive(instance)
         return self.call(ctxt, self.make_msg('reserve_block_device_name',
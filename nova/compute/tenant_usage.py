@@ -0,0 +1,228 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Usage of the instances of each tenant over a period of time.
+
+The instances active in the period come in as rows holding only the
+columns that usage needs (USAGE_COLUMNS, or SERVER_COLUMNS for a
+detailed report).  When NumPy is available the hours of every instance
+and the totals of every tenant are computed over arrays of those
+columns; otherwise the same sums are made one row at a time.  Either
+way, only a detailed report builds a dict per instance.
+"""
+
+import datetime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from nova.openstack.common import timeutils
+
+USAGE_COLUMNS = ('project_id', 'instance_type_id', 'launched_at',
+                 'terminated_at')
+SERVER_COLUMNS = USAGE_COLUMNS + ('uuid', 'display_name', 'vm_state')
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def is_available():
+    return numpy is not None
+
+
+def _datetime(value):
+    if value is not None and not isinstance(value, datetime.datetime):
+        value = timeutils.parse_strtime(value, TIME_FORMAT)
+    return value
+
+
+def hours_for(launched_at, terminated_at, period_start, period_stop):
+    """Return the hours an instance was running during the period."""
+    launched_at = _datetime(launched_at)
+    terminated_at = _datetime(terminated_at)
+
+    if terminated_at and terminated_at < period_start:
+        return 0
+    # nothing if it started after the usage report ended
+    if launched_at and launched_at > period_stop:
+        return 0
+    if launched_at:
+        # if instance launched after period_started, don't charge for first
+        start = max(launched_at, period_start)
+        if terminated_at:
+            # if instance stopped before period_stop, don't charge after
+            stop = min(period_stop, terminated_at)
+        else:
+            # instance is still running, so charge them up to current time
+            stop = period_stop
+        dt = stop - start
+        seconds = (dt.days * 3600 * 24 + dt.seconds +
+                   dt.microseconds / 100000.0)
+
+        return seconds / 3600.0
+    else:
+        # instance hasn't launched, so no charge
+        return 0
+
+
+def _hours_array(launched, terminated, period_start, period_stop):
+    """The hours_for of every instance, as an array."""
+    launched = [_datetime(value) for value in launched]
+    terminated = [_datetime(value) for value in terminated]
+    launched_known = numpy.array([value is not None for value in launched])
+    terminated_known = numpy.array([value is not None
+                                    for value in terminated])
+
+    # Instances still running are charged up to the end of the period, and
+    # those not launched are not charged at all.
+    start = numpy.array([value or period_start for value in launched],
+                        dtype='datetime64[us]')
+    stop = numpy.array([value or period_stop for value in terminated],
+                       dtype='datetime64[us]')
+    period_start = numpy.datetime64(period_start, 'us')
+    period_stop = numpy.datetime64(period_stop, 'us')
+
+    charged = (launched_known & (start <= period_stop) &
+               ~(terminated_known & (stop < period_start)))
+    start = numpy.maximum(start, period_start)
+    stop = numpy.minimum(stop, period_stop)
+
+    # Whole seconds and microseconds as hours_for adds them up
+    microseconds = (stop - start).astype('int64')
+    seconds = microseconds // 1000000 + (microseconds % 1000000) / 100000.0
+    return numpy.where(charged, seconds / 3600.0, 0.0)
+
+
+def _tenant_totals_array(rows, flavors, period_start, period_stop):
+    """_tenant_totals, computed over arrays."""
+    project_ids, type_ids, launched, terminated = zip(*rows)[:4]
+    hours = _hours_array(launched, terminated, period_start, period_stop)
+
+    tenant_ids, tenant_index = numpy.unique(project_ids, return_inverse=True)
+    type_ids, type_index = numpy.unique(type_ids, return_inverse=True)
+
+    totals = {'total_hours': hours}
+    for key, size in (('total_vcpus_usage', lambda f: f['vcpus']),
+                      ('total_memory_mb_usage', lambda f: f['memory_mb']),
+                      ('total_local_gb_usage',
+                       lambda f: f['root_gb'] + f['ephemeral_gb'])):
+        sizes = numpy.array([size(flavors[type_id])
+                             for type_id in type_ids.tolist()], dtype=float)
+        totals[key] = hours * sizes[type_index]
+    for key, values in totals.items():
+        totals[key] = numpy.bincount(tenant_index, weights=values,
+                                     minlength=len(tenant_ids))
+
+    tenant_totals = {}
+    for index, tenant_id in enumerate(tenant_ids.tolist()):
+        tenant_totals[tenant_id] = dict((key, float(values[index]))
+                                        for key, values in totals.items())
+    return [float(value) for value in hours], tenant_totals
+
+
+def _tenant_totals(rows, flavors, period_start, period_stop):
+    """Return the hours of each row and the totals of each tenant."""
+    all_hours = []
+    tenant_totals = {}
+    for row in rows:
+        project_id, type_id, launched_at, terminated_at = row[:4]
+        hours = hours_for(launched_at, terminated_at,
+                          period_start, period_stop)
+        all_hours.append(hours)
+
+        flavor = flavors[type_id]
+        totals = tenant_totals.setdefault(project_id, {
+                'total_hours': 0,
+                'total_vcpus_usage': 0,
+                'total_memory_mb_usage': 0,
+                'total_local_gb_usage': 0})
+        totals['total_hours'] += hours
+        totals['total_vcpus_usage'] += flavor['vcpus'] * hours
+        totals['total_memory_mb_usage'] += flavor['memory_mb'] * hours
+        totals['total_local_gb_usage'] += (flavor['root_gb'] +
+                                           flavor['ephemeral_gb']) * hours
+    return all_hours, tenant_totals
+
+
+def _server_usage(row, hours, flavor):
+    (project_id, _type_id, launched_at, terminated_at,
+     uuid, name, vm_state) = row
+    info = {'instance_id': uuid,
+            'name': name,
+            'hours': hours,
+            'memory_mb': flavor['memory_mb'],
+            'local_gb': flavor['root_gb'] + flavor['ephemeral_gb'],
+            'vcpus': flavor['vcpus'],
+            'tenant_id': project_id,
+            'flavor': flavor['name'],
+            'started_at': launched_at,
+            'ended_at': terminated_at}
+
+    if terminated_at:
+        info['state'] = 'terminated'
+    else:
+        info['state'] = vm_state
+
+    if launched_at:
+        delta = ((_datetime(terminated_at) or timeutils.utcnow()) -
+                 _datetime(launched_at))
+        info['uptime'] = delta.days * 24 * 3600 + delta.seconds
+    else:
+        # never launched, so never up
+        info['uptime'] = 0
+    return info
+
+
+def tenant_usages(rows, flavors, period_start, period_stop, detailed=False):
+    """Return the usage of each tenant with instances in rows.
+
+    :param rows: tuples of SERVER_COLUMNS if detailed, otherwise of
+                 USAGE_COLUMNS, for the instances active in the period
+    :param flavors: instance types by id; instances of any other type
+                    are not billed
+    :param detailed: whether to list the usage of each instance in
+                     'server_usages'
+    """
+    rows = [row for row in rows if row[1] in flavors]
+    if not rows:
+        return []
+
+    if numpy is not None:
+        hours, tenant_totals = _tenant_totals_array(rows, flavors,
+                                                    period_start, period_stop)
+    else:
+        hours, tenant_totals = _tenant_totals(rows, flavors,
+                                              period_start, period_stop)
+
+    usages = {}
+    for tenant_id, totals in tenant_totals.iteritems():
+        usage = {'tenant_id': tenant_id,
+                 'start': period_start,
+                 'stop': period_stop}
+        usage.update(totals)
+        if detailed:
+            usage['server_usages'] = []
+        usages[tenant_id] = usage
+
+    if detailed:
+        for row, row_hours in zip(rows, hours):
+            usages[row[0]]['server_usages'].append(
+                    _server_usage(row, row_hours, flavors[row[1]]))
+
+    return [usages[tenant_id] for tenant_id in sorted(usages)]
@@ -38,6 +38,25 @@ conductor_group = cfg.OptGroup(name='conductor',
 CONF = cfg.CONF
 CONF.register_group(conductor_group)
 CONF.register_opts(conductor_opts, conductor_group)
+CONF.import_opt('instance_iter_page_size', 'nova.db.api')
+
+
+def _iter_instances(get_page, context, filters, sort_key, sort_dir):
+    """Yield instances from get_page, instance_iter_page_size at a time.
+
+    get_page is an instance_get_all_by_filters, called for each page with
+    the last instance of the previous page as the marker.
+    """
+    page_size = CONF.instance_iter_page_size
+    marker = None
+    while True:
+        instances = get_page(context, filters, sort_key, sort_dir,
+                             limit=page_size, marker=marker)
+        for instance in instances:
+            yield instance
+        if len(instances) < page_size:
+            return
+        marker = instances[-1]['uuid']
 
 
 class ExceptionHelper(object):
@@ -92,11 +111,19 @@ class LocalAPI(object):
 
     def instance_get_all_by_filters(self, context, filters,
                                     sort_key='created_at',
-                                    sort_dir='desc'):
+                                    sort_dir='desc', limit=None,
+                                    marker=None):
         return self._manager.instance_get_all_by_filters(context,
                                                          filters,
                                                          sort_key,
-                                                         sort_dir)
+                                                         sort_dir,
+                                                         limit=limit,
+                                                         marker=marker)
+
+    def instance_iter_by_filters(self, context, filters, sort_key='id',
+                                 sort_dir='asc'):
+        return _iter_instances(self.instance_get_all_by_filters, context,
+                               filters, sort_key, sort_dir)
 
     def instance_get_all_hung_in_rebooting(self, context, timeout):
         return self._manager.instance_get_all_hung_in_rebooting(context,
@@ -159,6 +186,15 @@ class LocalAPI(object):
                                              last_ctr_in, last_ctr_out,
                                              last_refreshed)
 
+    def bw_usage_get_by_periods(self, context, uuids, start_periods):
+        return self._manager.bw_usage_get_by_periods(context, uuids,
+                                                     start_periods)
+
+    def bw_usage_update_multi(self, context, start_period, usages,
+                              last_refreshed=None):
+        return self._manager.bw_usage_update_multi(context, start_period,
+                                                   usages, last_refreshed)
+
     def get_backdoor_port(self, context, host):
         raise exc.InvalidRequest
 
@@ -270,11 +306,19 @@ class API(object):
 
     def instance_get_all_by_filters(self, context, filters,
                                     sort_key='created_at',
-                                    sort_dir='desc'):
+                                    sort_dir='desc', limit=None,
+                                    marker=None):
         return self.conductor_rpcapi.instance_get_all_by_filters(context,
                                                                  filters,
                                                                  sort_key,
-                                                                 sort_dir)
+                                                                 sort_dir,
+                                                                 limit=limit,
+                                                                 marker=marker)
+
+    def instance_iter_by_filters(self, context, filters, sort_key='id',
+                                 sort_dir='asc'):
+        return _iter_instances(self.instance_get_all_by_filters, context,
+                               filters, sort_key, sort_dir)
 
     def instance_get_all_hung_in_rebooting(self, context, timeout):
         return self.conductor_rpcapi.instance_get_all_hung_in_rebooting(
@@ -344,6 +388,17 @@ class API(object):
             bw_in, bw_out, last_ctr_in, last_ctr_out,
             last_refreshed)
 
+    def bw_usage_get_by_periods(self, context, uuids, start_periods):
+        return self.conductor_rpcapi.bw_usage_get_by_periods(context, uuids,
+                                                             start_periods)
+
+    def bw_usage_update_multi(self, context, start_period, usages,
+                              last_refreshed=None):
+        return self.conductor_rpcapi.bw_usage_update_multi(context,
+                                                           start_period,
+                                                           usages,
+                                                           last_refreshed)
+
     #NOTE(mtreinish): This doesn't work on multiple conductors without any
     # topic calculation in conductor_rpcapi. So the host param isn't used
     # currently.
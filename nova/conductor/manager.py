@@ -43,7 +43,7 @@ datetime_fields = ['launched_at', 'terminated_at']
 class ConductorManager(manager.SchedulerDependentManager):
     """Mission: TBD"""
 
-    RPC_API_VERSION = '1.24'
+    RPC_API_VERSION = '1.26'
 
     def __init__(self, *args, **kwargs):
         super(ConductorManager, self).__init__(service_name='conductor',
@@ -152,6 +152,16 @@ class ConductorManager(manager.SchedulerDependentManager):
         usage = self.db.bw_usage_get(context, uuid, start_period, mac)
         return jsonutils.to_primitive(usage)
 
+    def bw_usage_get_by_periods(self, context, uuids, start_periods):
+        result = [self.db.bw_usage_get_by_uuids(context, uuids, start_period)
+                  for start_period in start_periods]
+        return jsonutils.to_primitive(result)
+
+    def bw_usage_update_multi(self, context, start_period, usages,
+                              last_refreshed=None):
+        self.db.bw_usage_update_multi(context, start_period, usages,
+                                      last_refreshed)
+
     def get_backdoor_port(self, context):
         return self.backdoor_port
 
@@ -206,9 +216,11 @@ class ConductorManager(manager.SchedulerDependentManager):
                                       " invocation"))
 
     def instance_get_all_by_filters(self, context, filters, sort_key,
-                                    sort_dir):
+                                    sort_dir, limit=None, marker=None):
         result = self.db.instance_get_all_by_filters(context, filters,
-                                                     sort_key, sort_dir)
+                                                     sort_key, sort_dir,
+                                                     limit=limit,
+                                                     marker=marker)
         return jsonutils.to_primitive(result)
 
     def instance_get_all_hung_in_rebooting(self, context, timeout):
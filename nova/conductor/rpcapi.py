@@ -57,6 +57,8 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     1.23 - Added instance_get_all
            Un-Deprecate instance_get_all_by_host
     1.24 - Added instance_get
+    1.25 - Added bw_usage_get_by_periods and bw_usage_update_multi
+    1.26 - Added limit and marker to instance_get_all_by_filters
     """
 
     BASE_RPC_API_VERSION = '1.0'
@@ -151,6 +153,18 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                             last_refreshed=last_refreshed)
         return self.call(context, msg, version='1.5')
 
+    def bw_usage_get_by_periods(self, context, uuids, start_periods):
+        msg = self.make_msg('bw_usage_get_by_periods', uuids=uuids,
+                            start_periods=start_periods)
+        return self.call(context, msg, version='1.25')
+
+    def bw_usage_update_multi(self, context, start_period, usages,
+                              last_refreshed=None):
+        msg = self.make_msg('bw_usage_update_multi',
+                            start_period=start_period, usages=usages,
+                            last_refreshed=last_refreshed)
+        return self.call(context, msg, version='1.25')
+
     def get_backdoor_port(self, context):
         msg = self.make_msg('get_backdoor_port')
         return self.call(context, msg, version='1.6')
@@ -201,11 +215,11 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         return self.call(context, msg, version='1.14')
 
     def instance_get_all_by_filters(self, context, filters, sort_key,
-                                    sort_dir):
+                                    sort_dir, limit=None, marker=None):
         msg = self.make_msg('instance_get_all_by_filters',
                             filters=filters, sort_key=sort_key,
-                            sort_dir=sort_dir)
-        return self.call(context, msg, version='1.15')
+                            sort_dir=sort_dir, limit=limit, marker=marker)
+        return self.call(context, msg, version='1.26')
 
     def instance_get_all_hung_in_rebooting(self, context, timeout):
         msg = self.make_msg('instance_get_all_hung_in_rebooting',
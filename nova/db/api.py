@@ -63,6 +63,10 @@ db_opts = [
     cfg.StrOpt('snapshot_name_template',
                default='snapshot-%s',
                help='Template string to be used to generate snapshot names'),
+    cfg.IntOpt('instance_iter_page_size',
+               default=1000,
+               help='Number of instances read per query when iterating '
+                    'over all instances that match a set of filters'),
     ]
 
 CONF = cfg.CONF
@@ -188,6 +192,11 @@ def compute_node_get_all(context):
     return IMPL.compute_node_get_all(context)
 
 
+def compute_node_get_all_updated_since(context, updated_since):
+    """Get computeNodes created, updated or deleted since a timestamp."""
+    return IMPL.compute_node_get_all_updated_since(context, updated_since)
+
+
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     """Get computeNodes given a hypervisor hostname match string."""
     return IMPL.compute_node_search_by_hypervisor(context, hypervisor_match)
@@ -597,11 +606,30 @@ def instance_get_all(context, columns_to_join=None):
 
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
-                                sort_dir='desc', limit=None, marker=None):
-    """Get all instances that match all filters."""
+                                sort_dir='desc', limit=None, marker=None,
+                                columns_to_join=None):
+    """Get all instances that match all filters.
+
+    columns_to_join names the relations of the instances to load; by
+    default they are all loaded.
+    """
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
                                             sort_dir, limit=limit,
-                                            marker=marker)
+                                            marker=marker,
+                                            columns_to_join=columns_to_join)
+
+
+def instance_iter_by_filters(context, filters, sort_key='id', sort_dir='asc',
+                             page_size=None, columns_to_join=None):
+    """Iterate over all instances that match all filters.
+
+    Instances are read page_size at a time, which defaults to
+    instance_iter_page_size.
+    """
+    return IMPL.instance_iter_by_filters(context, filters, sort_key=sort_key,
+                                         sort_dir=sort_dir,
+                                         page_size=page_size,
+                                         columns_to_join=columns_to_join)
 
 
 def instance_get_active_by_window(context, begin, end=None, project_id=None,
@@ -615,6 +643,16 @@ def instance_get_active_by_window(context, begin, end=None, project_id=None,
                                               project_id, host)
 
 
+def instance_get_active_by_window_columns(context, columns, begin, end=None,
+                                          project_id=None):
+    """Get columns of the instances active during a certain time window.
+
+    Returns a tuple of the values of columns for each instance.
+    """
+    return IMPL.instance_get_active_by_window_columns(context, columns, begin,
+                                                      end, project_id)
+
+
 def instance_get_active_by_window_joined(context, begin, end=None,
                                          project_id=None, host=None):
     """Get instances and joins active during a certain time window.
@@ -631,9 +669,10 @@ def instance_get_all_by_project(context, project_id):
     return IMPL.instance_get_all_by_project(context, project_id)
 
 
-def instance_get_all_by_host(context, host):
+def instance_get_all_by_host(context, host, columns_to_join=None):
     """Get all instances belonging to a host."""
-    return IMPL.instance_get_all_by_host(context, host)
+    return IMPL.instance_get_all_by_host(context, host,
+                                         columns_to_join=columns_to_join)
 
 
 def instance_get_all_by_host_and_node(context, host, node):
@@ -646,6 +685,14 @@ def instance_get_all_by_host_and_not_type(context, host, type_id=None):
     return IMPL.instance_get_all_by_host_and_not_type(context, host, type_id)
 
 
+def instance_type_ids_get_all_by_host(context):
+    """Get the instance type ids in use on each host.
+
+    Returns a dictionary of host name to a set of instance type ids.
+    """
+    return IMPL.instance_type_ids_get_all_by_host(context)
+
+
 def instance_get_all_by_reservation(context, reservation_id):
     """Get all instances belonging to a reservation."""
     return IMPL.instance_get_all_by_reservation(context, reservation_id)
@@ -1459,6 +1506,29 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
     return rv
 
 
+def bw_usage_update_multi(context, start_period, usages, last_refreshed=None,
+                          update_cells=True):
+    """Update cached bandwidth usage for many instance networks in one go.
+
+    usages is a list of dicts with uuid, mac, bw_in, bw_out, last_ctr_in
+    and last_ctr_out keys.  Creates new records if needed.
+    """
+    rv = IMPL.bw_usage_update_multi(context, start_period, usages,
+                                    last_refreshed=last_refreshed)
+    if update_cells:
+        try:
+            cells_api = cells_rpcapi.CellsAPI()
+            for usage in usages:
+                cells_api.bw_usage_update_at_top(context,
+                        usage['uuid'], usage['mac'], start_period,
+                        usage['bw_in'], usage['bw_out'],
+                        usage['last_ctr_in'], usage['last_ctr_out'],
+                        last_refreshed)
+        except Exception:
+            LOG.exception(_("Failed to notify cells of bw_usage update"))
+    return rv
+
+
 ####################
 
 
@@ -1543,6 +1613,14 @@ def aggregate_metadata_get_by_host(context, host, key=None):
     return IMPL.aggregate_metadata_get_by_host(context, host, key)
 
 
+def aggregate_metadata_get_all_by_host(context):
+    """Get the aggregate metadata of every host.
+
+    Returns a dictionary of host name to the dictionary that
+    aggregate_metadata_get_by_host() returns for that host."""
+    return IMPL.aggregate_metadata_get_all_by_host(context)
+
+
 def aggregate_host_get_by_metadata_key(context, key):
     """Get hosts with a specific metadata key metadata for all aggregates.
 
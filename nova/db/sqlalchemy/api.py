@@ -28,6 +28,7 @@ import uuid
 from sqlalchemy import and_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import or_
+from sqlalchemy.orm import attributes
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
 from sqlalchemy.sql.expression import asc
@@ -58,6 +59,7 @@ db_opts = [
 CONF = cfg.CONF
 CONF.register_opts(db_opts)
 CONF.import_opt('compute_topic', 'nova.compute.rpcapi')
+CONF.import_opt('instance_iter_page_size', 'nova.db.api')
 CONF.import_opt('sql_connection', 'nova.db.sqlalchemy.session')
 
 LOG = logging.getLogger(__name__)
@@ -471,6 +473,23 @@ def compute_node_get_all(context):
             all()
 
 
+@require_admin_context
+def compute_node_get_all_updated_since(context, updated_since):
+    """Return compute nodes created, updated or deleted since a timestamp.
+
+    Only the compute node records are looked at: service heartbeats do
+    not make a compute node count as updated.
+    """
+    return model_query(context, models.ComputeNode, read_deleted="yes").\
+            options(joinedload('service')).\
+            options(joinedload('stats')).\
+            filter(or_(models.ComputeNode.created_at >= updated_since,
+                       models.ComputeNode.updated_at >= updated_since,
+                       models.ComputeNode.deleted_at >= updated_since)).\
+            order_by(models.ComputeNode.id).\
+            all()
+
+
 @require_admin_context
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     field = models.ComputeNode.hypervisor_hostname
@@ -514,10 +533,13 @@ def _update_stats(context, new_stats, compute_id, session, prune_stats=False):
         statmap[key] = stat
 
     stats = []
+    changed = False
     for k, v in new_stats.iteritems():
         old_stat = statmap.pop(k, None)
         if old_stat:
             # update existing value:
+            if old_stat['value'] != str(v):
+                changed = True
             old_stat.update({'value': v})
             stats.append(old_stat)
         else:
@@ -527,17 +549,21 @@ def _update_stats(context, new_stats, compute_id, session, prune_stats=False):
             stat['key'] = k
             stat['value'] = v
             stats.append(stat)
+            changed = True
 
-    if prune_stats:
+    if prune_stats and statmap:
         # prune un-touched old stats:
         for stat in statmap.values():
             session.add(stat)
             stat.update({'deleted': True})
+        changed = True
 
     # add new and updated stats
     for stat in stats:
         session.add(stat)
 
+    return changed
+
 
 @require_admin_context
 def compute_node_update(context, compute_id, values, prune_stats=False):
@@ -546,7 +572,11 @@ def compute_node_update(context, compute_id, values, prune_stats=False):
 
     session = get_session()
     with session.begin(subtransactions=True):
-        _update_stats(context, stats, compute_id, session, prune_stats)
+        if _update_stats(context, stats, compute_id, session, prune_stats):
+            # NOTE: Stats live in their own table, so make sure a stats-only
+            # change still bumps updated_at.  The scheduler relies on it to
+            # know which cached host states are stale.
+            values['updated_at'] = timeutils.utcnow()
         compute_ref = _compute_node_get(context, compute_id, session=session)
         compute_ref.update(values)
     return compute_ref
@@ -1372,12 +1402,14 @@ def _validate_unique_server_name(context, session, name):
         search_opts['project_id'] = context.project_id
         instance_list = instance_get_all_by_filters(context, search_opts,
                                                     'created_at', 'desc',
-                                                    session=session)
+                                                    session=session,
+                                                    columns_to_join=[])
     elif CONF.osapi_compute_unique_server_name_scope == 'global':
         instance_list = instance_get_all_by_filters(context.elevated(),
                                                     search_opts,
                                                     'created_at', 'desc',
-                                                    session=session)
+                                                    session=session,
+                                                    columns_to_join=[])
     else:
         msg = _('Unknown osapi_compute_unique_server_name_scope value: %s'
                 ' Flag must be empty, "global" or'
@@ -1545,7 +1577,8 @@ def instance_get_all(context, columns_to_join=None):
 
 @require_context
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
-                                limit=None, marker=None, session=None):
+                                limit=None, marker=None, session=None,
+                                columns_to_join=None):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
     otherwise"""
@@ -1555,14 +1588,86 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     if not session:
         session = get_session()
 
-    query_prefix = session.query(models.Instance).\
-            options(joinedload('info_cache')).\
-            options(joinedload('security_groups')).\
-            options(joinedload('system_metadata')).\
-            options(joinedload('metadata')).\
-            options(joinedload('instance_type')).\
+    if columns_to_join is None:
+        columns_to_join = _INSTANCE_DEFAULT_JOINS
+
+    query_prefix = _instance_get_all_by_filters_query(context, session,
+                                                      filters,
+                                                      columns_to_join).\
             order_by(sort_fn[sort_dir](getattr(models.Instance, sort_key)))
 
+    # paginate query
+    sort_keys = [sort_key, 'created_at', 'id']
+    if marker is not None:
+        marker = _instance_marker_get(context, session, marker, sort_keys)
+    query_prefix = paginate_query(query_prefix, models.Instance, limit,
+                                  sort_keys, marker=marker, sort_dir=sort_dir)
+
+    instances = query_prefix.all()
+    _instance_load_collections(session, instances, columns_to_join)
+    return instances
+
+
+@require_context
+def instance_iter_by_filters(context, filters, sort_key='id', sort_dir='asc',
+                             page_size=None, columns_to_join=None):
+    """Yield the instances that match all filters, a page at a time.
+
+    Filters are applied as by instance_get_all_by_filters.  Each page is
+    a query of its own that starts after the sort_key and id of the last
+    instance of the previous page, so that memory use is bounded by the
+    page size however many instances match.  sort_key must not be
+    nullable; the default of id follows the primary key index.
+    """
+    if page_size is None:
+        page_size = CONF.instance_iter_page_size
+    if columns_to_join is None:
+        columns_to_join = _INSTANCE_DEFAULT_JOINS
+
+    sort_keys = [sort_key]
+    if sort_key != 'id':
+        sort_keys.append('id')
+
+    marker = None
+    while True:
+        session = get_session()
+        query = _instance_get_all_by_filters_query(context, session, filters,
+                                                   columns_to_join)
+        query = paginate_query(query, models.Instance, page_size, sort_keys,
+                               marker=marker, sort_dir=sort_dir)
+        instances = query.all()
+        _instance_load_collections(session, instances, columns_to_join)
+        for instance in instances:
+            yield instance
+        if len(instances) < page_size:
+            return
+        marker = instances[-1]
+
+
+def _instance_marker_get(context, session, uuid, sort_keys):
+    """Return the values of sort_keys for the marker instance.
+
+    Only the sort key columns are read, which is all paginate_query needs
+    of the marker.  The marker may be a deleted instance, since those are
+    listed too unless filtered out.
+    """
+    columns = [getattr(models.Instance, key) for key in set(sort_keys)]
+    marker = model_query(context, models.Instance, session=session,
+                         read_deleted='yes', project_only=True).\
+            filter_by(uuid=uuid).\
+            with_entities(*columns).\
+            first()
+    if not marker:
+        raise exception.MarkerNotFound(uuid)
+    return marker
+
+
+def _instance_get_all_by_filters_query(context, session, filters,
+                                       columns_to_join):
+    """Return a query for the instances that match all filters."""
+    query_prefix = _instance_join_query(session.query(models.Instance),
+                                        columns_to_join)
+
     # Make a copy of the filters dictionary to use going forward, as we'll
     # be modifying it and we shouldn't affect the caller's use of it.
     filters = filters.copy()
@@ -1580,9 +1685,12 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                           models.Instance.vm_state == vm_states.SOFT_DELETED)
             query_prefix = query_prefix.filter(deleted)
         else:
-            query_prefix = query_prefix.\
-                    filter_by(deleted=False).\
-                    filter(models.Instance.vm_state != vm_states.SOFT_DELETED)
+            query_prefix = query_prefix.filter_by(deleted=False)
+            # Soft deleted instances are still on their hosts, which may
+            # need to include them.
+            if not filters.pop('soft_deleted', False):
+                query_prefix = query_prefix.filter(
+                        models.Instance.vm_state != vm_states.SOFT_DELETED)
 
     if not context.is_admin:
         # If we're not admin context, add appropriate filter..
@@ -1601,27 +1709,88 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     query_prefix = exact_filter(query_prefix, models.Instance,
                                 filters, exact_match_filter_names)
 
-    query_prefix = regex_filter(query_prefix, models.Instance, filters)
+    return regex_filter(query_prefix, models.Instance, filters)
 
-    # paginate query
-    if marker is not None:
-        try:
-            marker = _instance_get_by_uuid(context, marker, session=session)
-        except exception.InstanceNotFound:
-            raise exception.MarkerNotFound(marker)
-    query_prefix = paginate_query(query_prefix, models.Instance, limit,
-                           [sort_key, 'created_at', 'id'],
-                           marker=marker,
-                           sort_dir=sort_dir)
 
-    instances = query_prefix.all()
-    return instances
+# Characters with a special meaning in regular expressions
+_REGEX_SPECIAL = frozenset('.^$*+?{}[]\\|()')
+
+# Escape character for the LIKE patterns made from regex filters; not a
+# backslash, which MySQL would read as an escape in the ESCAPE clause itself
+_LIKE_ESCAPE = '!'
+
+
+def _regex_literal(pattern):
+    """Return the string a regex of only literal characters matches.
+
+    Returns None if the pattern has any special characters other than
+    escaped punctuation.
+    """
+    chars = []
+    escaped = False
+    for char in pattern:
+        if escaped:
+            if char.isalnum():
+                # A class such as \d or a back reference
+                return None
+            chars.append(char)
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char in _REGEX_SPECIAL:
+            return None
+        else:
+            chars.append(char)
+    if escaped:
+        return None
+    return ''.join(chars)
+
+
+def plan_regex_filter(pattern):
+    """Return how the database should match a regex filter.
+
+    Returns a tuple of the plan and its operand.  A pattern of literal
+    characters anchored at both ends is an 'equal' match of the literal.
+    A literal anchored at one end or neither is a 'like' match, which for
+    patterns anchored at the start is a prefix search an index can serve.
+    Any other pattern is matched with the database's 'regexp' operator.
+    """
+    body = pattern
+    anchored_start = body.startswith('^')
+    if anchored_start:
+        body = body[1:]
+    if body.startswith('.*'):
+        body = body[2:]
+        anchored_start = False
+
+    anchored_end = False
+    if body.endswith('$') and _regex_literal(body[:-1]) is not None:
+        body = body[:-1]
+        anchored_end = True
+    elif body.endswith('.*'):
+        body = body[:-2]
+
+    literal = _regex_literal(body)
+    if literal is None:
+        return 'regexp', pattern
+    if anchored_start and anchored_end:
+        return 'equal', literal
+
+    for char in (_LIKE_ESCAPE, '%', '_'):
+        literal = literal.replace(char, _LIKE_ESCAPE + char)
+    if not anchored_start:
+        literal = '%' + literal
+    if not anchored_end:
+        literal = literal + '%'
+    return 'like', literal
 
 
 def regex_filter(query, model, filters):
     """Applies regular expression filtering to a query.
 
-    Returns the updated query.
+    Returns the updated query.  Filters that are literals, possibly
+    anchored, are matched with = or LIKE rather than a regex; see
+    plan_regex_filter.
 
     :param query: query to apply filters to
     :param model: model object the query applies to
@@ -1643,8 +1812,23 @@ def regex_filter(query, model, filters):
             continue
         if 'property' == type(column_attr).__name__:
             continue
-        query = query.filter(column_attr.op(db_regexp_op)(
-                                    str(filters[filter_name])))
+        value = str(filters[filter_name])
+        if db_regexp_op == 'LIKE':
+            # Without regex support the value is used as a LIKE pattern
+            plan, operand = 'like', value
+        else:
+            plan, operand = plan_regex_filter(value)
+        LOG.debug(_("Matching %(filter_name)s against %(value)r with "
+                    "%(plan)s %(operand)r"), locals())
+        if plan == 'equal':
+            query = query.filter(column_attr == operand)
+        elif plan == 'like' and db_regexp_op == 'LIKE':
+            query = query.filter(column_attr.op('LIKE')(operand))
+        elif plan == 'like':
+            query = query.filter(column_attr.like(operand,
+                                                  escape=_LIKE_ESCAPE))
+        else:
+            query = query.filter(column_attr.op(db_regexp_op)(operand))
     return query
 
 
@@ -1667,6 +1851,25 @@ def instance_get_active_by_window(context, begin, end=None,
     return query.all()
 
 
+@require_context
+def instance_get_active_by_window_columns(context, columns, begin, end=None,
+                                          project_id=None):
+    """Return the values of columns of the instances that were active
+    during window, as a tuple for each instance."""
+    session = get_session()
+    query = session.query(*[getattr(models.Instance, column)
+                            for column in columns])
+
+    query = query.filter(or_(models.Instance.terminated_at == None,
+                             models.Instance.terminated_at > begin))
+    if end:
+        query = query.filter(models.Instance.launched_at < end)
+    if project_id:
+        query = query.filter(models.Instance.project_id == project_id)
+
+    return query.all()
+
+
 @require_admin_context
 def instance_get_active_by_window_joined(context, begin, end=None,
                                          project_id=None, host=None):
@@ -1690,6 +1893,85 @@ def instance_get_active_by_window_joined(context, begin, end=None,
     return query.all()
 
 
+# Relations of an instance that are loaded when the caller does not say
+_INSTANCE_DEFAULT_JOINS = ['info_cache', 'security_groups', 'system_metadata',
+                           'metadata', 'instance_type']
+
+# Default relations for the queries built on _instance_get_all_query
+_INSTANCE_GET_ALL_JOINS = ['info_cache', 'security_groups', 'metadata',
+                           'instance_type']
+
+# Relations with one row per instance, which are joined into the query
+_INSTANCE_SCALAR_JOINS = ['info_cache', 'instance_type']
+
+# Number of instances whose collections are loaded per query
+_INSTANCE_COLLECTION_BATCH = 500
+
+
+def _instance_join_query(query, columns_to_join):
+    """Join the single-row relations of instances named in columns_to_join.
+
+    Collections are left to _instance_load_collections, since joining them
+    returns a row for every combination of their items.
+    """
+    for column in columns_to_join:
+        if column in _INSTANCE_SCALAR_JOINS:
+            query = query.options(joinedload(column))
+    return query
+
+
+def _instance_collection_rows(session, column, uuids):
+    """Return (instance_uuid, item) for the items of a collection."""
+    if column == 'security_groups':
+        assoc = models.SecurityGroupInstanceAssociation
+        return session.query(assoc.instance_uuid, models.SecurityGroup).\
+                join(models.SecurityGroup,
+                     models.SecurityGroup.id == assoc.security_group_id).\
+                filter(assoc.instance_uuid.in_(uuids)).\
+                filter(assoc.deleted == False).\
+                filter(models.SecurityGroup.deleted == False).\
+                all()
+
+    model = {'metadata': models.InstanceMetadata,
+             'system_metadata': models.InstanceSystemMetadata}[column]
+    rows = session.query(model).\
+            filter(model.instance_uuid.in_(uuids)).\
+            filter(model.deleted == False).\
+            all()
+    return [(row.instance_uuid, row) for row in rows]
+
+
+def _instance_load_collections(session, instances, columns_to_join):
+    """Load the collections of instances named in columns_to_join.
+
+    Each collection takes a query per _INSTANCE_COLLECTION_BATCH instances,
+    selecting its items by instance uuid, rather than a join that repeats
+    every instance row for each of its items.
+    """
+    columns = [c for c in columns_to_join
+               if c not in _INSTANCE_SCALAR_JOINS]
+    if not columns or not instances:
+        return
+
+    # Deleted instances have no security groups, as with the join condition
+    # of the relationship itself
+    live_uuids = [i['uuid'] for i in instances if not i['deleted']]
+    for column in columns:
+        uuids = [i['uuid'] for i in instances]
+        if column == 'security_groups':
+            uuids = live_uuids
+        items = collections.defaultdict(list)
+        for start in xrange(0, len(uuids), _INSTANCE_COLLECTION_BATCH):
+            batch = uuids[start:start + _INSTANCE_COLLECTION_BATCH]
+            for instance_uuid, item in _instance_collection_rows(session,
+                                                                 column,
+                                                                 batch):
+                items[instance_uuid].append(item)
+        for instance in instances:
+            attributes.set_committed_value(instance, column,
+                                           items.get(instance['uuid'], []))
+
+
 @require_admin_context
 def _instance_get_all_query(context, project_only=False):
     return model_query(context, models.Instance, project_only=project_only).\
@@ -1700,8 +1982,15 @@ def _instance_get_all_query(context, project_only=False):
 
 
 @require_admin_context
-def instance_get_all_by_host(context, host):
-    return _instance_get_all_query(context).filter_by(host=host).all()
+def instance_get_all_by_host(context, host, columns_to_join=None):
+    if columns_to_join is None:
+        columns_to_join = _INSTANCE_GET_ALL_JOINS
+    session = get_session()
+    instances = model_query(context, models.Instance, session=session)
+    instances = _instance_join_query(instances, columns_to_join).\
+            filter_by(host=host).all()
+    _instance_load_collections(session, instances, columns_to_join)
+    return instances
 
 
 @require_admin_context
@@ -1716,6 +2005,23 @@ def instance_get_all_by_host_and_not_type(context, host, type_id=None):
                    filter(models.Instance.instance_type_id != type_id).all()
 
 
+@require_admin_context
+def instance_type_ids_get_all_by_host(context):
+    """Return a dict of host name to the set of instance type ids of the
+    instances on that host.
+    """
+    rows = model_query(context, models.Instance.host,
+                       models.Instance.instance_type_id).\
+                   filter(models.Instance.host != None).\
+                   filter(models.Instance.instance_type_id != None).\
+                   distinct().\
+                   all()
+    type_ids = collections.defaultdict(set)
+    for host, instance_type_id in rows:
+        type_ids[host].add(instance_type_id)
+    return dict(type_ids)
+
+
 @require_context
 def instance_get_all_by_project(context, project_id):
     authorize_project_context(context, project_id)
@@ -4053,6 +4359,42 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
         bwusage.save(session=session)
 
 
+@require_context
+def bw_usage_update_multi(context, start_period, usages, last_refreshed=None,
+                          session=None):
+    if not usages:
+        return
+    if not session:
+        session = get_session()
+
+    if last_refreshed is None:
+        last_refreshed = timeutils.utcnow()
+
+    with session.begin():
+        uuids = set(usage['uuid'] for usage in usages)
+        rows = model_query(context, models.BandwidthUsage,
+                           session=session, read_deleted="yes").\
+                       filter(models.BandwidthUsage.uuid.in_(uuids)).\
+                       filter_by(start_period=start_period).\
+                       all()
+        bwusages = dict(((row.uuid, row.mac), row) for row in rows)
+
+        for usage in usages:
+            bwusage = bwusages.get((usage['uuid'], usage['mac']))
+            if bwusage is None:
+                bwusage = models.BandwidthUsage()
+                bwusage.start_period = start_period
+                bwusage.uuid = usage['uuid']
+                bwusage.mac = usage['mac']
+                bwusages[(usage['uuid'], usage['mac'])] = bwusage
+                session.add(bwusage)
+            bwusage.last_refreshed = last_refreshed
+            bwusage.bw_in = usage['bw_in']
+            bwusage.bw_out = usage['bw_out']
+            bwusage.last_ctr_in = usage['last_ctr_in']
+            bwusage.last_ctr_out = usage['last_ctr_out']
+
+
 ####################
 
 
@@ -4327,6 +4669,21 @@ def aggregate_metadata_get_by_host(context, host, key=None):
     return dict(metadata)
 
 
+@require_admin_context
+def aggregate_metadata_get_all_by_host(context):
+    """Return aggregate_metadata_get_by_host() for every host at once."""
+    rows = model_query(context, models.Aggregate).\
+            options(joinedload('_metadata')).\
+            all()
+    metadata = collections.defaultdict(lambda: collections.defaultdict(set))
+    for agg in rows:
+        for agghost in agg._hosts:
+            for kv in agg._metadata:
+                metadata[agghost.host][kv['key']].add(kv['value'])
+    return dict((host, dict(host_metadata))
+                for host, host_metadata in metadata.iteritems())
+
+
 @require_admin_context
 def aggregate_host_get_by_metadata_key(context, key):
     query = model_query(context, models.Aggregate).join(
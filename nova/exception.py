@@ -280,6 +280,11 @@ class InvalidParameterValue(Invalid):
     message = _("%(err)s")
 
 
+class ImagePrefetchTooManyHosts(Invalid):
+    message = _("Cannot pre-fetch an image on %(count)d hosts at once, "
+                "the maximum is %(max)d.")
+
+
 class InvalidAggregateAction(Invalid):
     message = _("Cannot perform action '%(action)s' on aggregate "
                 "%(aggregate_id)s. Reason: %(reason)s.")
@@ -398,6 +403,11 @@ class ImageUnacceptable(Invalid):
     message = _("Image %(image_id)s is unacceptable: %(reason)s")
 
 
+class ImageChecksumMismatch(NovaException):
+    message = _("Checksum of downloaded image %(image_id)s is %(actual)s, "
+                "expected %(expected)s")
+
+
 class InstanceUnacceptable(Invalid):
     message = _("Instance %(instance_id)s is unacceptable: %(reason)s")
 
@@ -20,6 +20,8 @@
 from __future__ import absolute_import
 
 import copy
+import hashlib
+import heapq
 import itertools
 import random
 import sys
@@ -58,6 +60,15 @@ glance_opts = [
     cfg.IntOpt('glance_num_retries',
                default=0,
                help='Number retries when downloading an image from glance'),
+    cfg.IntOpt('glance_client_pool_size',
+               default=64,
+               help='Number of glance clients, one per api server and auth '
+                    'token, kept for reuse between calls. The clients do '
+                    'not keep their HTTP connections open'),
+    cfg.IntOpt('glance_metadata_cache_ttl',
+               default=30,
+               help='Seconds the metadata of active images from glance is '
+                    'cached for. Set to 0 to disable the cache'),
 ]
 
 LOG = logging.getLogger(__name__)
@@ -66,6 +77,15 @@ CONF.register_opts(glance_opts)
 CONF.import_opt('auth_strategy', 'nova.api.auth')
 CONF.import_opt('my_ip', 'nova.config')
 
+# How often, in seconds, download progress is logged
+DOWNLOAD_PROGRESS_INTERVAL = 10
+
+# Longest time, in seconds, a failing glance api server is skipped for
+SERVER_BACKOFF_MAX = 60
+
+# Number of images above which expired metadata is pruned from the cache
+IMAGE_META_CACHE_MAX = 1000
+
 
 def generate_glance_url():
     """Generate the URL to glance."""
@@ -108,12 +128,8 @@ def _create_glance_client(context, host, port, use_ssl, version=1):
     return glanceclient.Client(str(version), endpoint, **params)
 
 
-def get_api_servers():
-    """
-    Shuffle a list of CONF.glance_api_servers and return an iterator
-    that will cycle through the list, looping around to the beginning
-    if necessary.
-    """
+def _get_api_server_list():
+    """Return CONF.glance_api_servers as shuffled (host, port, use_ssl)."""
     api_servers = []
     for api_server in CONF.glance_api_servers:
         if '//' not in api_server:
@@ -124,7 +140,130 @@ def get_api_servers():
         use_ssl = (o.scheme == 'https')
         api_servers.append((host, port, use_ssl))
     random.shuffle(api_servers)
-    return itertools.cycle(api_servers)
+    return api_servers
+
+
+def get_api_servers():
+    """
+    Shuffle a list of CONF.glance_api_servers and return an iterator
+    that will cycle through the list, looping around to the beginning
+    if necessary.
+    """
+    return itertools.cycle(_get_api_server_list())
+
+
+class GlanceClientPool(object):
+    """Keeps glance clients for reuse, and tracks api server health.
+
+    Clients are keyed by api server, api version and auth token, and the
+    least recently used ones are dropped beyond glance_client_pool_size.
+    This only saves building a client per call: glanceclient opens a new
+    HTTP connection for every request, so no connection is kept alive.
+
+    An api server that fails is skipped for a backoff that doubles with
+    each consecutive failure, up to SERVER_BACKOFF_MAX seconds.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        # Key -> use count at its last use, and a heap of (use count, key)
+        # holding stale entries for keys used again since, which are
+        # skipped when popped.
+        self._last_used = {}
+        self._lru_heap = []
+        self._uses = 0
+        self._failures = {}
+        self.created = 0
+        self.reused = 0
+        self.calls = 0
+        self.call_time = 0.0
+
+    @staticmethod
+    def _key(context, server, version):
+        token = None
+        if CONF.auth_strategy == 'keystone':
+            token = getattr(context, 'auth_token', None)
+        return server + (version, token)
+
+    def _touch(self, key):
+        self._uses += 1
+        self._last_used[key] = self._uses
+        heapq.heappush(self._lru_heap, (self._uses, key))
+        if len(self._lru_heap) > 2 * len(self._clients) + 64:
+            self._lru_heap = [(u, k) for k, u
+                              in self._last_used.iteritems()]
+            heapq.heapify(self._lru_heap)
+
+    def _remove(self, key):
+        self._clients.pop(key, None)
+        self._last_used.pop(key, None)
+
+    def get(self, context, server, version):
+        key = self._key(context, server, version)
+        client = self._clients.get(key)
+        if client is None:
+            host, port, use_ssl = server
+            client = _create_glance_client(context, host, port, use_ssl,
+                                           version)
+            self._clients[key] = client
+            self.created += 1
+        else:
+            self.reused += 1
+        self._touch(key)
+        while len(self._clients) > CONF.glance_client_pool_size:
+            uses, lru_key = heapq.heappop(self._lru_heap)
+            if self._last_used.get(lru_key) == uses:
+                self._remove(lru_key)
+        return client
+
+    def discard(self, context, server, version):
+        self._remove(self._key(context, server, version))
+
+    def select_server(self, api_servers, start=0):
+        """Pick the first api server from start on that is not backing off.
+
+        The list is wrapped around, and if every server is backing off,
+        the one due back soonest is used.
+        """
+        now = time.time()
+        retry_at = {}
+        for server in api_servers[start:] + api_servers[:start]:
+            failures, last_failure = self._failures.get(server, (0, 0))
+            if not failures:
+                return server
+            backoff = min(2 ** (failures - 1), SERVER_BACKOFF_MAX)
+            retry_at[server] = last_failure + backoff
+            if retry_at[server] <= now:
+                return server
+        return min(api_servers, key=retry_at.get)
+
+    def server_failed(self, server):
+        failures = self._failures.get(server, (0, 0))[0]
+        self._failures[server] = (failures + 1, time.time())
+
+    def server_ok(self, server, elapsed):
+        self._failures.pop(server, None)
+        self.calls += 1
+        self.call_time += elapsed
+
+    def get_stats(self):
+        requested = self.created + self.reused
+        reuse_rate = 0.0
+        if requested:
+            reuse_rate = float(self.reused) / requested
+        average_call_time = 0.0
+        if self.calls:
+            average_call_time = self.call_time / self.calls
+        return {'clients': len(self._clients),
+                'created': self.created,
+                'reused': self.reused,
+                'reuse_rate': reuse_rate,
+                'calls': self.calls,
+                'average_call_time': average_call_time,
+                'failing_servers': len(self._failures)}
+
+
+CLIENT_POOL = GlanceClientPool()
 
 
 class GlanceClientWrapper(object):
@@ -139,6 +278,7 @@ class GlanceClientWrapper(object):
         else:
             self.client = None
         self.api_servers = None
+        self.next_server = 0
 
     def _create_static_client(self, context, host, port, use_ssl, version):
         """Create a client that we'll use for every call."""
@@ -150,14 +290,19 @@ class GlanceClientWrapper(object):
                                      self.host, self.port,
                                      self.use_ssl, self.version)
 
-    def _create_onetime_client(self, context, version):
-        """Create a client that will be used for one call."""
+    def _get_pooled_client(self, context, version):
+        """Get a client from the pool for the next healthy api server.
+
+        Calls go round-robin over the api servers, skipping those that
+        are backing off.
+        """
         if self.api_servers is None:
-            self.api_servers = get_api_servers()
-        self.host, self.port, self.use_ssl = self.api_servers.next()
-        return _create_glance_client(context,
-                                     self.host, self.port,
-                                     self.use_ssl, version)
+            self.api_servers = _get_api_server_list()
+        server = CLIENT_POOL.select_server(self.api_servers, self.next_server)
+        self.next_server = ((self.api_servers.index(server) + 1) %
+                            len(self.api_servers))
+        self.host, self.port, self.use_ssl = server
+        return CLIENT_POOL.get(context, server, version)
 
     def call(self, context, version, method, *args, **kwargs):
         """
@@ -170,11 +315,16 @@ class GlanceClientWrapper(object):
         num_attempts = 1 + CONF.glance_num_retries
 
         for attempt in xrange(1, num_attempts + 1):
-            client = self.client or self._create_onetime_client(context,
-                                                                version)
+            client = self.client or self._get_pooled_client(context,
+                                                            version)
+            start = time.time()
             try:
-                return getattr(client.images, method)(*args, **kwargs)
+                result = getattr(client.images, method)(*args, **kwargs)
             except retry_excs as e:
+                if not self.client:
+                    server = (self.host, self.port, self.use_ssl)
+                    CLIENT_POOL.server_failed(server)
+                    CLIENT_POOL.discard(context, server, version)
                 host = self.host
                 port = self.port
                 extra = "retrying"
@@ -187,6 +337,98 @@ class GlanceClientWrapper(object):
                             host=host, port=port, reason=str(e))
                 LOG.exception(error_msg, locals())
                 time.sleep(1)
+            else:
+                if not self.client:
+                    server = (self.host, self.port, self.use_ssl)
+                    CLIENT_POOL.server_ok(server, time.time() - start)
+                return result
+
+
+class ImageMetaCache(object):
+    """Caches translated image metadata for glance_metadata_cache_ttl.
+
+    Public images are cached once for everybody, other images once per
+    project. When an entry has expired and the image is fetched again,
+    its translated metadata is reused if updated_at and checksum show the
+    image has not changed.
+
+    Only active images are cached. Images still being uploaded or
+    snapshotted change status without this process knowing, and update()
+    and delete() only invalidate the cache of the process making them.
+    """
+
+    def __init__(self):
+        self._images = {}
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    @staticmethod
+    def _validator(image):
+        return (getattr(image, 'updated_at', None),
+                getattr(image, 'checksum', None))
+
+    def get(self, context, image_id):
+        """Return (image, image_meta) if cached and unexpired, else None."""
+        entries = self._images.get(image_id)
+        if entries:
+            now = time.time()
+            for visibility in (None, context.project_id):
+                entry = entries.get(visibility)
+                if entry is not None and entry[0] > now:
+                    self.hits += 1
+                    return entry[1], copy.deepcopy(entry[2])
+        self.misses += 1
+        return None
+
+    def put(self, context, image, translate):
+        """Cache image and return its translated metadata."""
+        if CONF.glance_metadata_cache_ttl <= 0:
+            return translate(image)
+        if getattr(image, 'status', None) != 'active':
+            self.invalidate(image.id)
+            return translate(image)
+
+        visibility = None
+        if not getattr(image, 'is_public', False):
+            visibility = context.project_id
+        entries = self._images.setdefault(image.id, {})
+        stale = entries.get(visibility)
+        if stale is not None and (self._validator(stale[1]) ==
+                                  self._validator(image)):
+            self.revalidated += 1
+            image_meta = stale[2]
+        else:
+            image_meta = translate(image)
+        entries[visibility] = (time.time() + CONF.glance_metadata_cache_ttl,
+                               image, image_meta)
+
+        if len(self._images) > IMAGE_META_CACHE_MAX:
+            self._prune()
+        return copy.deepcopy(image_meta)
+
+    def invalidate(self, image_id):
+        self._images.pop(image_id, None)
+
+    def _prune(self):
+        now = time.time()
+        for image_id, entries in self._images.items():
+            for visibility, entry in entries.items():
+                if entry[0] <= now:
+                    del entries[visibility]
+            if not entries:
+                del self._images[image_id]
+        if len(self._images) > IMAGE_META_CACHE_MAX:
+            self._images.clear()
+
+    def get_stats(self):
+        return {'images': len(self._images),
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidated': self.revalidated}
+
+
+IMAGE_META_CACHE = ImageMetaCache()
 
 
 class GlanceImageService(object):
@@ -203,10 +445,12 @@ class GlanceImageService(object):
         except Exception:
             _reraise_translated_exception()
 
+        # Listing images also warms the metadata cache with them
         _images = []
         for image in images:
             if self._is_image_available(context, image):
-                _images.append(self._translate_from_glance(image))
+                _images.append(IMAGE_META_CACHE.put(
+                        context, image, self._translate_from_glance))
 
         return _images
 
@@ -227,15 +471,22 @@ class GlanceImageService(object):
 
     def show(self, context, image_id):
         """Returns a dict with image data for the given opaque image id."""
-        try:
-            image = self._client.call(context, 1, 'get', image_id)
-        except Exception:
-            _reraise_translated_image_exception(image_id)
+        cached = IMAGE_META_CACHE.get(context, image_id)
+        if cached is not None:
+            image, base_image_meta = cached
+        else:
+            try:
+                image = self._client.call(context, 1, 'get', image_id)
+            except Exception:
+                _reraise_translated_image_exception(image_id)
+            base_image_meta = None
 
         if not self._is_image_available(context, image):
             raise exception.ImageNotFound(image_id=image_id)
 
-        base_image_meta = self._translate_from_glance(image)
+        if base_image_meta is None:
+            base_image_meta = IMAGE_META_CACHE.put(
+                    context, image, self._translate_from_glance)
         return base_image_meta
 
     def get_location(self, context, image_id):
@@ -253,14 +504,39 @@ class GlanceImageService(object):
         return getattr(image_meta, 'direct_url', None)
 
     def download(self, context, image_id, data):
-        """Calls out to Glance for metadata and data and writes data."""
+        """Calls out to Glance for metadata and data and writes data.
+
+        The data is checked against the checksum Glance holds for the image
+        while it is written, and progress is logged as it goes.
+        """
         try:
+            image = self._client.call(context, 1, 'get', image_id)
             image_chunks = self._client.call(context, 1, 'data', image_id)
         except Exception:
             _reraise_translated_image_exception(image_id)
 
+        expected_checksum = getattr(image, 'checksum', None)
+        size = getattr(image, 'size', None)
+        checksum = hashlib.md5()
+        written = 0
+        start = last_report = time.time()
         for chunk in image_chunks:
             data.write(chunk)
+            checksum.update(chunk)
+            written += len(chunk)
+
+            now = time.time()
+            if now - last_report >= DOWNLOAD_PROGRESS_INTERVAL:
+                last_report = now
+                _log_download_progress(LOG.debug, image_id, written, size,
+                                       now - start)
+
+        _log_download_progress(LOG.info, image_id, written, size,
+                               time.time() - start)
+        if expected_checksum and checksum.hexdigest() != expected_checksum:
+            raise exception.ImageChecksumMismatch(
+                    image_id=image_id, actual=checksum.hexdigest(),
+                    expected=expected_checksum)
 
     def create(self, context, image_meta, data=None):
         """Store the image data and return the new image object."""
@@ -291,6 +567,8 @@ class GlanceImageService(object):
             _reraise_translated_image_exception(image_id)
         else:
             return self._translate_from_glance(image_meta)
+        finally:
+            IMAGE_META_CACHE.invalidate(image_id)
 
     def delete(self, context, image_id):
         """Delete the given image.
@@ -306,6 +584,8 @@ class GlanceImageService(object):
             raise exception.ImageNotFound(image_id=image_id)
         except glanceclient.exc.HTTPForbidden:
             raise exception.ImageNotAuthorized(image_id=image_id)
+        finally:
+            IMAGE_META_CACHE.invalidate(image_id)
         return True
 
     @staticmethod
@@ -426,6 +706,16 @@ def _reraise_translated_image_exception(image_id):
     raise new_exc, None, exc_trace
 
 
+def _log_download_progress(log, image_id, written, size, elapsed):
+    rate = written / (1024.0 * 1024.0) / max(elapsed, 0.001)
+    log(_("Downloaded %(written)d of %(size)s bytes of image %(image_id)s "
+          "(%(rate).1f MB/s)"),
+        {'written': written,
+         'size': size if size is not None else '?',
+         'image_id': image_id,
+         'rate': rate})
+
+
 def _reraise_translated_exception():
     """Transform the exception but keep its traceback intact."""
     exc_type, exc_value, exc_trace = sys.exc_info()
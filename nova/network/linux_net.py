@@ -91,6 +91,12 @@ linux_net_opts = [
     cfg.IntOpt('metadata_port',
                default=8775,
                help='the port for the metadata api port'),
+    cfg.BoolOpt('iptables_incremental_apply',
+                default=False,
+                help='Only rewrite the chains of this service changed since '
+                     'the last apply, using iptables-restore --noflush, '
+                     'instead of reloading whole tables. Changes to the '
+                     'built-in and shared chains still reload the table'),
     ]
 
 CONF = cfg.CONF
@@ -134,6 +140,9 @@ class IptablesRule(object):
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return hash((self.chain, self.rule, self.top, self.wrap))
+
     def __str__(self):
         if self.wrap:
             chain = '%s-%s' % (binary_name, self.chain)
@@ -147,11 +156,28 @@ class IptablesTable(object):
     """An iptables table."""
 
     def __init__(self):
-        self.rules = []
+        # (chain, wrap) -> list of the IptablesRules of the chain
+        self._chain_rules = {}
+        # (chain, wrap) of the chains in _chain_rules, in creation order
+        self._chain_keys = []
         self.remove_rules = []
         self.chains = set()
         self.unwrapped_chains = set()
         self.remove_chains = set()
+        # (chain, wrap) of the chains changed since the last apply
+        self.dirty_chains = set()
+
+    @property
+    def rules(self):
+        """All the rules of the table."""
+        rules = []
+        for key in self._chain_keys:
+            rules.extend(self._chain_rules[key])
+        return rules
+
+    def get_chain_rules(self, chain, wrap=True):
+        """Returns the rules of a chain, in the order they were added."""
+        return list(self._chain_rules.get((chain, wrap), []))
 
     def add_chain(self, name, wrap=True):
         """Adds a named chain to the table.
@@ -169,6 +195,7 @@ class IptablesTable(object):
             self.chains.add(name)
         else:
             self.unwrapped_chains.add(name)
+        self.dirty_chains.add((name, wrap))
 
     def remove_chain(self, name, wrap=True):
         """Remove named chain.
@@ -194,19 +221,27 @@ class IptablesTable(object):
         if not wrap:
             self.remove_chains.add(name)
         chain_set.remove(name)
-        if not wrap:
-            self.remove_rules += filter(lambda r: r.chain == name, self.rules)
-        self.rules = filter(lambda r: r.chain != name, self.rules)
+        self.dirty_chains.add((name, wrap))
+        chain_rules = self._chain_rules.pop((name, wrap), None)
+        if chain_rules is not None:
+            self._chain_keys.remove((name, wrap))
+            if not wrap:
+                self.remove_rules += chain_rules
 
         if wrap:
             jump_snippet = '-j %s-%s' % (binary_name, name)
         else:
             jump_snippet = '-j %s' % (name,)
 
-        if not wrap:
-            self.remove_rules += filter(lambda r: jump_snippet in r.rule,
-                                        self.rules)
-        self.rules = filter(lambda r: jump_snippet not in r.rule, self.rules)
+        for key, chain_rules in self._chain_rules.iteritems():
+            jumps = [rule for rule in chain_rules if jump_snippet in rule.rule]
+            if not jumps:
+                continue
+            if not wrap:
+                self.remove_rules += jumps
+            chain_rules[:] = [rule for rule in chain_rules
+                              if jump_snippet not in rule.rule]
+            self.dirty_chains.add(key)
 
     def add_rule(self, chain, rule, wrap=True, top=False):
         """Add a rule to the table.
@@ -225,7 +260,12 @@ class IptablesTable(object):
         if '$' in rule:
             rule = ' '.join(map(self._wrap_target_chain, rule.split(' ')))
 
-        self.rules.append(IptablesRule(chain, rule, wrap, top))
+        key = (chain, wrap)
+        if key not in self._chain_rules:
+            self._chain_rules[key] = []
+            self._chain_keys.append(key)
+        self._chain_rules[key].append(IptablesRule(chain, rule, wrap, top))
+        self.dirty_chains.add(key)
 
     def _wrap_target_chain(self, s):
         if s.startswith('$'):
@@ -241,7 +281,9 @@ class IptablesTable(object):
 
         """
         try:
-            self.rules.remove(IptablesRule(chain, rule, wrap, top))
+            self._chain_rules.get((chain, wrap), []).remove(
+                    IptablesRule(chain, rule, wrap, top))
+            self.dirty_chains.add((chain, wrap))
             if not wrap:
                 self.remove_rules.append(IptablesRule(chain, rule, wrap, top))
         except ValueError:
@@ -252,10 +294,10 @@ class IptablesTable(object):
 
     def empty_chain(self, chain, wrap=True):
         """Remove all rules from a chain."""
-        chained_rules = [rule for rule in self.rules
-                              if rule.chain == chain and rule.wrap == wrap]
-        for rule in chained_rules:
-            self.rules.remove(rule)
+        chain_rules = self._chain_rules.get((chain, wrap))
+        if chain_rules:
+            self._chain_rules[(chain, wrap)] = []
+            self.dirty_chains.add((chain, wrap))
 
 
 class IptablesManager(object):
@@ -294,6 +336,10 @@ class IptablesManager(object):
 
         self.iptables_apply_deferred = False
 
+        # (command, table name) -> {wrapped chain: rule lines} as of the
+        # last apply, for iptables_incremental_apply.
+        self.applied_chains = {}
+
         # Add a nova-filter-top chain. It's intended to be shared
         # among the various nova components. It sits at the very top
         # of FORWARD and OUTPUT.
@@ -372,6 +418,9 @@ class IptablesManager(object):
 
         for cmd, tables in s:
             for table in tables:
+                if (CONF.iptables_incremental_apply and
+                    self._apply_changed_chains(cmd, table, tables[table])):
+                    continue
                 current_table, _err = self.execute('%s-save' % (cmd,), '-c',
                                                    '-t', '%s' % (table,),
                                                    run_as_root=True,
@@ -382,8 +431,81 @@ class IptablesManager(object):
                 self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
                              process_input='\n'.join(new_filter),
                              attempts=5)
+                tables[table].dirty_chains.clear()
+                if CONF.iptables_incremental_apply:
+                    self.applied_chains[(cmd, table)] = dict(
+                            (chain, self._chain_lines(tables[table], chain))
+                            for chain in tables[table].chains)
         LOG.debug(_("IPTablesManager.apply completed with success"))
 
+    @staticmethod
+    def _chain_lines(table, chain):
+        """The lines of the rules of a wrapped chain, as _modify_rules()
+        orders them: top rules first, and the last of identical rules.
+        """
+        rules = table.get_chain_rules(chain)
+        lines = ([str(rule) for rule in rules if rule.top] +
+                 [str(rule) for rule in rules if not rule.top])
+        seen_lines = set()
+        unique_lines = []
+        for line in reversed(lines):
+            if line not in seen_lines:
+                seen_lines.add(line)
+                unique_lines.append(line)
+        unique_lines.reverse()
+        return unique_lines
+
+    def _apply_changed_chains(self, cmd, table_name, table):
+        """Rewrite only the wrapped chains of a table whose rules changed
+        since the last apply, and delete the removed ones, with
+        iptables-restore --noflush.
+
+        Returns False if the whole table has to be reloaded instead: on
+        the first apply, when the unwrapped chains changed, or if the
+        restore fails.
+        """
+        applied = self.applied_chains.get((cmd, table_name))
+        if (applied is None or table.remove_chains or table.remove_rules or
+            [chain for chain, wrap in table.dirty_chains if not wrap]):
+            return False
+
+        changed = {}
+        removed = []
+        for chain, _wrap in table.dirty_chains:
+            if chain in table.chains:
+                lines = self._chain_lines(table, chain)
+                if applied.get(chain) != lines:
+                    changed[chain] = lines
+            elif chain in applied:
+                removed.append(chain)
+
+        if changed or removed:
+            new_filter = ['*%s' % (table_name,)]
+            new_filter += [':%s-%s - [0:0]' % (binary_name, chain)
+                           for chain in sorted(changed)]
+            for chain in sorted(changed):
+                new_filter += changed[chain]
+            for chain in sorted(removed):
+                new_filter += ['-F %s-%s' % (binary_name, chain),
+                               '-X %s-%s' % (binary_name, chain)]
+            new_filter += ['COMMIT', '']
+            try:
+                self.execute('%s-restore' % (cmd,), '-c', '--noflush',
+                             run_as_root=True,
+                             process_input='\n'.join(new_filter),
+                             attempts=5)
+            except exception.ProcessExecutionError:
+                LOG.exception(_('Failed to apply the changed %(cmd)s '
+                                '%(table_name)s chains, reloading the '
+                                'table') % locals())
+                return False
+
+        applied.update(changed)
+        for chain in removed:
+            del applied[chain]
+        table.dirty_chains.clear()
+        return True
+
     def _modify_rules(self, current_lines, table, binary=None):
         unwrapped_chains = table.unwrapped_chains
         chains = table.chains
@@ -453,6 +575,14 @@ class IptablesManager(object):
 
         seen_lines = set()
 
+        # Number of lines to remove for each rule, without the
+        # [packet:byte] counts at the beginning.
+        remove_rule_counts = {}
+        for rule in remove_rules:
+            rule_str = str(rule).split(' ', 1)[1].strip()
+            remove_rule_counts[rule_str] = \
+                    remove_rule_counts.get(rule_str, 0) + 1
+
         def _weed_out_duplicates(line):
             # ignore [packet:byte] counts at beginning of lines
             if line.startswith('['):
@@ -472,23 +602,17 @@ class IptablesManager(object):
                 line = line.split(':')[1]
                 line = line.split('- [')[0]
                 line = line.strip()
-                for chain in remove_chains:
-                    if chain == line:
-                        remove_chains.remove(chain)
-                        return False
+                if line in remove_chains:
+                    remove_chains.remove(line)
+                    return False
             elif line.startswith('['):
                 # it's a rule
                 # ignore [packet:byte] counts at beginning of lines
                 line = line.split(']', 1)[1]
                 line = line.strip()
-                for rule in remove_rules:
-                    # ignore [packet:byte] counts at beginning of rules
-                    rule_str = str(rule)
-                    rule_str = rule_str.split(' ', 1)[1]
-                    rule_str = rule_str.strip()
-                    if rule_str == line:
-                        remove_rules.remove(rule)
-                        return False
+                if remove_rule_counts.get(line):
+                    remove_rule_counts[line] -= 1
+                    return False
 
             # Leave it alone
             return True
@@ -503,8 +627,7 @@ class IptablesManager(object):
 
         # flush lists, just in case we didn't find something
         remove_chains.clear()
-        for rule in remove_rules:
-            remove_rules.remove(rule)
+        del remove_rules[:]
 
         return new_filter
 
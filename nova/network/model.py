@@ -257,6 +257,45 @@ class VIF(Model):
         return vif
 
 
+def _ip_version(ip):
+    version = ip.get('version')
+    if ip.get('address') and not version:
+        try:
+            version = netaddr.IPAddress(ip['address']).version
+        except netaddr.AddrFormatError:
+            raise exception.InvalidIpAddressError(ip['address'])
+    return version
+
+
+def get_addresses(network_info):
+    """Return the addresses in network info without hydrating it.
+
+    network_info is a NetworkInfo, the list of dicts it is made from or
+    their JSON, as kept in the info cache of an instance.  Returns a
+    (network label, fixed IPs, floating IPs) tuple for each VIF, with the
+    IPs as (version, address) tuples in the order NetworkInfo.fixed_ips()
+    and floating_ips() list them.  None of the VIF, Network, Subnet or IP
+    models are built.
+    """
+    if isinstance(network_info, basestring):
+        network_info = jsonutils.loads(network_info)
+
+    addresses = []
+    for vif in network_info or []:
+        network = vif.get('network') or {}
+        fixed_ips = []
+        floating_ips = []
+        for subnet in network.get('subnets') or []:
+            for ip in subnet.get('ips') or []:
+                fixed_ips.append((_ip_version(ip), ip['address']))
+                for floating_ip in ip.get('floating_ips') or []:
+                    if floating_ip:
+                        floating_ips.append((_ip_version(floating_ip),
+                                             floating_ip['address']))
+        addresses.append((network.get('label'), fixed_ips, floating_ips))
+    return addresses
+
+
 class NetworkInfo(list):
     """Stores and manipulates network information for a Nova instance"""
 
@@ -42,6 +42,47 @@ import xmlrpclib
 from nova.openstack.common import timeutils
 
 
+def _primitive(value, convert_instances, level):
+    return value
+
+
+def _list_to_primitive(value, convert_instances, level):
+    return [to_primitive(v, convert_instances=convert_instances,
+                         level=level)
+            for v in value]
+
+
+def _dict_to_primitive(value, convert_instances, level):
+    return dict((k, to_primitive(v, convert_instances=convert_instances,
+                                 level=level))
+                for k, v in value.iteritems())
+
+
+def _datetime_to_primitive(value, convert_instances, level):
+    return timeutils.strtime(value)
+
+
+# Converters for the types most values have, dispatched on the exact
+# type before falling back to the inspection in to_primitive().
+#
+# NOTE: this table and its use in to_primitive() are local to nova and
+# not yet in openstack-common. Carry them over when syncing jsonutils
+# until they land there; nova/tests/test_jsonutils.py fails without them.
+_converters = {
+    str: _primitive,
+    unicode: _primitive,
+    int: _primitive,
+    long: _primitive,
+    float: _primitive,
+    bool: _primitive,
+    type(None): _primitive,
+    list: _list_to_primitive,
+    tuple: _list_to_primitive,
+    dict: _dict_to_primitive,
+    datetime.datetime: _datetime_to_primitive,
+}
+
+
 def to_primitive(value, convert_instances=False, level=0):
     """Convert a complex object into primitives.
 
@@ -56,6 +97,12 @@ def to_primitive(value, convert_instances=False, level=0):
     Therefore, convert_instances=True is lossy ... be aware.
 
     """
+    converter = _converters.get(type(value))
+    if converter is not None:
+        if level > 3:
+            return '?'
+        return converter(value, convert_instances, level)
+
     nasty = [inspect.ismodule, inspect.isclass, inspect.ismethod,
              inspect.isfunction, inspect.isgeneratorfunction,
              inspect.isgenerator, inspect.istraceback, inspect.isframe,
@@ -18,6 +18,7 @@
 Manage hosts in the current zone.
 """
 
+from nova.openstack.common import timeutils
 from nova.scheduler import host_manager
 
 
@@ -41,6 +42,7 @@ class BaremetalNodeState(host_manager.HostState):
         self.vcpus_used = compute['vcpus_used']
 
     def consume_from_instance(self, instance):
+        self.claims.append((timeutils.utcnow(), instance))
         self.free_ram_mb = 0
         self.free_disk_mb = 0
         self.vcpus_used = self.vcpus_total
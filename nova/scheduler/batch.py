@@ -0,0 +1,158 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Batch scheduling of multi-instance requests.
+
+Instead of running every filter and weigher over every host once per
+instance, the resource fields of the candidate hosts are copied into
+NumPy arrays and the filters and weighers that support it
+(filter_columns() / weigh_columns()) evaluate all hosts in one vectorized
+operation.  Filters flagged with run_filter_once_per_request only run once.
+The selected hosts are the same as with the sequential algorithm in
+FilterScheduler._schedule().
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from nova.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+def is_available():
+    return numpy is not None
+
+
+class HostColumns(object):
+    """Array-backed copy of the consumable resources of a list of
+    HostStates.  Every field is an array with one entry per host.
+    """
+
+    fields = ('free_ram_mb', 'total_usable_ram_mb', 'free_disk_mb',
+              'total_usable_disk_gb', 'vcpus_total', 'vcpus_used',
+              'num_instances', 'num_io_ops')
+
+    def __init__(self, host_states):
+        self.host_states = list(host_states)
+        # Doubles hold the integer counters exactly and give the same
+        # results as the int/float arithmetic done by host_passes().
+        for field in self.fields:
+            setattr(self, field, numpy.array(
+                    [getattr(host_state, field)
+                     for host_state in self.host_states], dtype=float))
+
+    def __len__(self):
+        return len(self.host_states)
+
+    def constant(self, value):
+        """Return an array holding value for every host."""
+        return numpy.repeat(value, len(self.host_states))
+
+    def refresh(self, index):
+        """Copy the fields of one host back in after it changed."""
+        host_state = self.host_states[index]
+        for field in self.fields:
+            getattr(self, field)[index] = getattr(host_state, field)
+
+
+def _filter_mask(columns, filter_objs, filter_properties):
+    mask = columns.constant(True)
+    for filter_obj in filter_objs:
+        mask &= filter_obj.filter_columns(columns, filter_properties)
+    return mask
+
+
+def _weights(columns, weighers, weight_properties):
+    weights = columns.constant(0.0)
+    for weigher in weighers:
+        weights += (weigher._weight_multiplier() *
+                    weigher.weigh_columns(columns, weight_properties))
+    return weights
+
+
+def select_hosts(host_states, filter_classes, weigher_classes,
+                 filter_properties, instance_properties, num_instances,
+                 weighed_host_cls):
+    """Pick a host for each of num_instances instances.
+
+    Returns a list of weighed_host_cls objects, possibly shorter than
+    num_instances if the hosts run out, or None if one of the filters or
+    weighers cannot be evaluated in batch.  Resources are consumed from
+    the chosen HostStates as in the sequential algorithm.
+    """
+    if numpy is None:
+        return None
+
+    filter_objs = [filter_cls() for filter_cls in filter_classes]
+    once_filters = [f for f in filter_objs if f.run_filter_once_per_request]
+    batch_filters = [f for f in filter_objs
+                     if not f.run_filter_once_per_request]
+    weighers = [weigher_cls() for weigher_cls in weigher_classes]
+
+    columns = HostColumns(host_states)
+    if not len(columns):
+        return []
+    for filter_obj in batch_filters:
+        if filter_obj.filter_columns(columns, filter_properties) is None:
+            LOG.debug(_("%s does not support batch scheduling"),
+                      filter_obj.__class__.__name__)
+            return None
+    for weigher in weighers:
+        if weigher.weigh_columns(columns, filter_properties) is None:
+            LOG.debug(_("%s does not support batch scheduling"),
+                      weigher.__class__.__name__)
+            return None
+
+    # A host that fails a filter once drops out for the rest of the
+    # request, just like the shrinking host list of the sequential loop.
+    candidates = _filter_mask(columns, batch_filters, filter_properties)
+    passing = [columns.host_states[index]
+               for index in numpy.flatnonzero(candidates)]
+    for filter_obj in once_filters:
+        passing = list(filter_obj.filter_all(passing, filter_properties))
+    passing = set(id(host_state) for host_state in passing)
+    for index, host_state in enumerate(columns.host_states):
+        if id(host_state) not in passing:
+            candidates[index] = False
+
+    selected_hosts = []
+    for num in xrange(num_instances):
+        if num:
+            candidates &= _filter_mask(columns, batch_filters,
+                                       filter_properties)
+        if not candidates.any():
+            break
+        weights = _weights(columns, weighers, filter_properties)
+        # argmax returns the first of equal weights, the same host the
+        # stable sort of the sequential weighing puts first.
+        index = int(numpy.argmax(numpy.where(candidates, weights,
+                                             -numpy.inf)))
+        host_state = columns.host_states[index]
+        # Run the scalar filters on the chosen host so it gets the same
+        # oversubscription limits as with sequential scheduling.
+        for filter_obj in batch_filters:
+            filter_obj.host_passes(host_state, filter_properties)
+        weighed_host = weighed_host_cls(host_state, float(weights[index]))
+        LOG.debug(_("Choosing host %(weighed_host)s") % locals())
+        selected_hosts.append(weighed_host)
+        host_state.consume_from_instance(instance_properties)
+        columns.refresh(index)
+    return selected_hosts
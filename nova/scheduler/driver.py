@@ -272,7 +272,8 @@ class Scheduler(object):
         # Getting total used memory and disk of host
         # It should be sum of memories that are assigned as max value,
         # because overcommitting is risky.
-        instance_refs = db.instance_get_all_by_host(context, dest)
+        instance_refs = db.instance_get_all_by_host(context, dest,
+                                                    columns_to_join=[])
         used = sum([i['memory_mb'] for i in instance_refs])
 
         mem_inst = instance_ref['memory_mb']
@@ -28,6 +28,7 @@ from nova.scheduler import scheduler_options
 
 CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
+CONF.import_opt('scheduler_batch_mode', 'nova.scheduler.host_manager')
 
 
 class FilterScheduler(driver.Scheduler):
@@ -62,6 +63,8 @@ class FilterScheduler(driver.Scheduler):
         # NOTE(comstud): Make sure we do not pass this through.  It
         # contains an instance of RpcContext that cannot be serialized.
         filter_properties.pop('context', None)
+        # The affinity filters' lookups only hold for this request.
+        filter_properties.pop('affinity_hosts', None)
 
         for num, instance_uuid in enumerate(instance_uuids):
             request_spec['instance_properties']['launch_index'] = num
@@ -113,6 +116,7 @@ class FilterScheduler(driver.Scheduler):
 
         # context is not serializable
         filter_properties.pop('context', None)
+        filter_properties.pop('affinity_hosts', None)
 
         # Forward off to the host
         self.compute_rpcapi.prep_resize(context, image, instance,
@@ -269,16 +273,22 @@ class FilterScheduler(driver.Scheduler):
         # host, we virtually consume resources on it so subsequent
         # selections can adjust accordingly.
 
-        # Note: remember, we are using an iterator here. So only
-        # traverse this list once. This can bite you if the hosts
-        # are being scanned in a filter or weighing function.
-        hosts = self.host_manager.get_all_host_states(elevated)
+        hosts = list(self.host_manager.get_all_host_states(elevated))
+        # Load what the DB-backed filters need for all hosts in one go.
+        self.host_manager.prefetch_host_data(elevated, hosts)
 
-        selected_hosts = []
         if instance_uuids:
             num_instances = len(instance_uuids)
         else:
             num_instances = request_spec.get('num_instances', 1)
+
+        if num_instances > 1 and CONF.scheduler_batch_mode:
+            selected_hosts = self.host_manager.get_batch_weighed_hosts(hosts,
+                    filter_properties, instance_properties, num_instances)
+            if selected_hosts is not None:
+                return selected_hosts
+
+        selected_hosts = []
         for num in xrange(num_instances):
             # Filter local hosts based on requirements ...
             hosts = self.host_manager.get_filtered_hosts(hosts,
@@ -25,6 +25,17 @@ LOG = logging.getLogger(__name__)
 
 class BaseHostFilter(filters.BaseFilter):
     """Base class for host filters."""
+
+    # Set to True in a subclass if the result for a host cannot change
+    # while resources are consumed during a single scheduling request,
+    # so the filter only needs to run once for multi-instance requests.
+    run_filter_once_per_request = False
+
+    # Names of the HostState attributes the filter reads that
+    # HostManager.prefetch_host_data() loads for all hosts at once:
+    # 'aggregate_metadata' and/or 'instance_type_ids'.
+    host_data = ()
+
     def _filter_one(self, obj, filter_properties):
         """Return True if the object passes the filter, otherwise False."""
         return self.host_passes(obj, filter_properties)
@@ -35,6 +46,16 @@ class BaseHostFilter(filters.BaseFilter):
         """
         raise NotImplementedError()
 
+    def filter_columns(self, columns, filter_properties):
+        """Return an array of booleans, one per host in the given
+        nova.scheduler.batch.HostColumns, True where the host passes.
+
+        Override this in a subclass to allow the filter to be used for
+        batch scheduling.  It must give the same answers as host_passes().
+        Returns None if the filter doesn't support it.
+        """
+        return None
+
 
 class HostFilterHandler(filters.BaseFilterHandler):
     def __init__(self):
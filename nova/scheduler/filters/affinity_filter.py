@@ -22,31 +22,45 @@ from nova.scheduler import filters
 
 
 class AffinityFilter(filters.BaseHostFilter):
+    run_filter_once_per_request = True
+
     def __init__(self):
         self.compute_api = compute.API()
 
-    def _all_hosts(self, context):
-        all_hosts = {}
-        for instance in self.compute_api.get_all(context):
-            all_hosts[instance['uuid']] = instance['host']
-        return all_hosts
+    def _affinity_uuids(self, filter_properties, hint):
+        scheduler_hints = filter_properties.get('scheduler_hints') or {}
+        affinity_uuids = scheduler_hints.get(hint, [])
+        if isinstance(affinity_uuids, basestring):
+            affinity_uuids = [affinity_uuids]
+        return affinity_uuids
+
+    def _affinity_hosts(self, filter_properties, hint, affinity_uuids):
+        """Return the set of hosts running the instances named in the
+        scheduler hint.
+
+        Only the hinted instances are looked up, once per request.  The
+        result is kept in filter_properties so that every other host
+        checked for the same request is a set lookup.
+        """
+        affinity_hosts = filter_properties.setdefault('affinity_hosts', {})
+        if hint not in affinity_hosts:
+            context = filter_properties['context']
+            instances = self.compute_api.get_all(context,
+                    search_opts={'uuid': affinity_uuids})
+            affinity_hosts[hint] = set([instance['host']
+                                        for instance in instances])
+        return affinity_hosts[hint]
 
 
 class DifferentHostFilter(AffinityFilter):
     '''Schedule the instance on a different host from a set of instances.'''
 
     def host_passes(self, host_state, filter_properties):
-        context = filter_properties['context']
-        scheduler_hints = filter_properties.get('scheduler_hints') or {}
-        me = host_state.host
-
-        affinity_uuids = scheduler_hints.get('different_host', [])
-        if isinstance(affinity_uuids, basestring):
-            affinity_uuids = [affinity_uuids]
+        affinity_uuids = self._affinity_uuids(filter_properties,
+                                              'different_host')
         if affinity_uuids:
-            all_hosts = self._all_hosts(context)
-            return not any([i for i in affinity_uuids
-                              if all_hosts.get(i) == me])
+            return host_state.host not in self._affinity_hosts(
+                    filter_properties, 'different_host', affinity_uuids)
         # With no different_host key
         return True
 
@@ -57,18 +71,10 @@ class SameHostFilter(AffinityFilter):
     '''
 
     def host_passes(self, host_state, filter_properties):
-        context = filter_properties['context']
-        scheduler_hints = filter_properties.get('scheduler_hints') or {}
-        me = host_state.host
-
-        affinity_uuids = scheduler_hints.get('same_host', [])
-        if isinstance(affinity_uuids, basestring):
-            affinity_uuids = [affinity_uuids]
+        affinity_uuids = self._affinity_uuids(filter_properties, 'same_host')
         if affinity_uuids:
-            all_hosts = self._all_hosts(context)
-            return any([i for i
-                          in affinity_uuids
-                          if all_hosts.get(i) == me])
+            return host_state.host in self._affinity_hosts(
+                    filter_properties, 'same_host', affinity_uuids)
         # With no same_host key
         return True
 
@@ -26,6 +26,9 @@ LOG = logging.getLogger(__name__)
 class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
     """AggregateInstanceExtraSpecsFilter works with InstanceType records."""
 
+    run_filter_once_per_request = True
+    host_data = ('aggregate_metadata',)
+
     def host_passes(self, host_state, filter_properties):
         """Return a list of hosts that can create instance_type
 
@@ -36,8 +39,11 @@ class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
         if 'extra_specs' not in instance_type:
             return True
 
-        context = filter_properties['context'].elevated()
-        metadata = db.aggregate_metadata_get_by_host(context, host_state.host)
+        metadata = host_state.aggregate_metadata
+        if metadata is None:
+            context = filter_properties['context'].elevated()
+            metadata = db.aggregate_metadata_get_by_host(context,
+                                                         host_state.host)
 
         for key, req in instance_type['extra_specs'].iteritems():
             # NOTE(jogo) any key containing a scope (scope is terminated
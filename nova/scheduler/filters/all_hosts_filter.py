@@ -20,5 +20,7 @@ from nova.scheduler import filters
 class AllHostsFilter(filters.BaseHostFilter):
     """NOOP host filter. Returns all hosts."""
 
+    run_filter_once_per_request = True
+
     def host_passes(self, host_state, filter_properties):
         return True
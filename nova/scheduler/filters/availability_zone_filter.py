@@ -32,15 +32,20 @@ class AvailabilityZoneFilter(filters.BaseHostFilter):
     Note: in theory a compute node can be part of multiple availability_zones
     """
 
+    run_filter_once_per_request = True
+    host_data = ('aggregate_metadata',)
+
     def host_passes(self, host_state, filter_properties):
         spec = filter_properties.get('request_spec', {})
         props = spec.get('instance_properties', {})
         availability_zone = props.get('availability_zone')
 
         if availability_zone:
-            context = filter_properties['context'].elevated()
-            metadata = db.aggregate_metadata_get_by_host(
-                         context, host_state.host, key='availability_zone')
+            metadata = host_state.aggregate_metadata
+            if metadata is None:
+                context = filter_properties['context'].elevated()
+                metadata = db.aggregate_metadata_get_by_host(
+                             context, host_state.host, key='availability_zone')
             if 'availability_zone' in metadata:
                 return availability_zone in metadata['availability_zone']
             else:
@@ -26,6 +26,8 @@ LOG = logging.getLogger(__name__)
 class ComputeFilter(filters.BaseHostFilter):
     """Filter on active Compute nodes"""
 
+    run_filter_once_per_request = True
+
     def __init__(self):
         self.servicegroup_api = servicegroup.API()
 
@@ -53,3 +53,16 @@ class CoreFilter(filters.BaseHostFilter):
             host_state.limits['vcpu'] = vcpus_total
 
         return (vcpus_total - host_state.vcpus_used) >= instance_vcpus
+
+    def filter_columns(self, columns, filter_properties):
+        """Pass hosts with sufficient CPU cores."""
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return columns.constant(True)
+
+        instance_vcpus = instance_type['vcpus']
+        vcpus_total = columns.vcpus_total * CONF.cpu_allocation_ratio
+
+        # Hosts not reporting their VCPUs pass, as in host_passes().
+        return ((columns.vcpus_total == 0) |
+                ((vcpus_total - columns.vcpus_used) >= instance_vcpus))
@@ -51,3 +51,16 @@ class DiskFilter(filters.BaseHostFilter):
         disk_gb_limit = disk_mb_limit / 1024
         host_state.limits['disk_gb'] = disk_gb_limit
         return True
+
+    def filter_columns(self, columns, filter_properties):
+        """Filter based on disk usage"""
+        instance_type = filter_properties.get('instance_type')
+        requested_disk = 1024 * (instance_type['root_gb'] +
+                                 instance_type['ephemeral_gb'])
+
+        total_usable_disk_mb = columns.total_usable_disk_gb * 1024
+
+        disk_mb_limit = total_usable_disk_mb * CONF.disk_allocation_ratio
+        used_disk_mb = total_usable_disk_mb - columns.free_disk_mb
+        usable_disk_mb = disk_mb_limit - used_disk_mb
+        return usable_disk_mb >= requested_disk
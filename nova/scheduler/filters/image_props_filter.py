@@ -31,6 +31,8 @@ class ImagePropertiesFilter(filters.BaseHostFilter):
     contained in the image dictionary in the request_spec.
     """
 
+    run_filter_once_per_request = True
+
     def _instance_supported(self, capabilities, image_props):
         img_arch = image_props.get('architecture', None)
         img_h_type = image_props.get('hypervisor_type', None)
@@ -31,6 +31,8 @@ CONF.register_opts(isolated_opts)
 class IsolatedHostsFilter(filters.BaseHostFilter):
     """Returns host."""
 
+    run_filter_once_per_request = True
+
     def host_passes(self, host_state, filter_properties):
         spec = filter_properties.get('request_spec', {})
         props = spec.get('instance_properties', {})
@@ -39,3 +39,6 @@ class NumInstancesFilter(filters.BaseHostFilter):
                         "instances per host is set to %(max_instances)s"),
                         locals())
         return passes
+
+    def filter_columns(self, columns, filter_properties):
+        return columns.num_instances < CONF.max_instances_per_host
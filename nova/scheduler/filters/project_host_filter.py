@@ -13,8 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from oslo.config import cfg
-
+from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova.scheduler import filters
 
@@ -42,6 +41,9 @@ project_host_default_filter=<deny_host_name1>,<deny_host_name2>
 
 class ProjectHostFilter(filters.BaseHostFilter):
     """Filters Hosts by Project-Host Mapping."""
+
+    run_filter_once_per_request = True
+
     def __init__(self):
         self.map={}
         for map_str in CONF.project_host_map:
@@ -53,7 +55,7 @@ class ProjectHostFilter(filters.BaseHostFilter):
         spec = filter_properties.get('request_spec', {})
         props = spec.get('instance_properties', {})
         project_id = props.get('project_id')
-    host_name = host_state.service['host']
+        host_name = host_state.service['host']
         if project_id in self.map:
             return host_name in self.map[project_id]
         return not host_name in CONF.project_host_default_filter
@@ -50,3 +50,14 @@ class RamFilter(filters.BaseHostFilter):
         # save oversubscription limit for compute node to test against:
         host_state.limits['memory_mb'] = memory_mb_limit
         return True
+
+    def filter_columns(self, columns, filter_properties):
+        """Only pass hosts with sufficient available RAM."""
+        instance_type = filter_properties.get('instance_type')
+        requested_ram = instance_type['memory_mb']
+        total_usable_ram_mb = columns.total_usable_ram_mb
+
+        memory_mb_limit = total_usable_ram_mb * CONF.ram_allocation_ratio
+        used_ram_mb = total_usable_ram_mb - columns.free_ram_mb
+        usable_ram = memory_mb_limit - used_ram_mb
+        return usable_ram >= requested_ram
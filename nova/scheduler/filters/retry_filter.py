@@ -24,6 +24,8 @@ class RetryFilter(filters.BaseHostFilter):
     purposes
     """
 
+    run_filter_once_per_request = True
+
     def host_passes(self, host_state, filter_properties):
         """Skip nodes that have already been attempted"""
         retry = filter_properties.get('retry', None)
@@ -48,9 +48,12 @@ import httplib
 import socket
 import ssl
 
+from eventlet import semaphore
+
 from nova.openstack.common import cfg
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
 from nova.scheduler import filters
 
 
@@ -78,6 +81,11 @@ trusted_opts = [
                deprecated_name='auth_blob',
                default=None,
                help='attestation authorization blob - must change'),
+    cfg.IntOpt('attestation_auth_timeout',
+               default=60,
+               help='Number of seconds the trust level of a host returned '
+                    'by the attestation server is cached. Set to 0 to '
+                    'disable caching'),
 ]
 
 CONF = cfg.CONF
@@ -131,81 +139,156 @@ class AttestationService(httplib.HTTPSConnection):
         self.cert_file = None
         self.ca_file = CONF.trusted_computing.attestation_server_ca_file
         self.request_count = 100
+        # Connection kept open across requests, created on first use.
+        # Requests are made one at a time, as they share the connection.
+        self.conn = None
+        self.conn_lock = semaphore.Semaphore()
+        # Host name -> (trust level, expiry timestamp).
+        self.trust_cache = {}
+
+    def _get_connection(self):
+        if self.conn is None:
+            self.conn = HTTPSClientAuthConnection(self.host, self.port,
+                                                  key_file=self.key_file,
+                                                  cert_file=self.cert_file,
+                                                  ca_file=self.ca_file)
+        return self.conn
+
+    def _close_connection(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
 
     def _do_request(self, method, action_url, body, headers):
-        # Connects to the server and issues a request.
-        # :returns: result data
-        # :raises: IOError if the request fails
+        # Issues a request to the server, reusing the open connection.
+        # :returns: status and result data
 
         action_url = "%s/%s" % (self.api_url, action_url)
-        try:
-            c = HTTPSClientAuthConnection(self.host, self.port,
-                                          key_file=self.key_file,
-                                          cert_file=self.cert_file,
-                                          ca_file=self.ca_file)
-            c.request(method, action_url, body, headers)
-            res = c.getresponse()
+        with self.conn_lock:
+            return self._do_locked_request(method, action_url, body,
+                                           headers)
+
+    def _do_locked_request(self, method, action_url, body, headers):
+        # The server may have dropped a connection that was idle, so a
+        # request failing on a reused connection is retried once on a
+        # new one.
+        retry = self.conn is not None
+        while True:
+            try:
+                c = self._get_connection()
+                c.request(method, action_url, body, headers)
+                res = c.getresponse()
+                # Read the whole response so the connection can be reused.
+                data = res.read()
+            except (socket.error, IOError, httplib.HTTPException):
+                self._close_connection()
+                if retry:
+                    retry = False
+                    continue
+                return IOError, None
             status_code = res.status
             if status_code in (httplib.OK,
                                httplib.CREATED,
                                httplib.ACCEPTED,
                                httplib.NO_CONTENT):
-                return httplib.OK, res
+                return httplib.OK, data
             return status_code, None
 
-        except (socket.error, IOError) as e:
-            return IOError, None
-
-    def _request(self, cmd, subcmd, host):
+    def _request(self, cmd, subcmd, hosts):
         body = {}
-        body['count'] = 1
-        body['hosts'] = host
+        body['count'] = len(hosts)
+        body['hosts'] = hosts
         cooked = jsonutils.dumps(body)
         headers = {}
         headers['content-type'] = 'application/json'
         headers['Accept'] = 'application/json'
         if self.auth_blob:
             headers['x-auth-blob'] = self.auth_blob
-        status, res = self._do_request(cmd, subcmd, cooked, headers)
+        status, data = self._do_request(cmd, subcmd, cooked, headers)
         if status == httplib.OK:
-            data = res.read()
             return status, jsonutils.loads(data)
         else:
             return status, None
 
-    def _check_trust(self, data, host):
-        for item in data:
-            for state in item['hosts']:
-                if state['host_name'] == host:
-                    return state['trust_lvl']
-        return ""
+    def get_trust_levels(self, hosts):
+        """Return a dict of host name to trust level for the given hosts.
+
+        Trust levels are cached for attestation_auth_timeout seconds.  The
+        hosts without a cached level are polled with one PollHosts request
+        per request_count hosts.  Hosts that could not be attested are left
+        out of the result.
+        """
+        now = timeutils.utcnow_ts()
+        levels = {}
+        to_poll = []
+        for host in hosts:
+            if host in levels or host in to_poll:
+                continue
+            cached = self.trust_cache.get(host)
+            if cached and cached[1] > now:
+                levels[host] = cached[0]
+            else:
+                to_poll.append(host)
+
+        expiry = now + CONF.trusted_computing.attestation_auth_timeout
+        for i in xrange(0, len(to_poll), self.request_count):
+            polled = to_poll[i:i + self.request_count]
+            status, data = self._request("POST", "PollHosts", polled)
+            if status != httplib.OK:
+                LOG.warn(_("TCP: failed to get the trust state of "
+                           "%(polled)s: %(status)s") % locals())
+                continue
+            for state in data.get('hosts', []):
+                host = state['host_name']
+                if host in polled:
+                    levels[host] = state['trust_lvl']
+                    self.trust_cache[host] = (state['trust_lvl'], expiry)
+        return levels
 
     def do_attestation(self, host):
-        state = []
-        status, data = self._request("POST", "PollHosts", host)
-        if status != httplib.OK:
-            return {}
-        state.append(data)
-        return self._check_trust(state, host)
+        return self.get_trust_levels([host]).get(host, "")
 
 
 class TrustedFilter(filters.BaseHostFilter):
     """Trusted filter to support Trusted Compute Pools."""
 
+    run_filter_once_per_request = True
+
+    # Shared by all instances of the filter, so the connection and the
+    # cached trust levels are kept from one scheduling request to the next.
+    attestation_service = None
+
     def __init__(self):
-        self.attestation_service = AttestationService()
+        if TrustedFilter.attestation_service is None:
+            TrustedFilter.attestation_service = AttestationService()
 
-    def _is_trusted(self, host, trust):
-        level = self.attestation_service.do_attestation(host)
+    @staticmethod
+    def _requested_trust(filter_properties):
+        instance = filter_properties.get('instance_type', {})
+        extra = instance.get('extra_specs', {})
+        return extra.get('trust:trusted_host')
+
+    def _is_trusted(self, host, trust, level):
         LOG.debug(_("TCP: trust state of "
                     "%(host)s:%(level)s(%(trust)s)") % locals())
         return trust == level
 
+    def filter_all(self, filter_obj_list, filter_properties):
+        """Attest all the hosts at once."""
+        trust = self._requested_trust(filter_properties)
+        if not trust:
+            return filter_obj_list
+        host_states = list(filter_obj_list)
+        levels = self.attestation_service.get_trust_levels(
+                [host_state.host for host_state in host_states])
+        return [host_state for host_state in host_states
+                if self._is_trusted(host_state.host, trust,
+                                    levels.get(host_state.host, ""))]
+
     def host_passes(self, host_state, filter_properties):
-        instance = filter_properties.get('instance_type', {})
-        extra = instance.get('extra_specs', {})
-        trust = extra.get('trust:trusted_host')
+        trust = self._requested_trust(filter_properties)
         host = host_state.host
         if trust:
-            return self._is_trusted(host, trust)
+            level = self.attestation_service.do_attestation(host)
+            return self._is_trusted(host, trust, level)
         return True
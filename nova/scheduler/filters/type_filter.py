@@ -25,6 +25,9 @@ class TypeAffinityFilter(filters.BaseHostFilter):
     (dispersion) set to 1 (-1 by default).
     """
 
+    run_filter_once_per_request = True
+    host_data = ('instance_type_ids',)
+
     def host_passes(self, host_state, filter_properties):
         """Dynamically limits hosts to one instance type
 
@@ -33,6 +36,9 @@ class TypeAffinityFilter(filters.BaseHostFilter):
         """
 
         instance_type = filter_properties.get('instance_type')
+        if host_state.instance_type_ids is not None:
+            return not host_state.instance_type_ids - set(
+                    [instance_type['id']])
         context = filter_properties['context'].elevated()
         instances_other_type = db.instance_get_all_by_host_and_not_type(
                      context, host_state.host, instance_type['id'])
@@ -46,10 +52,15 @@ class AggregateTypeAffinityFilter(filters.BaseHostFilter):
     key 'instance_type' has the instance_type name as a value
     """
 
+    run_filter_once_per_request = True
+    host_data = ('aggregate_metadata',)
+
     def host_passes(self, host_state, filter_properties):
         instance_type = filter_properties.get('instance_type')
-        context = filter_properties['context'].elevated()
-        metadata = db.aggregate_metadata_get_by_host(
-                     context, host_state.host, key='instance_type')
-        return (len(metadata) == 0 or
+        metadata = host_state.aggregate_metadata
+        if metadata is None:
+            context = filter_properties['context'].elevated()
+            metadata = db.aggregate_metadata_get_by_host(
+                         context, host_state.host, key='instance_type')
+        return ('instance_type' not in metadata or
                 instance_type['name'] in metadata['instance_type'])
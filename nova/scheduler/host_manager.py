@@ -17,6 +17,8 @@
 Manage hosts in the current zone.
 """
 
+import datetime
+import time
 import UserDict
 
 from nova.compute import task_states
@@ -26,6 +28,7 @@ from nova import exception
 from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
+from nova.scheduler import batch
 from nova.scheduler import filters
 from nova.scheduler import weights
 
@@ -50,10 +53,33 @@ host_manager_opts = [
     cfg.ListOpt('scheduler_weight_classes',
                 default=['nova.scheduler.weights.all_weighers'],
                 help='Which weight class names to use for weighing hosts'),
+    cfg.IntOpt('scheduler_host_state_full_refresh_interval',
+               default=60,
+               help='Number of seconds between full reloads of the compute '
+                    'node records backing the cached host states.  In '
+                    'between, only compute nodes created, updated or '
+                    'deleted since the previous pull are fetched.  Set to '
+                    '0 to reload every compute node on each request.'),
+    cfg.IntOpt('scheduler_host_state_claim_max_age',
+               default=60,
+               help='Number of seconds the resources claimed on a cached '
+                    'host state by a scheduling decision stay claimed, '
+                    'unless the host reports newer usage first.'),
+    cfg.IntOpt('scheduler_host_state_refresh_margin',
+               default=10,
+               help='Number of seconds before the previous pull from which '
+                    'changed compute nodes are fetched again, to allow for '
+                    'clock skew between the scheduler and compute hosts.'),
+    cfg.BoolOpt('scheduler_batch_mode',
+                default=False,
+                help='Place the instances of a multi-instance request in a '
+                     'single vectorized pass over all hosts, when NumPy is '
+                     'available and all filters and weighers support it.'),
     ]
 
 CONF = cfg.CONF
 CONF.register_opts(host_manager_opts)
+CONF.import_opt('compute_topic', 'nova.compute.rpcapi')
 
 LOG = logging.getLogger(__name__)
 
@@ -96,6 +122,15 @@ class HostState(object):
     previously used and lock down access.
     """
 
+    # Compute node stat key prefixes and the per-host counter dict
+    # each one feeds.
+    _stat_prefixes = (
+        ('num_proj_', 'num_instances_by_project'),
+        ('num_vm_', 'vm_states'),
+        ('num_task_', 'task_states'),
+        ('num_os_type_', 'num_instances_by_os_type'),
+    )
+
     def __init__(self, host, node, capabilities=None, service=None):
         self.host = host
         self.nodename = node
@@ -126,6 +161,17 @@ class HostState(object):
         # Resource oversubscription values for the compute host:
         self.limits = {}
 
+        # Per-request data bulk loaded by HostManager.prefetch_host_data().
+        # None when not loaded for the current request.
+        # Aggregate metadata, as db.aggregate_metadata_get_by_host():
+        self.aggregate_metadata = None
+        # Set of the instance type ids of the instances on the host:
+        self.instance_type_ids = None
+
+        # Instances virtually consumed on top of the compute node record,
+        # as (time claimed, instance) in the order they were claimed.
+        self.claims = []
+
         self.updated = None
 
     def update_capabilities(self, capabilities=None, service=None):
@@ -161,42 +207,27 @@ class HostState(object):
         self.vcpus_used = compute['vcpus_used']
         self.updated = compute['updated_at']
 
-        stats = compute.get('stats', [])
-        statmap = self._statmap(stats)
-
-        # Track number of instances on host
-        self.num_instances = int(statmap.get('num_instances', 0))
-
-        # Track number of instances by project_id
-        project_id_keys = [k for k in statmap.keys() if
-                k.startswith("num_proj_")]
-        for key in project_id_keys:
-            project_id = key[9:]
-            self.num_instances_by_project[project_id] = int(statmap[key])
-
-        # Track number of instances in certain vm_states
-        vm_state_keys = [k for k in statmap.keys() if k.startswith("num_vm_")]
-        for key in vm_state_keys:
-            vm_state = key[7:]
-            self.vm_states[vm_state] = int(statmap[key])
-
-        # Track number of instances in certain task_states
-        task_state_keys = [k for k in statmap.keys() if
-                k.startswith("num_task_")]
-        for key in task_state_keys:
-            task_state = key[9:]
-            self.task_states[task_state] = int(statmap[key])
-
-        # Track number of instances by host_type
-        os_keys = [k for k in statmap.keys() if k.startswith("num_os_type_")]
-        for key in os_keys:
-            os = key[12:]
-            self.num_instances_by_os_type[os] = int(statmap[key])
-
-        self.num_io_ops = int(statmap.get('io_workload', 0))
+        # Walk the stats once and dispatch on the key prefix rather than
+        # scanning the whole key list once per stat family.
+        self.num_instances = 0
+        self.num_io_ops = 0
+        for stat in compute.get('stats', []):
+            key = stat['key']
+            if key == 'num_instances':
+                # Track number of instances on host
+                self.num_instances = int(stat['value'])
+            elif key == 'io_workload':
+                self.num_io_ops = int(stat['value'])
+            else:
+                for prefix, counter in self._stat_prefixes:
+                    if key.startswith(prefix):
+                        getattr(self, counter)[key[len(prefix):]] = int(
+                                stat['value'])
+                        break
 
     def consume_from_instance(self, instance):
         """Incrementally update host state from an instance"""
+        self.claims.append((timeutils.utcnow(), instance))
         disk_mb = (instance['root_gb'] + instance['ephemeral_gb']) * 1024
         ram_mb = instance['memory_mb']
         vcpus = instance['vcpus']
@@ -240,9 +271,6 @@ class HostState(object):
                 task_states.IMAGE_BACKUP]:
             self.num_io_ops += 1
 
-    def _statmap(self, stats):
-        return dict((st['key'], st['value']) for st in stats)
-
     def __repr__(self):
         return ("(%s, %s) ram:%s disk:%s io_ops:%s instances:%s vm_type:%s" %
                 (self.host, self.nodename, self.free_ram_mb, self.free_disk_mb,
@@ -259,6 +287,14 @@ class HostManager(object):
         # { (host, hypervisor_hostname) : { <service> : { cap k : v }}}
         self.service_states = {}
         self.host_state_map = {}
+        # { (host, hypervisor_hostname) : compute node }
+        # of the compute record each cached HostState was built from.
+        self.host_state_computes = {}
+        self.host_state_cache_stats = dict(hits=0, misses=0,
+                full_refreshes=0, incremental_refreshes=0,
+                last_refresh_duration=0.0, total_refresh_duration=0.0)
+        self._last_full_refresh = None
+        self._refresh_marker = None
         self.filter_handler = filters.HostFilterHandler()
         self.filter_classes = self.filter_handler.get_matching_classes(
                 CONF.scheduler_available_filters)
@@ -292,9 +328,10 @@ class HostManager(object):
             raise exception.SchedulerHostFilterNotFound(filter_name=msg)
         return good_filters
 
-    def get_filtered_hosts(self, hosts, filter_properties,
-            filter_class_names=None):
-        """Filter hosts and return only ones passing all filters"""
+    def _apply_host_overrides(self, hosts, filter_properties):
+        """Drop the hosts listed in ignore_hosts and, if force_hosts is
+        given, the hosts not listed there.
+        """
 
         def _strip_ignore_hosts(host_map, hosts_to_ignore):
             ignored_hosts = []
@@ -321,7 +358,6 @@ class HostManager(object):
                     '%(forced_hosts_str)s')
             LOG.debug(msg, locals())
 
-        filter_classes = self._choose_host_filters(filter_class_names)
         ignore_hosts = filter_properties.get('ignore_hosts', [])
         force_hosts = filter_properties.get('force_hosts', [])
         if ignore_hosts or force_hosts:
@@ -330,13 +366,67 @@ class HostManager(object):
                 _strip_ignore_hosts(name_to_cls_map, ignore_hosts)
             if force_hosts:
                 _match_forced_hosts(name_to_cls_map, force_hosts)
-            if not name_to_cls_map:
-                return []
-            hosts = name_to_cls_map.itervalues()
+            return name_to_cls_map.values()
+        return hosts
+
+    def get_filtered_hosts(self, hosts, filter_properties,
+            filter_class_names=None):
+        """Filter hosts and return only ones passing all filters"""
+        filter_classes = self._choose_host_filters(filter_class_names)
+        hosts = self._apply_host_overrides(hosts, filter_properties)
+        if not hosts:
+            return []
 
         return self.filter_handler.get_filtered_objects(filter_classes,
                 hosts, filter_properties)
 
+    def get_batch_weighed_hosts(self, hosts, filter_properties,
+            instance_properties, num_instances, filter_class_names=None):
+        """Filter and weigh hosts for num_instances instances at once.
+
+        Returns the list of WeighedHosts chosen, one per instance placed,
+        or None if batch scheduling is disabled or not supported by the
+        filters and weighers in use.
+        """
+        if not CONF.scheduler_batch_mode or not batch.is_available():
+            return None
+        filter_classes = self._choose_host_filters(filter_class_names)
+        hosts = self._apply_host_overrides(hosts, filter_properties)
+        return batch.select_hosts(hosts, filter_classes, self.weight_classes,
+                filter_properties, instance_properties, num_instances,
+                self.weight_handler.object_class)
+
+    def prefetch_host_data(self, context, hosts, filter_class_names=None):
+        """Bulk load the per-host data the filters in use read from the
+        HostStates (see BaseHostFilter.host_data), with one query per kind
+        of data for all hosts rather than one per host in each filter.
+        Data no filter needs is reset to None.
+        """
+        filter_classes = self._choose_host_filters(filter_class_names)
+        needed = set()
+        for filter_cls in filter_classes:
+            needed.update(filter_cls.host_data)
+
+        aggregate_metadata = None
+        if 'aggregate_metadata' in needed:
+            aggregate_metadata = db.aggregate_metadata_get_all_by_host(
+                    context)
+        instance_type_ids = None
+        if 'instance_type_ids' in needed:
+            instance_type_ids = db.instance_type_ids_get_all_by_host(context)
+
+        for host_state in hosts:
+            if aggregate_metadata is None:
+                host_state.aggregate_metadata = None
+            else:
+                host_state.aggregate_metadata = aggregate_metadata.get(
+                        host_state.host, {})
+            if instance_type_ids is None:
+                host_state.instance_type_ids = None
+            else:
+                host_state.instance_type_ids = instance_type_ids.get(
+                        host_state.host, set())
+
     def get_weighed_hosts(self, hosts, weight_properties):
         """Weigh the hosts"""
         return self.weight_handler.get_weighed_objects(self.weight_classes,
@@ -358,14 +448,84 @@ class HostManager(object):
         capab_copy["timestamp"] = timeutils.utcnow()  # Reported time
         self.service_states[state_key] = capab_copy
 
+    def _needs_full_refresh(self):
+        interval = CONF.scheduler_host_state_full_refresh_interval
+        if (interval <= 0 or self._last_full_refresh is None or
+                self._refresh_marker is None):
+            return True
+        return timeutils.is_older_than(self._last_full_refresh, interval)
+
+    def _remove_host_state(self, state_key):
+        self.host_state_map.pop(state_key, None)
+        self.host_state_computes.pop(state_key, None)
+
+    def _build_host_state(self, state_key, compute, capabilities, service,
+                          claims=None):
+        """Build a HostState from a compute node and apply claims."""
+        host, node = state_key
+        host_state = self.host_state_cls(host, node,
+                capabilities=capabilities, service=service)
+        host_state.update_from_compute_node(compute)
+        claims = claims or []
+        for _claimed_at, instance in claims:
+            host_state.consume_from_instance(instance)
+        host_state.claims = claims
+        self.host_state_map[state_key] = host_state
+        self.host_state_computes[state_key] = compute
+
+    def _expire_claims(self):
+        """Rebuild the host states holding claims that are too old."""
+        max_age = CONF.scheduler_host_state_claim_max_age
+        for state_key, host_state in self.host_state_map.items():
+            if not (host_state.claims and
+                    timeutils.is_older_than(host_state.claims[0][0],
+                                            max_age)):
+                continue
+            claims = [claim for claim in host_state.claims
+                      if not timeutils.is_older_than(claim[0], max_age)]
+            self._build_host_state(state_key,
+                                   self.host_state_computes[state_key],
+                                   host_state.capabilities,
+                                   host_state.service, claims)
+
+    def _get_compute_services(self, context):
+        """Return the compute service records by host."""
+        return dict((service['host'], service)
+                    for service in db.service_get_all(context)
+                    if service['topic'] == CONF.compute_topic)
+
     def get_all_host_states(self, context):
         """Returns a list of HostStates that represents all the hosts
         the HostManager knows about. Also, each of the consumable resources
         in HostState are pre-populated and adjusted based on data in the db.
+
+        HostStates are cached between calls.  Every
+        scheduler_host_state_full_refresh_interval seconds all compute nodes
+        are reloaded; in between only the compute nodes changed since the
+        previous pull are fetched.  Resources virtually consumed by
+        consume_from_instance() are claims on top of the compute node the
+        HostState was built from.  They are dropped when that compute node
+        is read again, on a full reload or when its updated_at moved, and
+        once they are older than scheduler_host_state_claim_max_age.
+        Service records, which compute hosts update with every heartbeat,
+        are read on every pull for all the hosts.
         """
+        start = time.time()
+        query_time = timeutils.utcnow()
+        full_refresh = self._needs_full_refresh()
+        if full_refresh:
+            # Get resource usage across the available compute nodes:
+            compute_nodes = db.compute_node_get_all(context)
+            self._last_full_refresh = timeutils.utcnow()
+            self.host_state_cache_stats['full_refreshes'] += 1
+        else:
+            compute_nodes = db.compute_node_get_all_updated_since(context,
+                    self._refresh_marker)
+            services = self._get_compute_services(context)
+            self.host_state_cache_stats['incremental_refreshes'] += 1
 
-        # Get resource usage across the available compute nodes:
-        compute_nodes = db.compute_node_get_all(context)
+        seen_keys = set()
+        misses = 0
         for compute in compute_nodes:
             service = compute['service']
             if not service:
@@ -374,16 +534,57 @@ class HostManager(object):
             host = service['host']
             node = compute.get('hypervisor_hostname')
             state_key = (host, node)
+            if compute.get('deleted'):
+                # A compute node may have been deleted and created again
+                # since the last pull.
+                if state_key not in seen_keys:
+                    self._remove_host_state(state_key)
+                continue
+            seen_keys.add(state_key)
             capabilities = self.service_states.get(state_key, None)
-            host_state = self.host_state_map.get(state_key)
-            if host_state:
-                host_state.update_capabilities(capabilities,
-                                               dict(service.iteritems()))
+            service = dict(service.iteritems())
+            cached = self.host_state_computes.get(state_key)
+            updated_at = compute.get('updated_at')
+            if (full_refresh or cached is None or updated_at is None or
+                    cached.get('updated_at') != updated_at):
+                self._build_host_state(state_key, compute, capabilities,
+                                       service)
+                misses += 1
             else:
-                host_state = self.host_state_cls(host, node,
-                        capabilities=capabilities,
-                        service=dict(service.iteritems()))
-                self.host_state_map[state_key] = host_state
-            host_state.update_from_compute_node(compute)
+                self.host_state_map[state_key].update_capabilities(
+                        capabilities, service)
+
+        if full_refresh:
+            # Drop compute nodes that no longer exist.
+            for state_key in self.host_state_map.keys():
+                if state_key not in seen_keys:
+                    self._remove_host_state(state_key)
+        else:
+            # Keep the service liveness and capabilities of the hosts whose
+            # compute node did not change current.
+            for state_key, host_state in self.host_state_map.iteritems():
+                service = services.get(state_key[0])
+                if state_key in seen_keys or service is None:
+                    continue
+                host_state.update_capabilities(
+                        self.service_states.get(state_key, None),
+                        dict(service.iteritems()))
+            self._expire_claims()
+        # Compute nodes are stamped by the clocks of their own hosts, so
+        # the next pull starts a margin before this one was made.
+        self._refresh_marker = query_time - datetime.timedelta(
+                seconds=CONF.scheduler_host_state_refresh_margin)
+
+        duration = time.time() - start
+        stats = self.host_state_cache_stats
+        stats['misses'] += misses
+        stats['hits'] += len(self.host_state_map) - misses
+        stats['last_refresh_duration'] = duration
+        stats['total_refresh_duration'] += duration
+        LOG.debug(_("Refreshed %(num_hosts)d host states (%(kind)s, "
+                    "%(misses)d rebuilt) in %(duration).3f seconds"),
+                  {'num_hosts': len(self.host_state_map),
+                   'kind': 'full' if full_refresh else 'incremental',
+                   'misses': misses, 'duration': duration})
 
         return self.host_state_map.itervalues()
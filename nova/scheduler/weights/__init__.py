@@ -40,7 +40,17 @@ class WeighedHost(weights.WeighedObject):
 
 class BaseHostWeigher(weights.BaseWeigher):
     """Base class for host weights."""
-    pass
+
+    def weigh_columns(self, columns, weight_properties):
+        """Return an array with the weight of every host in the given
+        nova.scheduler.batch.HostColumns, before the weight multiplier
+        is applied.
+
+        Override this in a subclass to allow the weigher to be used for
+        batch scheduling.  It must give the same answers as
+        _weigh_object().  Returns None if the weigher doesn't support it.
+        """
+        return None
 
 
 class HostWeightHandler(weights.BaseWeightHandler):
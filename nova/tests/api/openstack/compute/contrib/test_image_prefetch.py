@@ -0,0 +1,95 @@
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from lxml import etree
+import webob.exc
+
+from nova.api.openstack.compute.contrib import image_prefetch
+from nova.compute import api as compute_api
+from nova import exception
+from nova import test
+from nova.tests.api.openstack import fakes
+
+
+def fake_prefetch_image(self, context, image_id, hosts=None,
+                        aggregate_id=None):
+    if image_id == 'missing':
+        raise exception.ImageNotFound(image_id=image_id)
+    if aggregate_id is not None:
+        if aggregate_id != 1:
+            raise exception.AggregateNotFound(aggregate_id=aggregate_id)
+        hosts = ['host_a1', 'host_a2']
+    if len(hosts) > 2:
+        raise exception.ImagePrefetchTooManyHosts(count=len(hosts), max=2)
+    return [{'host': host, 'status': 'fetched'} for host in hosts]
+
+
+class ImagePrefetchTest(test.TestCase):
+
+    def setUp(self):
+        super(ImagePrefetchTest, self).setUp()
+        self.stubs.Set(compute_api.HostAPI, 'prefetch_image',
+                       fake_prefetch_image)
+        self.controller = image_prefetch.ImagePrefetchController()
+        self.req = fakes.HTTPRequest.blank('/v2/fake/os-image-prefetch',
+                                           use_admin_context=True)
+
+    def test_prefetch_on_hosts(self):
+        body = {'prefetch': {'image_id': 'fake', 'hosts': ['h1', 'h2']}}
+        res = self.controller.create(self.req, body)
+        self.assertEqual(res, {'prefetch': {'image_id': 'fake',
+                'hosts': [{'host': 'h1', 'status': 'fetched'},
+                          {'host': 'h2', 'status': 'fetched'}]}})
+
+    def test_prefetch_on_aggregate(self):
+        body = {'prefetch': {'image_id': 'fake', 'aggregate_id': 1}}
+        res = self.controller.create(self.req, body)
+        self.assertEqual([host['host'] for host in res['prefetch']['hosts']],
+                         ['host_a1', 'host_a2'])
+
+    def test_prefetch_needs_hosts_or_aggregate(self):
+        for prefetch in ({'image_id': 'fake'},
+                         {'image_id': 'fake', 'hosts': ['h1'],
+                          'aggregate_id': 1},
+                         {'image_id': 'fake', 'hosts': 'h1'},
+                         {'image_id': 'fake', 'hosts': ['h1', None]},
+                         {'image_id': 'fake', 'hosts': [['h1']]},
+                         {'image_id': 'fake', 'hosts': ['h1', 'h2', 'h3']},
+                         {'hosts': ['h1']}):
+            self.assertRaises(webob.exc.HTTPBadRequest,
+                              self.controller.create, self.req,
+                              {'prefetch': prefetch})
+
+    def test_prefetch_not_found(self):
+        for prefetch in ({'image_id': 'missing', 'hosts': ['h1']},
+                         {'image_id': 'fake', 'aggregate_id': 2}):
+            self.assertRaises(webob.exc.HTTPNotFound,
+                              self.controller.create, self.req,
+                              {'prefetch': prefetch})
+
+
+class ImagePrefetchSerializerTest(test.TestCase):
+    def test_serializer(self):
+        serializer = image_prefetch.ImagePrefetchTemplate()
+        text = serializer.serialize({'prefetch': {'image_id': 'fake',
+                'hosts': [{'host': 'h1', 'status': 'fetched'},
+                          {'host': 'h2', 'status': 'unsupported'}]}})
+        tree = etree.fromstring(text)
+
+        self.assertEqual(tree.tag, 'prefetch')
+        self.assertEqual(tree.get('image_id'), 'fake')
+        self.assertEqual([(host.get('host'), host.get('status'))
+                          for host in tree.find('hosts')],
+                         [('h1', 'fetched'), ('h2', 'unsupported')])
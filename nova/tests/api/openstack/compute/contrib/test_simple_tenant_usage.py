@@ -60,17 +60,22 @@ def get_fake_db_instance(start, end, instance_id, tenant_id):
             'user_id': 'fakeuser',
             'display_name': 'name',
             'state_description': 'state',
+            'vm_state': 'active',
             'instance_type_id': 1,
             'launched_at': start,
             'terminated_at': end}
 
 
-def fake_instance_get_active_by_window(self, context, begin, end, project_id):
-            return [get_fake_db_instance(START,
-                                         STOP,
-                                         x,
-                                         "faketenant_%s" % (x / SERVERS))
-                                         for x in xrange(TENANTS * SERVERS)]
+def fake_instance_get_active_by_window_columns(self, context, columns, begin,
+                                               end, project_id):
+    instances = [get_fake_db_instance(START,
+                                      STOP,
+                                      x,
+                                      "faketenant_%s" % (x / SERVERS))
+                 for x in xrange(TENANTS * SERVERS)]
+    return [tuple(instance[column] for column in columns)
+            for instance in instances
+            if project_id in (None, instance['project_id'])]
 
 
 class SimpleTenantUsageTest(test.TestCase):
@@ -78,8 +83,8 @@ class SimpleTenantUsageTest(test.TestCase):
         super(SimpleTenantUsageTest, self).setUp()
         self.stubs.Set(api.API, "get_instance_type",
                        fake_instance_type_get)
-        self.stubs.Set(api.API, "get_active_by_window",
-                       fake_instance_get_active_by_window)
+        self.stubs.Set(api.API, "get_active_by_window_columns",
+                       fake_instance_get_active_by_window_columns)
         self.admin_context = context.RequestContext('fakeadmin_0',
                                                     'faketenant_0',
                                                     is_admin=True)
@@ -183,6 +183,7 @@ class ExtensionControllerTest(ExtensionTestCase):
             "FloatingIpsBulk",
             "Fox In Socks",
             "Hosts",
+            "ImagePrefetch",
             "Keypairs",
             "Multinic",
             "MultipleCreate",
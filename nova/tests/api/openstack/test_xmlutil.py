@@ -652,6 +652,75 @@ class TemplateTest(test.TestCase):
                          str(obj['test']['image']['id']))
         self.assertEqual(result[idx].text, obj['test']['image']['name'])
 
+    def _make_master(self):
+        root = xmlutil.TemplateElement('tests')
+        elem = xmlutil.SubTemplateElement(root, 'test', selector='tests',
+                                          name='name')
+        value = xmlutil.SubTemplateElement(elem, 'value', selector='values')
+        value.text = xmlutil.Selector()
+        attrs = xmlutil.SubTemplateElement(elem, 'attrs', selector='attrs')
+        xmlutil.SubTemplateElement(attrs, 'attr', selector=xmlutil.get_items,
+                                   key=0, value=1)
+        return xmlutil.MasterTemplate(root, 1, nsmap=dict(f='foo'))
+
+    def _make_slave(self):
+        root = xmlutil.TemplateElement('tests')
+        elem = xmlutil.SubTemplateElement(root, 'test', selector='tests')
+        elem.set('{bar}name', 'name')
+        image = xmlutil.SubTemplateElement(elem, 'image',
+                                           selector='image', id='id')
+        image.text = xmlutil.Selector('name')
+        return xmlutil.SlaveTemplate(root, 1, nsmap=dict(b='bar'))
+
+    def test_make_tree(self):
+        obj = {
+            'tests': [
+                {'name': 'foobar',
+                 'values': [1, 2, 3],
+                 'attrs': {'a': 1, 'b': 2},
+                 'image': {'name': 'image_foobar', 'id': 42}},
+                {'name': 'foobaz',
+                 'values': [],
+                 'image': {'id': 43}},
+                {'attrs': {}},
+                ],
+            }
+        master = self._make_master()
+        master.attach(self._make_slave())
+
+        expected = master._serialize(None, obj, master._siblings(),
+                                     master._nsmap())
+        result = master.make_tree(obj)
+
+        self.assertEqual(etree.tostring(result), etree.tostring(expected))
+
+    def test_compile_cached(self):
+        master = self._make_master()
+        slave = self._make_slave()
+
+        # Copies share the compiled template...
+        compiled = master._compile()
+        self.assertEqual(master.copy()._compile(), compiled)
+
+        # ...unless slaves are attached
+        copy = master.copy()
+        copy.attach(slave)
+        compiled_slave = copy._compile()
+        self.assertNotEqual(compiled_slave, compiled)
+        self.assertEqual(master._compile(), compiled)
+
+        copy = master.copy()
+        copy.attach(slave)
+        self.assertEqual(copy._compile(), compiled_slave)
+
+    def test_compile_template_changed(self):
+        master = self._make_master()
+        obj = {'tests': [{'name': 'foobar', 'id': 42}]}
+        self.assertEqual(master.make_tree(obj)[0].get('id'), None)
+
+        master.root['test'].set('id')
+        self.assertEqual(master.make_tree(obj)[0].get('id'), '42')
+
 
 class MasterTemplateBuilder(xmlutil.TemplateBuilder):
     def construct(self):
@@ -2858,6 +2858,49 @@ class ComputeTestCase(BaseTestCase):
         self.assertEqual(call_info['get_by_uuid'], 3)
         self.assertEqual(call_info['get_nw_info'], 4)
 
+    def test_poll_bandwidth_usage(self):
+        ctxt = context.get_admin_context()
+        start_time = datetime.datetime(2013, 1, 2)
+        prev_time = datetime.datetime(2013, 1, 1)
+        db.bw_usage_update(ctxt, 'fake_uuid1', 'fake_mac1', start_time,
+                           100, 200, 1000, 2000)
+        db.bw_usage_update(ctxt, 'fake_uuid1', 'fake_mac2', prev_time,
+                           10, 20, 3000, 4000)
+        bw_counters = [{'uuid': 'fake_uuid1', 'mac_address': 'fake_mac1',
+                        'bw_in': 1500, 'bw_out': 500},
+                       {'uuid': 'fake_uuid1', 'mac_address': 'fake_mac2',
+                        'bw_in': 3100, 'bw_out': 4200},
+                       {'uuid': 'fake_uuid2', 'mac_address': 'fake_mac3',
+                        'bw_in': 10, 'bw_out': 20}]
+
+        def fake_bw_usage_get(*args, **kwargs):
+            self.fail('bandwidth usage looked up per interface')
+
+        self.stubs.Set(utils, 'last_completed_audit_period',
+                       lambda: (prev_time, start_time))
+        self.stubs.Set(self.compute.conductor_api, 'instance_get_all_by_host',
+                       lambda context, host: [])
+        self.stubs.Set(self.compute.conductor_api, 'bw_usage_get',
+                       fake_bw_usage_get)
+        self.stubs.Set(self.compute.driver, 'get_all_bw_counters',
+                       lambda instances: bw_counters)
+        self.flags(bandwidth_poll_interval=1)
+        self.compute._last_bw_usage_poll = 0
+
+        self.compute._poll_bandwidth_usage(ctxt)
+
+        bw_usages = db.bw_usage_get_by_uuids(ctxt,
+                ['fake_uuid1', 'fake_uuid2'], start_time)
+        # Counter rollover on the outbound side of fake_mac1, counters
+        # continuing from the previous period on fake_mac2 and a new
+        # interface without history on fake_mac3.
+        self.assertEqual([('fake_mac1', 600, 700, 1500, 500),
+                          ('fake_mac2', 100, 200, 3100, 4200),
+                          ('fake_mac3', 0, 0, 10, 20)],
+                         sorted((u['mac'], u['bw_in'], u['bw_out'],
+                                 u['last_ctr_in'], u['last_ctr_out'])
+                                for u in bw_usages))
+
     def test_poll_rescued_instances(self):
         timed_out_time = timeutils.utcnow() - datetime.timedelta(minutes=5)
         not_timed_out_time = timeutils.utcnow()
@@ -3245,7 +3288,7 @@ class ComputeTestCase(BaseTestCase):
         all_instances = []
         driver_instances = []
         for x in xrange(10):
-            instance = dict(name=uuidutils.generate_uuid())
+            instance = dict(name=uuidutils.generate_uuid(), deleted=False)
             if x % 2:
                 driver_instances.append(instance)
             all_instances.append(instance)
@@ -3255,14 +3298,15 @@ class ComputeTestCase(BaseTestCase):
         self.mox.StubOutWithMock(self.compute.driver,
                 'list_instances')
         self.mox.StubOutWithMock(self.compute.conductor_api,
-                'instance_get_all')
+                'instance_iter_by_filters')
 
         self.compute.driver.list_instance_uuids().AndRaise(
                 NotImplementedError())
         self.compute.driver.list_instances().AndReturn(
                 [inst['name'] for inst in driver_instances])
-        self.compute.conductor_api.instance_get_all(
-                fake_context).AndReturn(all_instances)
+        filters = {'deleted': False, 'soft_deleted': True}
+        self.compute.conductor_api.instance_iter_by_filters(
+                fake_context, filters).AndReturn(iter(all_instances))
 
         self.mox.ReplayAll()
 
@@ -5900,6 +5944,87 @@ class ComputeHostAPITestCase(BaseTestCase):
                  'args': {'host': 'fake_host', 'mode': 'fake_mode'},
                  'version': compute_rpcapi.ComputeAPI.BASE_RPC_API_VERSION})
 
+    def _stub_prefetch_rollout(self, call_info):
+        def fake_prefetch_image_on_hosts(context, image_id, hosts):
+            call_info['rollout'] = (context, image_id, hosts)
+            return [{'host': host, 'status': 'fetched'} for host in hosts]
+        self.stubs.Set(self.host_api, '_prefetch_image_on_hosts',
+                       fake_prefetch_image_on_hosts)
+
+    def test_prefetch_image_on_hosts(self):
+        ctxt = context.get_admin_context()
+        _create_service_entries(ctxt)
+        call_info = {}
+        self._stub_prefetch_rollout(call_info)
+
+        results = self.host_api.prefetch_image(ctxt, 'fake_image',
+                hosts=['fake_host1', 'fake_host3'])
+        self.assertEqual(results, [{'host': 'fake_host1',
+                                    'status': 'fetched'},
+                                   {'host': 'fake_host3',
+                                    'status': 'fetched'}])
+        self.assertEqual(call_info['rollout'],
+                         (ctxt, 'fake_image', ['fake_host1', 'fake_host3']))
+
+    def test_prefetch_image_on_aggregate(self):
+        ctxt = context.get_admin_context()
+        _create_service_entries(ctxt)
+        aggr = db.aggregate_create(ctxt, {'name': 'fake_aggregate'})
+        db.aggregate_host_add(ctxt, aggr['id'], 'fake_host2')
+        call_info = {}
+        self._stub_prefetch_rollout(call_info)
+
+        self.host_api.prefetch_image(ctxt, 'fake_image',
+                                     aggregate_id=aggr['id'])
+        self.assertEqual(call_info['rollout'][2], ['fake_host2'])
+
+    def test_prefetch_image_unknown_host(self):
+        ctxt = context.get_admin_context()
+        call_info = {}
+        self._stub_prefetch_rollout(call_info)
+
+        self.assertRaises(exception.ComputeHostNotFound,
+                          self.host_api.prefetch_image, ctxt, 'fake_image',
+                          hosts=['no_such_host'])
+        self.assertFalse('rollout' in call_info)
+
+    def test_prefetch_image_too_many_hosts(self):
+        self.flags(image_prefetch_max_hosts=1)
+        ctxt = context.get_admin_context()
+        _create_service_entries(ctxt)
+        call_info = {}
+        self._stub_prefetch_rollout(call_info)
+
+        self.assertRaises(exception.ImagePrefetchTooManyHosts,
+                          self.host_api.prefetch_image, ctxt, 'fake_image',
+                          hosts=['fake_host1', 'fake_host3'])
+        self.assertFalse('rollout' in call_info)
+
+    def test_prefetch_image_rollout(self):
+        self.flags(image_prefetch_concurrency=2)
+        ctxt = context.RequestContext('fake', 'fake')
+        topics = []
+
+        def fake_rpc_call(context, topic, msg, timeout=None):
+            self.assertEqual(msg['method'], 'prefetch_image')
+            self.assertEqual(msg['args'], {'image_id': 'fake_image'})
+            topics.append(topic)
+            if topic == 'compute.host2':
+                raise rpc_common.Timeout()
+            if topic == 'compute.host3':
+                raise NotImplementedError()
+        self.stubs.Set(rpc, 'call', fake_rpc_call)
+
+        # A failure on one host does not stop the rollout
+        results = self.host_api._prefetch_image_on_hosts(ctxt, 'fake_image',
+                ['host1', 'host2', 'host3', 'host4'])
+        self.assertEqual(sorted(topics), ['compute.host1', 'compute.host2',
+                                          'compute.host3', 'compute.host4'])
+        self.assertEqual(results, [{'host': 'host1', 'status': 'fetched'},
+                                   {'host': 'host2', 'status': 'failed'},
+                                   {'host': 'host3', 'status': 'unsupported'},
+                                   {'host': 'host4', 'status': 'fetched'}])
+
 
 class KeypairAPITestCase(BaseTestCase):
     def setUp(self):
@@ -325,6 +325,10 @@ class ComputeRpcAPITestCase(test.TestCase):
     def test_get_host_uptime(self):
         self._test_compute_api('get_host_uptime', 'call', host='host')
 
+    def test_prefetch_image(self):
+        self._test_compute_api('prefetch_image', 'call',
+                image_id='id', host='host', version='2.22')
+
     def test_snapshot_instance(self):
         self._test_compute_api('snapshot_instance', 'cast',
                 instance=self.fake_instance, image_id='id', image_type='type',
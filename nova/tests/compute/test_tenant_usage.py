@@ -0,0 +1,129 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For tenant usage aggregation.
+"""
+
+import datetime
+import random
+
+from nova.compute import tenant_usage
+from nova import test
+
+START = datetime.datetime(2013, 1, 1)
+STOP = datetime.datetime(2013, 1, 2)
+
+FLAVORS = {
+    1: {'name': 'm1.tiny', 'vcpus': 1, 'memory_mb': 512,
+        'root_gb': 0, 'ephemeral_gb': 0},
+    2: {'name': 'm1.small', 'vcpus': 1, 'memory_mb': 2048,
+        'root_gb': 20, 'ephemeral_gb': 0},
+    3: {'name': 'm1.large', 'vcpus': 4, 'memory_mb': 8192,
+        'root_gb': 80, 'ephemeral_gb': 20},
+}
+
+
+def _rows(seed, count):
+    rand = random.Random(seed)
+    rows = []
+    for x in xrange(count):
+        launched_at = None
+        terminated_at = None
+        if rand.random() < 0.9:
+            launched_at = START + datetime.timedelta(
+                    seconds=rand.randint(-86400, 86400),
+                    microseconds=rand.randint(0, 999999))
+            if rand.random() < 0.5:
+                terminated_at = launched_at + datetime.timedelta(
+                        seconds=rand.randint(0, 2 * 86400),
+                        microseconds=rand.randint(0, 999999))
+        rows.append(('tenant%d' % rand.randint(0, 5),
+                     rand.choice([1, 2, 3, 4]),
+                     launched_at, terminated_at,
+                     'uuid%d' % x, 'server%d' % x, 'active'))
+    return rows
+
+
+class TenantUsageTestCase(test.TestCase):
+    """Test case for tenant usage aggregation."""
+
+    def _usages(self, rows, detailed=True):
+        return tenant_usage.tenant_usages(rows, FLAVORS, START, STOP,
+                                          detailed=detailed)
+
+    def test_hours_for(self):
+        hour = datetime.timedelta(hours=1)
+        self.assertEqual(24, tenant_usage.hours_for(START - hour, None,
+                                                    START, STOP))
+        self.assertEqual(1, tenant_usage.hours_for(START, START + hour,
+                                                   START, STOP))
+        self.assertEqual(0, tenant_usage.hours_for(None, None, START, STOP))
+        self.assertEqual(0, tenant_usage.hours_for(START - 2 * hour,
+                                                   START - hour,
+                                                   START, STOP))
+        self.assertEqual(0, tenant_usage.hours_for(STOP + hour, None,
+                                                   START, STOP))
+
+    def test_totals(self):
+        rows = [('tenant1', 1, START, None, 'uuid1', 'server1', 'active'),
+                ('tenant1', 3, START, START + datetime.timedelta(hours=6),
+                 'uuid2', 'server2', 'deleted'),
+                ('tenant2', 2, None, None, 'uuid3', 'server3', 'building')]
+        usages = self._usages(rows)
+
+        self.assertEqual(['tenant1', 'tenant2'],
+                         [usage['tenant_id'] for usage in usages])
+        usage = usages[0]
+        self.assertEqual(30, usage['total_hours'])
+        self.assertEqual(24 + 4 * 6, usage['total_vcpus_usage'])
+        self.assertEqual(512 * 24 + 8192 * 6, usage['total_memory_mb_usage'])
+        self.assertEqual(100 * 6, usage['total_local_gb_usage'])
+        self.assertEqual(START, usage['start'])
+        self.assertEqual(STOP, usage['stop'])
+        self.assertEqual(['active', 'terminated'],
+                         [server['state']
+                          for server in usage['server_usages']])
+        self.assertEqual(0, usages[1]['total_hours'])
+
+    def test_not_detailed(self):
+        rows = [row[:4] for row in _rows(1, 20)]
+        for usage in self._usages(rows, detailed=False):
+            self.assertFalse('server_usages' in usage)
+
+    def test_unknown_flavor_not_billed(self):
+        rows = [('tenant1', 4, START, None, 'uuid1', 'server1', 'active')]
+        self.assertEqual([], self._usages(rows))
+
+    def test_arrays_match_rows(self):
+        if not tenant_usage.is_available():
+            self.skipTest('NumPy is not available')
+        rows = _rows(2, 500)
+        usages = self._usages(rows)
+
+        self.stubs.Set(tenant_usage, 'numpy', None)
+        expected = self._usages(rows)
+
+        self.assertEqual(len(expected), len(usages))
+        for usage, expected_usage in zip(usages, expected):
+            for key in ('total_hours', 'total_vcpus_usage',
+                        'total_memory_mb_usage', 'total_local_gb_usage'):
+                self.assertAlmostEqual(expected_usage[key], usage[key],
+                                       places=6)
+            for server, expected_server in zip(
+                    usage['server_usages'], expected_usage['server_usages']):
+                self.assertAlmostEqual(expected_server['hours'],
+                                       server['hours'], places=9)
@@ -208,6 +208,23 @@ class _BaseTestCase(object):
         result = self.conductor.bw_usage_update(*update_args)
         self.assertEqual(result, 'foo')
 
+    def test_bw_usage_get_by_periods(self):
+        self.mox.StubOutWithMock(db, 'bw_usage_get_by_uuids')
+        db.bw_usage_get_by_uuids(self.context, ['uuid'], 0).AndReturn(['foo'])
+        db.bw_usage_get_by_uuids(self.context, ['uuid'], 1).AndReturn([])
+        self.mox.ReplayAll()
+        result = self.conductor.bw_usage_get_by_periods(self.context,
+                                                        ['uuid'], [0, 1])
+        self.assertEqual(result, [['foo'], []])
+
+    def test_bw_usage_update_multi(self):
+        usages = [{'uuid': 'uuid', 'mac': 'mac', 'bw_in': 10, 'bw_out': 20,
+                   'last_ctr_in': 5, 'last_ctr_out': 10}]
+        self.mox.StubOutWithMock(db, 'bw_usage_update_multi')
+        db.bw_usage_update_multi(self.context, 0, usages, 20)
+        self.mox.ReplayAll()
+        self.conductor.bw_usage_update_multi(self.context, 0, usages, 20)
+
     def test_get_backdoor_port(self):
         backdoor_port = 59697
 
@@ -401,7 +418,8 @@ class ConductorTestCase(_BaseTestCase, test.TestCase):
         filters = {'foo': 'bar'}
         self.mox.StubOutWithMock(db, 'instance_get_all_by_filters')
         db.instance_get_all_by_filters(self.context, filters,
-                                       'fake-key', 'fake-sort')
+                                       'fake-key', 'fake-sort',
+                                       limit=None, marker=None)
         self.mox.ReplayAll()
         self.conductor.instance_get_all_by_filters(self.context, filters,
                                                    'fake-key', 'fake-sort')
@@ -492,7 +510,8 @@ class ConductorRPCAPITestCase(_BaseTestCase, test.TestCase):
         filters = {'foo': 'bar'}
         self.mox.StubOutWithMock(db, 'instance_get_all_by_filters')
         db.instance_get_all_by_filters(self.context, filters,
-                                       'fake-key', 'fake-sort')
+                                       'fake-key', 'fake-sort',
+                                       limit=None, marker=None)
         self.mox.ReplayAll()
         self.conductor.instance_get_all_by_filters(self.context, filters,
                                                    'fake-key', 'fake-sort')
@@ -597,7 +616,8 @@ class ConductorAPITestCase(_BaseTestCase, test.TestCase):
         db.instance_get_all(self.context)
         db.instance_get_all_by_host(self.context.elevated(), 'fake-host')
         db.instance_get_all_by_filters(self.context, {'name': 'fake-inst'},
-                                       'updated_at', 'asc')
+                                       'updated_at', 'asc',
+                                       limit=None, marker=None)
         self.mox.ReplayAll()
         self.conductor.instance_get_all(self.context)
         self.conductor.instance_get_all_by_host(self.context, 'fake-host')
@@ -605,6 +625,23 @@ class ConductorAPITestCase(_BaseTestCase, test.TestCase):
                                                    {'name': 'fake-inst'},
                                                    'updated_at', 'asc')
 
+    def test_instance_iter_by_filters(self):
+        self.flags(instance_iter_page_size=2)
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_filters')
+        db.instance_get_all_by_filters(self.context, {'host': 'fake-host'},
+                                       'id', 'asc', limit=2,
+                                       marker=None).AndReturn(
+            [{'uuid': 'fake-uuid1'}, {'uuid': 'fake-uuid2'}])
+        db.instance_get_all_by_filters(self.context, {'host': 'fake-host'},
+                                       'id', 'asc', limit=2,
+                                       marker='fake-uuid2').AndReturn(
+            [{'uuid': 'fake-uuid3'}])
+        self.mox.ReplayAll()
+        result = self.conductor.instance_iter_by_filters(
+            self.context, {'host': 'fake-host'})
+        self.assertEqual(['fake-uuid1', 'fake-uuid2', 'fake-uuid3'],
+                         [instance['uuid'] for instance in result])
+
     def _test_stubbed(self, name, *args):
         self.mox.StubOutWithMock(db, name)
         getattr(db, name)(self.context, *args).AndReturn('fake-result')
@@ -34,6 +34,7 @@ CONF.import_opt('instance_dns_manager', 'nova.network.manager')
 CONF.import_opt('policy_file', 'nova.policy')
 CONF.import_opt('compute_driver', 'nova.virt.driver')
 CONF.import_opt('api_paste_config', 'nova.wsgi')
+CONF.import_opt('glance_metadata_cache_ttl', 'nova.image.glance')
 
 
 class ConfFixture(fixtures.Fixture):
@@ -51,6 +52,7 @@ class ConfFixture(fixtures.Fixture):
         self.conf.set_default('fake_network', True)
         self.conf.set_default('fake_rabbit', True)
         self.conf.set_default('flat_network_bridge', 'br100')
+        self.conf.set_default('glance_metadata_cache_ttl', 0)
         self.conf.set_default('floating_ip_dns_manager',
                               'nova.tests.utils.dns_manager')
         self.conf.set_default('instance_dns_manager',
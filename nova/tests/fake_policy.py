@@ -133,6 +133,7 @@ policy_data = """
     "compute_extension:hide_server_addresses": "",
     "compute_extension:hosts": "",
     "compute_extension:hypervisors": "",
+    "compute_extension:image_prefetch": "",
     "compute_extension:instance_usage_audit_log": "",
     "compute_extension:keypairs": "",
     "compute_extension:multinic": "",
@@ -302,6 +302,12 @@ class Domain(object):
     def name(self):
         return self._def['name']
 
+    def ID(self):
+        for (k, v) in self._connection._running_vms.iteritems():
+            if v == self:
+                return k
+        return -1
+
     def UUIDString(self):
         return self._def['uuid']
 
@@ -16,7 +16,9 @@
 #    under the License.
 
 
+import cStringIO
 import datetime
+import hashlib
 import random
 import time
 
@@ -108,6 +110,10 @@ class TestGlanceImageService(test.TestCase):
         self.service = self._create_image_service(client)
         self.context = context.RequestContext('fake', 'fake', auth_token=True)
 
+        # Run with the metadata cache on, as it is by default
+        self.flags(glance_metadata_cache_ttl=30)
+        self.stubs.Set(glance, 'IMAGE_META_CACHE', glance.ImageMetaCache())
+
     def _create_image_service(self, client):
         def _fake_create_glance_client(context, host, port, use_ssl, version):
             return client
@@ -441,6 +447,106 @@ class TestGlanceImageService(test.TestCase):
         self.assertEqual(image_meta['created_at'], self.NOW_DATETIME)
         self.assertEqual(image_meta['updated_at'], self.NOW_DATETIME)
 
+    def _create_image(self, fixture, status='active'):
+        # Glance sets the status, not the caller
+        image_id = self.service.create(self.context, fixture)['id']
+        self.service._client.client.images.update(image_id, status=status)
+        return image_id
+
+    def _count_gets(self):
+        gets = []
+        orig_get = self.service._client.client.get
+
+        def counting_get(image_id):
+            gets.append(image_id)
+            return orig_get(image_id)
+        self.stubs.Set(self.service._client.client.images, 'get',
+                       counting_get)
+        return gets
+
+    def test_show_uses_metadata_cache(self):
+        gets = self._count_gets()
+        fixture = self._make_fixture(name='image1', is_public=True)
+        image_id = self._create_image(fixture)
+
+        image_meta = self.service.show(self.context, image_id)
+        image_meta['properties']['changed'] = True
+        image_meta = self.service.show(self.context, image_id)
+        self.assertEqual(image_meta['properties'], {})
+        self.assertEqual(len(gets), 1)
+
+        # Public images are shared between projects
+        ctxt = context.RequestContext('other', 'other', auth_token=True)
+        self.service.show(ctxt, image_id)
+        self.assertEqual(len(gets), 1)
+
+    def test_metadata_cache_is_per_project(self):
+        gets = self._count_gets()
+        fixture = self._make_fixture(name='image1', is_public=False)
+        image_id = self._create_image(fixture)
+
+        self.service.show(self.context, image_id)
+        self.service.show(self.context, image_id)
+        ctxt = context.RequestContext('other', 'other', auth_token=True)
+        self.service.show(ctxt, image_id)
+        self.assertEqual(len(gets), 2)
+
+    def test_update_invalidates_metadata_cache(self):
+        fixture = self._make_fixture(name='test image')
+        image_id = self._create_image(fixture)
+        self.service.show(self.context, image_id)
+
+        fixture['name'] = 'new image name'
+        self.service.update(self.context, image_id, fixture)
+        image_meta = self.service.show(self.context, image_id)
+        self.assertEqual(image_meta['name'], 'new image name')
+
+        self.service.delete(self.context, image_id)
+        self.assertRaises(exception.ImageNotFound, self.service.show,
+                          self.context, image_id)
+
+    def test_expired_metadata_is_revalidated(self):
+        gets = self._count_gets()
+        now = [1000.0]
+        self.stubs.Set(time, 'time', lambda: now[0])
+        fixture = self._make_datetime_fixture()
+        image_id = self._create_image(fixture)
+
+        self.service.show(self.context, image_id)
+        now[0] += 31
+        image_meta = self.service.show(self.context, image_id)
+        self.assertEqual(image_meta['updated_at'], self.NOW_DATETIME)
+        self.assertEqual(len(gets), 2)
+        self.assertEqual(glance.IMAGE_META_CACHE.get_stats()['revalidated'],
+                         1)
+
+    def test_inactive_images_not_cached(self):
+        gets = self._count_gets()
+        fixture = self._make_fixture(name='snapshot')
+        image_id = self._create_image(fixture, status='saving')
+
+        # The snapshot is still being uploaded, so its status may change
+        # at any time
+        self.service.show(self.context, image_id)
+        self.service.show(self.context, image_id)
+        self.assertEqual(len(gets), 2)
+
+        self.service._client.client.images.update(image_id, status='active')
+        for i in xrange(2):
+            image_meta = self.service.show(self.context, image_id)
+            self.assertEqual(image_meta['status'], 'active')
+        self.assertEqual(len(gets), 3)
+
+    def test_detail_warms_metadata_cache(self):
+        gets = self._count_gets()
+        fixture = self._make_fixture(name='image1', is_public=True)
+        image_id = self._create_image(fixture)
+
+        self.service.detail(self.context)
+        image_meta = self.service.show(self.context, image_id)
+        self.assertEqual(image_meta['name'], 'image1')
+        self.assertEqual(gets, [])
+
     def test_download_with_retries(self):
         tries = [0]
 
@@ -468,6 +574,31 @@ class TestGlanceImageService(test.TestCase):
         self.flags(glance_num_retries=1)
         service.download(self.context, image_id, writer)
 
+    def _create_download_service(self, checksum):
+        class MyGlanceStubClient(glance_stubs.StubGlanceClient):
+            """A client that serves two chunks of image data."""
+            def get(self, image_id):
+                return glance_stubs.FakeImage({'id': image_id,
+                                               'size': 12,
+                                               'checksum': checksum})
+
+            def data(self, image_id):
+                return ['image ', 'chunks']
+
+        return self._create_image_service(MyGlanceStubClient())
+
+    def test_download_verifies_checksum(self):
+        service = self._create_download_service(
+            hashlib.md5('image chunks').hexdigest())
+        writer = cStringIO.StringIO()
+        service.download(self.context, 1, writer)
+        self.assertEqual(writer.getvalue(), 'image chunks')
+
+    def test_download_checksum_mismatch(self):
+        service = self._create_download_service('banana')
+        self.assertRaises(exception.ImageChecksumMismatch,
+                          service.download, self.context, 1, NullWriter())
+
     def test_client_forbidden_converts_to_imagenotauthed(self):
         class MyGlanceStubClient(glance_stubs.StubGlanceClient):
             """A client that raises a Forbidden exception."""
@@ -562,6 +693,10 @@ class TestGlanceClientWrapper(test.TestCase):
         def _fake_sleep(secs):
             pass
         self.stubs.Set(time, 'sleep', _fake_sleep)
+        self._reset_client_pool()
+
+    def _reset_client_pool(self):
+        self.stubs.Set(glance, 'CLIENT_POOL', glance.GlanceClientPool())
 
     def test_static_client_without_retries(self):
         self.flags(glance_num_retries=0)
@@ -628,6 +763,7 @@ class TestGlanceClientWrapper(test.TestCase):
             servers.append(servers.pop(0))
 
         self.stubs.Set(random, 'shuffle', _fake_shuffle2)
+        self._reset_client_pool()
 
         self.assertRaises(exception.GlanceConnectionFailed,
                 client2.call, ctxt, 1, 'get', 'meow')
@@ -695,6 +831,7 @@ class TestGlanceClientWrapper(test.TestCase):
             servers.append(servers.pop(0))
 
         self.stubs.Set(random, 'shuffle', _fake_shuffle2)
+        self._reset_client_pool()
 
         info = {'num_calls': 0,
                 'host0': 'host2',
@@ -707,6 +844,92 @@ class TestGlanceClientWrapper(test.TestCase):
         client2.call(ctxt, 1, 'get', 'meow')
         self.assertEqual(info['num_calls'], 2)
 
+    def test_default_client_is_reused(self):
+        ctxt = context.RequestContext('fake', 'fake', auth_token='token1')
+        created = []
+
+        def _fake_create_glance_client(context, host, port, use_ssl, version):
+            created.append((host, context.auth_token))
+            return glance_stubs.StubGlanceClient()
+
+        self.stubs.Set(random, 'shuffle', lambda servers: None)
+        self.stubs.Set(glance, '_create_glance_client',
+                _fake_create_glance_client)
+        self.flags(auth_strategy='keystone')
+
+        for i in xrange(3):
+            glance.GlanceClientWrapper().call(ctxt, 1, 'list')
+        ctxt2 = context.RequestContext('fake', 'fake', auth_token='token2')
+        glance.GlanceClientWrapper().call(ctxt2, 1, 'list')
+
+        self.assertEqual(created, [('host1', 'token1'), ('host1', 'token2')])
+        stats = glance.CLIENT_POOL.get_stats()
+        self.assertEqual(stats['created'], 2)
+        self.assertEqual(stats['reused'], 2)
+        self.assertEqual(stats['calls'], 4)
+
+    def test_default_client_round_robin(self):
+        ctxt = context.RequestContext('fake', 'fake')
+        created = []
+
+        def _fake_create_glance_client(context, host, port, use_ssl, version):
+            created.append(host)
+            return glance_stubs.StubGlanceClient()
+
+        self.stubs.Set(random, 'shuffle', lambda servers: None)
+        self.stubs.Set(glance, '_create_glance_client',
+                _fake_create_glance_client)
+
+        client = glance.GlanceClientWrapper()
+        hosts = []
+        for i in xrange(4):
+            client.call(ctxt, 1, 'list')
+            hosts.append(client.host)
+        self.assertEqual(hosts, ['host1', 'host2', 'host3', 'host1'])
+        self.assertEqual(created, ['host1', 'host2', 'host3'])
+
+        # A failing server is skipped until its backoff is over
+        glance.CLIENT_POOL.server_failed(('host2', 9293, True))
+        client.call(ctxt, 1, 'list')
+        client.call(ctxt, 1, 'list')
+        self.assertEqual(client.host, 'host1')
+
+    def test_client_pool_size(self):
+        self.flags(glance_client_pool_size=2)
+        pool = glance.GlanceClientPool()
+        self.stubs.Set(glance, '_create_glance_client',
+                lambda *args: glance_stubs.StubGlanceClient())
+        ctxt = context.RequestContext('fake', 'fake')
+
+        for port in (1, 2, 1, 3):
+            pool.get(ctxt, ('host', port, False), 1)
+        # Port 2 was the least recently used, so it was dropped
+        pool.get(ctxt, ('host', 1, False), 1)
+        pool.get(ctxt, ('host', 2, False), 1)
+        self.assertEqual(pool.get_stats()['created'], 4)
+
+    def test_failing_server_is_skipped(self):
+        pool = glance.GlanceClientPool()
+        servers = [('host1', 9292, False), ('host2', 9293, True)]
+        now = [1000.0]
+        self.stubs.Set(time, 'time', lambda: now[0])
+
+        self.assertEqual(pool.select_server(servers), servers[0])
+        pool.server_failed(servers[0])
+        self.assertEqual(pool.select_server(servers), servers[1])
+
+        # Both failing: the one due back soonest is used
+        pool.server_failed(servers[1])
+        pool.server_failed(servers[1])
+        self.assertEqual(pool.select_server(servers), servers[0])
+
+        # After its backoff, the first server is healthy again
+        now[0] += 1
+        self.assertEqual(pool.select_server(servers), servers[0])
+        self.assertEqual(pool.select_server(servers, 1), servers[0])
+        pool.server_ok(servers[0], 0.5)
+        self.assertEqual(pool.get_stats()['failing_servers'], 1)
+
 
 class TestGlanceUrl(test.TestCase):
 
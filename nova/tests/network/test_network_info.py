@@ -350,3 +350,43 @@ class NetworkInfoTests(test.TestCase):
                 [fake_network_cache_model.new_ip({'address': '10.10.0.2'}),
                  fake_network_cache_model.new_ip(
                         {'address': '10.10.0.3'})] * 4)
+
+
+class GetAddressesTests(test.TestCase):
+    def _network_info(self):
+        vif = fake_network_cache_model.new_vif()
+        vif['network']['subnets'][0]['ips'][0].add_floating_ip(
+                model.IP(address='192.168.1.1', type='floating'))
+        return model.NetworkInfo([vif,
+                fake_network_cache_model.new_vif(
+                    {'address': 'bb:bb:bb:bb:bb:bb',
+                     'network': fake_network_cache_model.new_network(
+                        {'label': 'private'})})])
+
+    def test_get_addresses(self):
+        ninfo = self._network_info()
+        addresses = model.get_addresses(ninfo.json())
+
+        self.assertEqual(['public', 'private'],
+                         [label for label, _fixed, _floating in addresses])
+        fixed_ips = [ip for _label, fixed, _floating in addresses
+                     for ip in fixed]
+        self.assertEqual([(ip['version'], ip['address'])
+                          for ip in ninfo.fixed_ips()], fixed_ips)
+        self.assertEqual([(4, '192.168.1.1')], addresses[0][2])
+        self.assertEqual([], addresses[1][2])
+
+    def test_get_addresses_from_models(self):
+        ninfo = self._network_info()
+        self.assertEqual(model.get_addresses(ninfo.json()),
+                         model.get_addresses(ninfo))
+
+    def test_get_addresses_without_version(self):
+        ninfo = [{'network': {'label': 'public',
+                              'subnets': [{'ips': [{'address': '::1'}]}]}}]
+        self.assertEqual([('public', [(6, '::1')], [])],
+                         model.get_addresses(ninfo))
+
+    def test_get_addresses_empty(self):
+        self.assertEqual([], model.get_addresses(None))
+        self.assertEqual([], model.get_addresses('[]'))
@@ -16,11 +16,17 @@
 Fakes For Scheduler tests.
 """
 
+import BaseHTTPServer
+import httplib
+import SocketServer
+
+import eventlet
 import mox
 
 from nova.compute import instance_types
 from nova.compute import vm_states
 from nova import db
+from nova.openstack.common import jsonutils
 from nova.scheduler import filter_scheduler
 from nova.scheduler import host_manager
 
@@ -138,6 +144,83 @@ class FakeComputeAPI(object):
         pass
 
 
+class FakeAttestationServer(object):
+    """Local HTTP server answering PollHosts requests the way an
+    OpenAttestation server does, with the levels in trust_levels.
+
+    The decoded request bodies are kept in requests and the number of
+    client connections accepted in connections.
+    """
+
+    def __init__(self, trust_levels=None):
+        self.trust_levels = trust_levels or {}
+        self.requests = []
+        self.connections = 0
+        self.httpd = _FakeAttestationHTTPServer(('127.0.0.1', 0),
+                                                _FakeAttestationHandler)
+        self.httpd.fake_server = self
+        self.port = self.httpd.server_port
+        self._thread = None
+
+    def start(self):
+        self._thread = eventlet.spawn(self.httpd.serve_forever,
+                                      poll_interval=0.01)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._thread.wait()
+        self._thread = None
+
+    def poll_hosts(self, body):
+        self.requests.append(body)
+        return {'hosts': [{'host_name': host,
+                           'trust_lvl': self.trust_levels[host],
+                           'vtime': '2013-01-01T00:00:00'}
+                          for host in body['hosts']
+                          if host in self.trust_levels]}
+
+
+class FakeAttestationConnection(httplib.HTTPConnection):
+    """Plain HTTP stand-in for trusted_filter.HTTPSClientAuthConnection."""
+
+    def __init__(self, host, port, key_file, cert_file, ca_file,
+                 timeout=None):
+        httplib.HTTPConnection.__init__(self, host, port)
+
+
+class _FakeAttestationHTTPServer(SocketServer.ThreadingMixIn,
+                                 BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _FakeAttestationHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Keep connections open between requests.
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        self.server.fake_server.connections += 1
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['content-length']))
+        if not self.path.endswith('/PollHosts'):
+            self.send_error(httplib.NOT_FOUND)
+            return
+        data = jsonutils.dumps(
+                self.server.fake_server.poll_hosts(jsonutils.loads(body)))
+        self.send_response(httplib.OK)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
 def mox_host_manager_db_calls(mock, context):
     mock.StubOutWithMock(db, 'compute_node_get_all')
 
@@ -0,0 +1,136 @@
+# Copyright (c) 2013 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For batch scheduling.
+"""
+
+import random
+
+from nova.compute import vm_states
+from nova.scheduler import batch
+from nova.scheduler import host_manager
+from nova import test
+from nova.tests.scheduler import fakes
+
+
+RESOURCE_FILTERS = ['RamFilter', 'CoreFilter', 'DiskFilter',
+                    'NumInstancesFilter', 'IoOpsFilter', 'RetryFilter',
+                    'AllHostsFilter']
+
+
+class BatchSchedulingTestCase(test.TestCase):
+    """Test case comparing batch and sequential scheduling."""
+
+    def setUp(self):
+        super(BatchSchedulingTestCase, self).setUp()
+        if not batch.is_available():
+            self.skipTest('NumPy is not available')
+        self.host_manager = host_manager.HostManager()
+        self.flags(scheduler_batch_mode=True, max_instances_per_host=6,
+                   max_io_ops_per_host=4)
+
+    def _hosts(self, seed):
+        rand = random.Random(seed)
+        hosts = []
+        for x in xrange(40):
+            total_ram = rand.choice([2048, 4096, 8192])
+            total_disk = rand.choice([20, 40, 80])
+            hosts.append(fakes.FakeHostState('host%s' % x, 'node%s' % x,
+                    {'free_ram_mb': rand.randint(-512, total_ram),
+                     'total_usable_ram_mb': total_ram,
+                     'free_disk_mb': rand.randint(0, total_disk) * 1024,
+                     'total_usable_disk_gb': total_disk,
+                     'vcpus_total': rand.choice([0, 2, 4]),
+                     'vcpus_used': rand.randint(0, 40),
+                     'num_instances': rand.randint(0, 6),
+                     'num_io_ops': rand.randint(0, 4)}))
+        return hosts
+
+    def _filter_properties(self):
+        instance_type = {'memory_mb': 1024, 'root_gb': 5,
+                         'ephemeral_gb': 5, 'vcpus': 2}
+        return {'instance_type': instance_type,
+                'retry': {'num_attempts': 1,
+                          'hosts': [['host3', 'node3']]}}
+
+    def _instance_properties(self):
+        return {'project_id': 'fake', 'memory_mb': 1024, 'root_gb': 5,
+                'ephemeral_gb': 5, 'vcpus': 2, 'os_type': 'Linux',
+                'vm_state': vm_states.BUILDING}
+
+    def _schedule_sequential(self, hosts, num_instances):
+        filter_properties = self._filter_properties()
+        selected = []
+        for num in xrange(num_instances):
+            hosts = self.host_manager.get_filtered_hosts(hosts,
+                    filter_properties, RESOURCE_FILTERS)
+            if not hosts:
+                break
+            best = self.host_manager.get_weighed_hosts(hosts,
+                    filter_properties)[0]
+            selected.append(best)
+            best.obj.consume_from_instance(self._instance_properties())
+        return selected
+
+    def _schedule_batch(self, hosts, num_instances):
+        return self.host_manager.get_batch_weighed_hosts(hosts,
+                self._filter_properties(), self._instance_properties(),
+                num_instances, RESOURCE_FILTERS)
+
+    def _assert_same_selection(self, seed, num_instances, ram_multiplier):
+        self.flags(ram_weight_multiplier=ram_multiplier)
+        expected = self._schedule_sequential(self._hosts(seed),
+                                             num_instances)
+        result = self._schedule_batch(self._hosts(seed), num_instances)
+
+        self.assertEqual([(w.obj.host, w.weight) for w in expected],
+                         [(w.obj.host, w.weight) for w in result])
+        for expected_host, host in zip(expected, result):
+            self.assertEqual(expected_host.obj.limits, host.obj.limits)
+            self.assertEqual(expected_host.obj.free_ram_mb,
+                             host.obj.free_ram_mb)
+            self.assertEqual(expected_host.obj.num_io_ops,
+                             host.obj.num_io_ops)
+
+    def test_same_as_sequential_spread(self):
+        for seed in xrange(5):
+            self._assert_same_selection(seed, 30, 1.0)
+
+    def test_same_as_sequential_stack(self):
+        for seed in xrange(5):
+            self._assert_same_selection(seed, 30, -1.0)
+
+    def test_runs_out_of_hosts(self):
+        self._assert_same_selection(0, 500, 1.0)
+
+    def test_ignore_and_force_hosts(self):
+        hosts = self._hosts(0)
+        filter_properties = self._filter_properties()
+        filter_properties['force_hosts'] = ['host1', 'host2']
+        filter_properties['ignore_hosts'] = ['host2']
+        result = self.host_manager.get_batch_weighed_hosts(hosts,
+                filter_properties, self._instance_properties(), 3,
+                ['AllHostsFilter'])
+        self.assertEqual(['host1'] * 3, [w.obj.host for w in result])
+
+    def test_unsupported_filter(self):
+        result = self.host_manager.get_batch_weighed_hosts(self._hosts(0),
+                self._filter_properties(), self._instance_properties(), 2,
+                ['RamFilter', 'JsonFilter'])
+        self.assertEqual(None, result)
+
+    def test_disabled(self):
+        self.flags(scheduler_batch_mode=False)
+        self.assertEqual(None, self._schedule_batch(self._hosts(0), 2))
@@ -24,10 +24,12 @@ from nova.compute import vm_states
 from nova import context
 from nova import db
 from nova import exception
+from nova.scheduler import batch
 from nova.scheduler import driver
 from nova.scheduler import filter_scheduler
 from nova.scheduler import host_manager
 from nova.scheduler import weights
+from nova import servicegroup
 from nova.tests.scheduler import fakes
 from nova.tests.scheduler import test_scheduler
 
@@ -176,6 +178,47 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         for weighed_host in weighed_hosts:
             self.assertTrue(weighed_host.obj is not None)
 
+    def test_schedule_batch_mode(self):
+        """Batch mode picks the same hosts as the sequential loop."""
+        if not batch.is_available():
+            self.skipTest('NumPy is not available')
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        request_spec = {'num_instances': 4,
+                        'instance_type': {'memory_mb': 512, 'root_gb': 512,
+                                          'ephemeral_gb': 0,
+                                          'vcpus': 1},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 512,
+                                                'memory_mb': 512,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'}}
+        self.stubs.Set(servicegroup.API, 'service_is_up',
+                       lambda *args: True)
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        db.compute_node_get_all(mox.IgnoreArg()).AndReturn(
+                fakes.COMPUTE_NODES)
+        db.compute_node_get_all(mox.IgnoreArg()).AndReturn(
+                fakes.COMPUTE_NODES)
+        self.mox.ReplayAll()
+
+        sched = fakes.FakeFilterScheduler()
+        expected = sched._schedule(fake_context, request_spec, {})
+
+        def _fail_get_filtered_hosts(*args, **kwargs):
+            self.fail('get_filtered_hosts() called in batch mode')
+
+        self.flags(scheduler_batch_mode=True)
+        sched = fakes.FakeFilterScheduler()
+        self.stubs.Set(sched.host_manager, 'get_filtered_hosts',
+                       _fail_get_filtered_hosts)
+        weighed_hosts = sched._schedule(fake_context, request_spec, {})
+
+        self.assertEqual(4, len(expected))
+        self.assertEqual([(h.obj.host, h.weight) for h in expected],
+                         [(h.obj.host, h.weight) for h in weighed_hosts])
+
     def test_schedule_prep_resize_doesnt_update_host(self):
         fake_context = context.RequestContext('user', 'project',
                 is_admin=True)
@@ -15,6 +15,7 @@
 Tests For Scheduler Host Filters.
 """
 
+import eventlet
 import httplib
 import stubout
 
@@ -22,8 +23,10 @@ from nova import context
 from nova import db
 from nova.openstack.common import cfg
 from nova.openstack.common import jsonutils
+from nova.openstack.common import timeutils
 from nova.scheduler import filters
 from nova.scheduler.filters import extra_specs_ops
+from nova.scheduler.filters import trusted_filter
 from nova.scheduler.filters.trusted_filter import AttestationService
 from nova import servicegroup
 from nova import test
@@ -240,6 +243,8 @@ class HostFiltersTestCase(test.TestCase):
         self.oat_data = ''
         self.stubs = stubout.StubOutForTesting()
         self.stubs.Set(AttestationService, '_request', self.fake_oat_request)
+        self.stubs.Set(trusted_filter.TrustedFilter, 'attestation_service',
+                       None)
         self.context = context.RequestContext('fake', 'fake')
         self.json_query = jsonutils.dumps(
                 ['and', ['>=', '$free_ram_mb', 1024],
@@ -333,6 +338,27 @@ class HostFiltersTestCase(test.TestCase):
 
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
 
+    def test_affinity_different_filter_looks_up_once(self):
+        filt_cls = self.class_map['DifferentHostFilter']()
+        instance = fakes.FakeInstance(context=self.context,
+                                         params={'host': 'host2'})
+        fakes.FakeInstance(context=self.context, params={'host': 'host3'})
+        filter_properties = {'context': self.context.elevated(),
+                             'scheduler_hints': {
+                                'different_host': [instance.uuid], }}
+        self.mox.StubOutWithMock(filt_cls.compute_api, 'get_all')
+        filt_cls.compute_api.get_all(filter_properties['context'],
+                search_opts={'uuid': [instance.uuid]}).AndReturn(
+                        [{'uuid': instance.uuid, 'host': 'host2'}])
+        self.mox.ReplayAll()
+
+        for x in xrange(1, 5):
+            host = fakes.FakeHostState('host%s' % x, 'node%s' % x, {})
+            self.assertEqual(x != 2,
+                             filt_cls.host_passes(host, filter_properties))
+        self.assertEqual({'different_host': set(['host2'])},
+                         filter_properties['affinity_hosts'])
+
     def test_affinity_same_filter_no_list_passes(self):
         filt_cls = self.class_map['SameHostFilter']()
         host = fakes.FakeHostState('host1', 'node1', {})
@@ -485,6 +511,35 @@ class HostFiltersTestCase(test.TestCase):
         #False since type matches aggregate, metadata
         self.assertFalse(filt_cls.host_passes(host, filter2_properties))
 
+    def test_type_filter_prefetched(self):
+        filt_cls = self.class_map['TypeAffinityFilter']()
+        filter_properties = {'context': self.context,
+                             'instance_type': {'id': 1}}
+        host = fakes.FakeHostState('fake_host', 'fake_node', {})
+        # Prefetched data is used instead of querying the instances.
+        fakes.FakeInstance(context=self.context,
+                           params={'host': 'fake_host', 'instance_type_id': 2})
+        host.instance_type_ids = set()
+        self.assertTrue(filt_cls.host_passes(host, filter_properties))
+        host.instance_type_ids = set([1])
+        self.assertTrue(filt_cls.host_passes(host, filter_properties))
+        host.instance_type_ids = set([1, 2])
+        self.assertFalse(filt_cls.host_passes(host, filter_properties))
+
+    def test_aggregate_type_filter_prefetched(self):
+        filt_cls = self.class_map['AggregateTypeAffinityFilter']()
+        filter_properties = {'context': self.context,
+                             'instance_type': {'name': 'fake1'}}
+        host = fakes.FakeHostState('fake_host', 'fake_node', {})
+        self._create_aggregate_with_host(name='fake_aggregate',
+                hosts=['fake_host'], metadata={'instance_type': 'fake2'})
+        host.aggregate_metadata = {'availability_zone': set(['az1'])}
+        self.assertTrue(filt_cls.host_passes(host, filter_properties))
+        host.aggregate_metadata = {'instance_type': set(['fake1'])}
+        self.assertTrue(filt_cls.host_passes(host, filter_properties))
+        host.aggregate_metadata = {'instance_type': set(['fake2'])}
+        self.assertFalse(filt_cls.host_passes(host, filter_properties))
+
     def test_ram_filter_fails_on_memory(self):
         self._stub_service_is_up(True)
         filt_cls = self.class_map['RamFilter']()
@@ -1301,3 +1356,106 @@ class HostFiltersTestCase(test.TestCase):
                                    {'num_instances': 5})
         filter_properties = {}
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
+
+
+class TrustedFilterTestCase(test.TestCase):
+    """Test case for TrustedFilter against a fake attestation server."""
+
+    def setUp(self):
+        super(TrustedFilterTestCase, self).setUp()
+        self.server = fakes.FakeAttestationServer({'host1': 'trusted',
+                                                   'host2': 'untrusted',
+                                                   'host3': 'trusted'})
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.flags(attestation_server='127.0.0.1',
+                   attestation_port=str(self.server.port),
+                   group='trusted_computing')
+        self.stubs.Set(trusted_filter, 'HTTPSClientAuthConnection',
+                       fakes.FakeAttestationConnection)
+        self.stubs.Set(trusted_filter.TrustedFilter, 'attestation_service',
+                       None)
+        self.addCleanup(timeutils.clear_time_override)
+        self.hosts = [fakes.FakeHostState('host%s' % x, 'node%s' % x, {})
+                      for x in xrange(1, 5)]
+        self.filter_properties = {'instance_type': {'extra_specs':
+                {'trust:trusted_host': 'trusted'}}}
+
+    def _filter(self, hosts=None):
+        filt = trusted_filter.TrustedFilter()
+        self.addCleanup(filt.attestation_service._close_connection)
+        hosts = filt.filter_all(hosts or self.hosts, self.filter_properties)
+        return [host.host for host in hosts]
+
+    def test_bulk_poll(self):
+        self.assertEqual(['host1', 'host3'], self._filter())
+        self.assertEqual([{'count': 4,
+                           'hosts': ['host1', 'host2', 'host3', 'host4']}],
+                         self.server.requests)
+
+    def test_bulk_poll_split(self):
+        self._filter()
+        trusted_filter.TrustedFilter.attestation_service.trust_cache = {}
+        trusted_filter.TrustedFilter.attestation_service.request_count = 3
+        self.assertEqual(['host1', 'host3'], self._filter())
+        self.assertEqual([3, 1], [body['count']
+                                  for body in self.server.requests[1:]])
+
+    def test_cached(self):
+        timeutils.set_time_override()
+        self._filter()
+        timeutils.advance_time_seconds(59)
+        self.server.trust_levels['host1'] = 'untrusted'
+        self.assertEqual(['host1', 'host3'], self._filter())
+        # host4 is not attested, so it is not cached either.
+        self.assertEqual(['host4'], self.server.requests[1]['hosts'])
+        timeutils.advance_time_seconds(1)
+        self.assertEqual(['host3'], self._filter())
+        self.assertEqual(3, len(self.server.requests))
+
+    def test_cache_disabled(self):
+        self.flags(attestation_auth_timeout=0, group='trusted_computing')
+        self._filter()
+        self._filter()
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_persistent_connection(self):
+        self.flags(attestation_auth_timeout=0, group='trusted_computing')
+        for x in xrange(3):
+            self._filter()
+        self.assertEqual(3, len(self.server.requests))
+        self.assertEqual(1, self.server.connections)
+
+    def test_reconnects_on_closed_connection(self):
+        self.flags(attestation_auth_timeout=0, group='trusted_computing')
+        self._filter()
+        trusted_filter.TrustedFilter.attestation_service.conn.sock.close()
+        self.assertEqual(['host1', 'host3'], self._filter())
+        self.assertEqual(2, self.server.connections)
+
+    def test_concurrent_requests_share_connection(self):
+        self.flags(attestation_auth_timeout=0, group='trusted_computing')
+        threads = [eventlet.spawn(self._filter) for x in xrange(5)]
+        for thread in threads:
+            self.assertEqual(['host1', 'host3'], thread.wait())
+        self.assertEqual(5, len(self.server.requests))
+        self.assertEqual(1, self.server.connections)
+
+    def test_server_unavailable(self):
+        self.server.stop()
+        self.assertEqual([], self._filter())
+
+    def test_host_passes(self):
+        filt = trusted_filter.TrustedFilter()
+        self.addCleanup(filt.attestation_service._close_connection)
+        self.assertTrue(filt.host_passes(self.hosts[0],
+                                         self.filter_properties))
+        self.assertFalse(filt.host_passes(self.hosts[1],
+                                          self.filter_properties))
+        self.assertEqual([['host1'], ['host2']],
+                         [body['hosts'] for body in self.server.requests])
+
+    def test_no_trust_requested(self):
+        self.filter_properties = {'instance_type': {}}
+        self.assertEqual(['host1', 'host2', 'host3', 'host4'], self._filter())
+        self.assertEqual([], self.server.requests)
@@ -15,6 +15,10 @@
 """
 Tests For HostManager
 """
+import datetime
+
+import mox
+
 from nova.compute import task_states
 from nova.compute import vm_states
 from nova import db
@@ -266,6 +270,241 @@ class HostManagerTestCase(test.TestCase):
         self.assertEqual(host_states_map[('host4', 'node4')].free_disk_mb,
                          8388608)
 
+    def _compute_node(self, id, host, updated_at, free_ram_mb=512,
+                      deleted=False):
+        return dict(id=id, local_gb=1024, memory_mb=1024, vcpus=1,
+                    disk_available_least=512, free_ram_mb=free_ram_mb,
+                    vcpus_used=0, local_gb_used=0, updated_at=updated_at,
+                    created_at=None, deleted=deleted,
+                    service=dict(host=host, disabled=False,
+                                 updated_at=None),
+                    hypervisor_hostname=host)
+
+    def test_get_all_host_states_incremental(self):
+        self.flags(scheduler_host_state_refresh_margin=10)
+        context = 'fake_context'
+        t0 = datetime.datetime(2013, 1, 1)
+        t1 = t0 + datetime.timedelta(seconds=5)
+        margin = datetime.timedelta(seconds=10)
+        timeutils.set_time_override(t0)
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_updated_since')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        self.mox.StubOutWithMock(host_manager.HostState,
+                                 'update_from_compute_node')
+
+        node1 = self._compute_node(1, 'host1', t0)
+        node2 = self._compute_node(2, 'host2', t0)
+        db.compute_node_get_all(context).AndReturn([node1, node2])
+        host_manager.HostState.update_from_compute_node(node1)
+        host_manager.HostState.update_from_compute_node(node2)
+
+        # Second pull, made at t1, returns what changed since the first
+        # pull less the margin: host1 was updated, host2 was deleted.
+        node1_new = self._compute_node(1, 'host1', t1, free_ram_mb=256)
+        node2_gone = self._compute_node(2, 'host2', t1, deleted=True)
+        db.compute_node_get_all_updated_since(context,
+                t0 - margin).AndReturn([node1_new, node2_gone])
+        db.service_get_all(context).AndReturn([])
+        host_manager.HostState.update_from_compute_node(node1_new)
+
+        # Third pull returns host1 again with an unchanged updated_at.
+        db.compute_node_get_all_updated_since(context,
+                t1 - margin).AndReturn([node1_new])
+        db.service_get_all(context).AndReturn([])
+
+        self.mox.ReplayAll()
+        self.host_manager.get_all_host_states(context)
+        timeutils.set_time_override(t1)
+        self.host_manager.get_all_host_states(context)
+        self.host_manager.get_all_host_states(context)
+
+        self.assertEqual([('host1', 'host1')],
+                         self.host_manager.host_state_map.keys())
+        stats = self.host_manager.host_state_cache_stats
+        self.assertEqual(1, stats['full_refreshes'])
+        self.assertEqual(2, stats['incremental_refreshes'])
+        self.assertEqual(3, stats['misses'])
+        self.assertEqual(1, stats['hits'])
+
+    def test_get_all_host_states_incremental_services(self):
+        context = 'fake_context'
+        t0 = datetime.datetime(2013, 1, 1)
+        t1 = t0 + datetime.timedelta(seconds=5)
+        timeutils.set_time_override(t0)
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_updated_since')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+
+        node1 = self._compute_node(1, 'host1', t0)
+        node2 = self._compute_node(2, 'host2', t0)
+        db.compute_node_get_all(context).AndReturn([node1, node2])
+
+        # host2 was deleted and created again, and its deleted row comes
+        # last; host1 did not change but its service sent a heartbeat.
+        node2_new = self._compute_node(3, 'host2', t1)
+        node2_gone = self._compute_node(2, 'host2', t1, deleted=True)
+        db.compute_node_get_all_updated_since(context,
+                mox.IgnoreArg()).AndReturn([node2_new, node2_gone])
+        db.service_get_all(context).AndReturn([
+                dict(host='host1', topic='compute', disabled=False,
+                     updated_at=t1),
+                dict(host='host1', topic='network', disabled=False,
+                     updated_at=t0)])
+
+        self.mox.ReplayAll()
+        self.host_manager.get_all_host_states(context)
+        timeutils.set_time_override(t1)
+        self.host_manager.get_all_host_states(context)
+
+        host_state_map = self.host_manager.host_state_map
+        self.assertEqual([('host1', 'host1'), ('host2', 'host2')],
+                         sorted(host_state_map.keys()))
+        self.assertEqual(t1, host_state_map[('host1', 'host1')].service[
+                'updated_at'])
+        self.assertEqual(3, self.host_manager.host_state_computes[
+                ('host2', 'host2')]['id'])
+
+    def test_get_all_host_states_full_refresh_drops_missing(self):
+        self.flags(scheduler_host_state_full_refresh_interval=0)
+        context = 'fake_context'
+        t0 = timeutils.utcnow()
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        node1 = self._compute_node(1, 'host1', t0)
+        node2 = self._compute_node(2, 'host2', t0)
+        db.compute_node_get_all(context).AndReturn([node1, node2])
+        db.compute_node_get_all(context).AndReturn([node1])
+
+        self.mox.ReplayAll()
+        self.host_manager.get_all_host_states(context)
+        self.assertEqual(2, len(self.host_manager.host_state_map))
+        self.host_manager.get_all_host_states(context)
+        self.assertEqual([('host1', 'host1')],
+                         self.host_manager.host_state_map.keys())
+        stats = self.host_manager.host_state_cache_stats
+        self.assertEqual(2, stats['full_refreshes'])
+        self.assertEqual(3, stats['misses'])
+        self.assertEqual(0, stats['hits'])
+
+    def _claim(self, host_state):
+        host_state.consume_from_instance(dict(root_gb=0, ephemeral_gb=0,
+                                              memory_mb=128, vcpus=1))
+
+    def test_get_all_host_states_keeps_claims(self):
+        self.flags(scheduler_host_state_refresh_margin=10)
+        context = 'fake_context'
+        t0 = datetime.datetime(2013, 1, 1)
+        timeutils.set_time_override(t0)
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_updated_since')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        node1 = self._compute_node(1, 'host1', t0)
+        db.compute_node_get_all(context).AndReturn([node1])
+        db.compute_node_get_all_updated_since(context,
+                t0 - datetime.timedelta(seconds=10)).AndReturn([node1])
+        db.service_get_all(context).AndReturn([])
+
+        self.mox.ReplayAll()
+        self._claim(list(self.host_manager.get_all_host_states(context))[0])
+        host_state = list(self.host_manager.get_all_host_states(context))[0]
+        self.assertEqual(384, host_state.free_ram_mb)
+        self.assertEqual(1, host_state.vcpus_used)
+
+    def test_get_all_host_states_full_refresh_drops_claims(self):
+        self.flags(scheduler_host_state_full_refresh_interval=0)
+        context = 'fake_context'
+        t0 = timeutils.utcnow()
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        node1 = self._compute_node(1, 'host1', t0)
+        db.compute_node_get_all(context).AndReturn([node1])
+        db.compute_node_get_all(context).AndReturn([node1])
+
+        self.mox.ReplayAll()
+        self._claim(list(self.host_manager.get_all_host_states(context))[0])
+        host_state = list(self.host_manager.get_all_host_states(context))[0]
+        self.assertEqual(512, host_state.free_ram_mb)
+        self.assertEqual(0, host_state.vcpus_used)
+        self.assertEqual(0, host_state.num_instances)
+        self.assertEqual([], host_state.claims)
+
+    def test_get_all_host_states_updated_node_drops_claims(self):
+        context = 'fake_context'
+        t0 = timeutils.utcnow()
+        t1 = t0 + datetime.timedelta(seconds=5)
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_updated_since')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        db.compute_node_get_all(context).AndReturn(
+                [self._compute_node(1, 'host1', t0)])
+        db.compute_node_get_all_updated_since(context,
+                mox.IgnoreArg()).AndReturn(
+                        [self._compute_node(1, 'host1', t1)])
+        db.service_get_all(context).AndReturn([])
+
+        self.mox.ReplayAll()
+        self._claim(list(self.host_manager.get_all_host_states(context))[0])
+        host_state = list(self.host_manager.get_all_host_states(context))[0]
+        self.assertEqual(512, host_state.free_ram_mb)
+        self.assertEqual([], host_state.claims)
+
+    def test_get_all_host_states_expires_claims(self):
+        self.flags(scheduler_host_state_claim_max_age=30)
+        context = 'fake_context'
+        t0 = datetime.datetime(2013, 1, 1)
+        timeutils.set_time_override(t0)
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_updated_since')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        node1 = self._compute_node(1, 'host1', t0)
+        db.compute_node_get_all(context).AndReturn([node1])
+        db.compute_node_get_all_updated_since(context,
+                mox.IgnoreArg()).AndReturn([])
+        db.service_get_all(context).AndReturn([])
+
+        self.mox.ReplayAll()
+        host_state = list(self.host_manager.get_all_host_states(context))[0]
+        self._claim(host_state)
+        timeutils.advance_time_seconds(20)
+        self._claim(host_state)
+        timeutils.advance_time_seconds(20)
+
+        # The first claim is 40 seconds old and expired, the second is not
+        host_state = list(self.host_manager.get_all_host_states(context))[0]
+        self.assertEqual(384, host_state.free_ram_mb)
+        self.assertEqual(1, host_state.vcpus_used)
+        self.assertEqual(1, host_state.num_instances)
+        self.assertEqual(1, len(host_state.claims))
+
+    def test_prefetch_host_data(self):
+        context = 'fake_context'
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_all_by_host')
+        self.mox.StubOutWithMock(db, 'instance_type_ids_get_all_by_host')
+        db.aggregate_metadata_get_all_by_host(context).AndReturn(
+                {'fake_host1': {'availability_zone': set(['az1'])}})
+        db.instance_type_ids_get_all_by_host(context).AndReturn(
+                {'fake_host2': set([1, 2])})
+
+        self.mox.ReplayAll()
+        self.host_manager.prefetch_host_data(context, self.fake_hosts,
+                ['AvailabilityZoneFilter', 'TypeAffinityFilter'])
+        self.assertEqual({'availability_zone': set(['az1'])},
+                         self.fake_hosts[0].aggregate_metadata)
+        self.assertEqual({}, self.fake_hosts[1].aggregate_metadata)
+        self.assertEqual(set(), self.fake_hosts[0].instance_type_ids)
+        self.assertEqual(set([1, 2]), self.fake_hosts[1].instance_type_ids)
+
+    def test_prefetch_host_data_not_needed(self):
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_all_by_host')
+        self.mox.StubOutWithMock(db, 'instance_type_ids_get_all_by_host')
+        self.fake_hosts[0].aggregate_metadata = {}
+        self.fake_hosts[0].instance_type_ids = set()
+
+        self.mox.ReplayAll()
+        self.host_manager.prefetch_host_data('fake_context', self.fake_hosts,
+                ['RamFilter'])
+        self.assertEqual(None, self.fake_hosts[0].aggregate_metadata)
+        self.assertEqual(None, self.fake_hosts[0].instance_type_ids)
+
 
 class HostStateTestCase(test.TestCase):
     """Test case for HostState class"""
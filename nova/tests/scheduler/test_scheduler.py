@@ -139,7 +139,8 @@ class SchedulerManagerTestCase(test.TestCase):
 
         db.service_get_all_compute_by_host(self.context, host).AndReturn(
                 computes)
-        db.instance_get_all_by_host(self.context, host).AndReturn(instances)
+        db.instance_get_all_by_host(self.context, host,
+                                    columns_to_join=[]).AndReturn(instances)
 
         self.mox.ReplayAll()
         result = self.manager.show_host_resources(self.context, host)
@@ -389,7 +390,8 @@ class SchedulerTestCase(test.TestCase):
         db.service_get_all_compute_by_host(self.context, dest).AndReturn(
                 [{'compute_node': [{'memory_mb': 2048,
                                     'hypervisor_version': 1}]}])
-        db.instance_get_all_by_host(self.context, dest).AndReturn(
+        db.instance_get_all_by_host(self.context, dest,
+                                    columns_to_join=[]).AndReturn(
                 [dict(memory_mb=256), dict(memory_mb=512)])
 
         # Common checks (same hypervisor, etc)
@@ -552,7 +554,8 @@ class SchedulerTestCase(test.TestCase):
 
         self.driver._get_compute_info(self.context, dest).AndReturn(
                                                        {'memory_mb': 2048})
-        db.instance_get_all_by_host(self.context, dest).AndReturn(
+        db.instance_get_all_by_host(self.context, dest,
+                                    columns_to_join=[]).AndReturn(
                 [dict(memory_mb=1024), dict(memory_mb=512)])
 
         self.mox.ReplayAll()
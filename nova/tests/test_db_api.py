@@ -22,8 +22,10 @@
 import datetime
 import uuid as stdlib_uuid
 
+from nova.compute import vm_states
 from nova import context
 from nova import db
+from nova.db.sqlalchemy import api as sqlalchemy_api
 from nova import exception
 from nova.openstack.common import cfg
 from nova.openstack.common import timeutils
@@ -113,6 +115,39 @@ class DbApiTestCase(test.TestCase):
                                                 {'display_name': 't.*st.'})
         self.assertEqual(2, len(result))
 
+    def test_instance_get_all_by_filters_regex_literal(self):
+        for name in ('test1', 'test10', 'atest1', 'test_1', 'testx1'):
+            self.create_instances_with_args(display_name=name)
+
+        def names(pattern):
+            result = db.instance_get_all_by_filters(
+                    self.context, {'display_name': pattern})
+            return sorted(instance['display_name'] for instance in result)
+
+        self.assertEqual(['test1'], names('^test1$'))
+        self.assertEqual(['test1', 'test10', 'test_1', 'testx1'],
+                         names('^test'))
+        self.assertEqual(['atest1', 'test1', 'test10'], names('test1'))
+        self.assertEqual(['test_1'], names('test_'))
+        self.assertEqual(['atest1', 'test1', 'test_1', 'testx1'],
+                         names('1$'))
+        self.assertEqual(['test_1', 'testx1'], names('^test.1'))
+
+    def test_plan_regex_filter(self):
+        plan = sqlalchemy_api.plan_regex_filter
+        self.assertEqual(('equal', 'test1'), plan('^test1$'))
+        self.assertEqual(('equal', 'a.b'), plan('^a\\.b$'))
+        self.assertEqual(('like', 'test%'), plan('^test'))
+        self.assertEqual(('like', 'test%'), plan('^test.*'))
+        self.assertEqual(('like', '%test%'), plan('test'))
+        self.assertEqual(('like', '%test%'), plan('^.*test'))
+        self.assertEqual(('like', '%test'), plan('test$'))
+        self.assertEqual(('like', '%a!_b!%c!!%'), plan('a_b%c!'))
+        self.assertEqual(('like', '%a$%'), plan('a\\$'))
+        for pattern in ('t.*st', '^test[0-9]$', 'a|b', 'test\\d',
+                        'test\\', '^a$$'):
+            self.assertEqual(('regexp', pattern), plan(pattern))
+
     def test_instance_get_all_by_filters_regex_unsupported_db(self):
         """Ensure that the 'LIKE' operator is used for unsupported dbs."""
         self.flags(sql_connection="notdb://")
@@ -152,6 +187,128 @@ class DbApiTestCase(test.TestCase):
         else:
             self.assertTrue(result[1]['deleted'])
 
+    def test_instance_get_all_by_filters_soft_deleted(self):
+        inst1 = self.create_instances_with_args()
+        inst2 = self.create_instances_with_args(
+                vm_state=vm_states.SOFT_DELETED)
+        inst3 = self.create_instances_with_args()
+        db.instance_destroy(self.context, inst3['uuid'])
+
+        result = db.instance_get_all_by_filters(self.context,
+                                                {'deleted': False})
+        self.assertEqual([inst1['uuid']], [inst['uuid'] for inst in result])
+
+        result = db.instance_get_all_by_filters(self.context,
+                {'deleted': False, 'soft_deleted': True})
+        self.assertEqual(sorted([inst1['uuid'], inst2['uuid']]),
+                         sorted(inst['uuid'] for inst in result))
+
+    def test_instance_get_all_by_filters_loads_collections(self):
+        self.stubs.Set(sqlalchemy_api, '_INSTANCE_COLLECTION_BATCH', 1)
+        inst1 = self.create_instances_with_args(metadata={'foo': 'bar'},
+                                                system_metadata={'a': 'b'},
+                                                security_groups=['default'])
+        inst2 = self.create_instances_with_args(metadata={'x': '1',
+                                                          'y': '2'})
+        result = db.instance_get_all_by_filters(self.context, {})
+        result = dict((inst['uuid'], inst) for inst in result)
+        self.assertEqual(2, len(result))
+
+        first = result[inst1['uuid']]
+        self.assertEqual([('foo', 'bar')],
+                         [(m['key'], m['value']) for m in first['metadata']])
+        self.assertEqual([('a', 'b')],
+                         [(m['key'], m['value'])
+                          for m in first['system_metadata']])
+        self.assertEqual(['default'],
+                         [g['name'] for g in first['security_groups']])
+        second = result[inst2['uuid']]
+        self.assertEqual(['x', 'y'],
+                         sorted(m['key'] for m in second['metadata']))
+        self.assertEqual([], second['system_metadata'])
+
+    def test_instance_get_all_by_filters_columns_to_join(self):
+        self.create_instances_with_args(metadata={'foo': 'bar'},
+                                        system_metadata={'a': 'b'})
+        result = db.instance_get_all_by_filters(self.context, {},
+                                                columns_to_join=['metadata'])
+        self.assertEqual(1, len(result))
+        loaded = dict(result[0].iteritems())
+        self.assertEqual('foo', loaded['metadata'][0]['key'])
+        self.assertFalse('system_metadata' in loaded)
+        self.assertFalse('info_cache' in loaded)
+        self.assertFalse('security_groups' in loaded)
+
+    def test_instance_get_all_by_filters_deleted_security_groups(self):
+        inst1 = self.create_instances_with_args(security_groups=['default'])
+        inst2 = self.create_instances_with_args(security_groups=['default'])
+        db.instance_destroy(self.context, inst1['uuid'])
+        result = db.instance_get_all_by_filters(self.context, {})
+        result = dict((inst['uuid'], inst) for inst in result)
+        self.assertEqual([], result[inst1['uuid']]['security_groups'])
+        self.assertEqual(1, len(result[inst2['uuid']]['security_groups']))
+
+    def test_instance_get_all_by_host_columns_to_join(self):
+        ctxt = context.get_admin_context()
+        self.create_instances_with_args(metadata={'foo': 'bar'})
+        self.create_instances_with_args(host='host2')
+        result = db.instance_get_all_by_host(ctxt, 'host1')
+        self.assertEqual(1, len(result))
+        self.assertEqual('foo', result[0]['metadata'][0]['key'])
+        result = db.instance_get_all_by_host(ctxt, 'host1',
+                                             columns_to_join=[])
+        self.assertEqual(1, len(result))
+        self.assertFalse('metadata' in dict(result[0].iteritems()))
+
+    def test_instance_get_all_by_filters_deleted_marker(self):
+        inst1 = self.create_instances_with_args()
+        inst2 = self.create_instances_with_args()
+        db.instance_destroy(self.context, inst2['uuid'])
+        result = db.instance_get_all_by_filters(self.context, {},
+                                                sort_key='id',
+                                                sort_dir='desc',
+                                                marker=inst2['uuid'])
+        self.assertEqual([inst1['uuid']], [i['uuid'] for i in result])
+
+    def test_instance_iter_by_filters(self):
+        instances = [self.create_instances_with_args(display_name=name)
+                     for name in ('e', 'a', 'd', 'b', 'c')]
+        self.create_instances_with_args(display_name='other',
+                                        vm_state='active')
+        filters = {'vm_state': 'fake'}
+
+        result = db.instance_iter_by_filters(self.context, filters,
+                                             page_size=2)
+        self.assertEqual([inst['uuid'] for inst in instances],
+                         [inst['uuid'] for inst in result])
+
+        result = db.instance_iter_by_filters(self.context, filters,
+                                             sort_key='display_name',
+                                             sort_dir='desc', page_size=2,
+                                             columns_to_join=['metadata'])
+        self.assertEqual(['e', 'd', 'c', 'b', 'a'],
+                         [inst['display_name'] for inst in result])
+
+    def test_instance_iter_by_filters_pages(self):
+        self.flags(instance_iter_page_size=2)
+        for i in xrange(4):
+            self.create_instances_with_args()
+        pages = []
+        paginate_query = sqlalchemy_api.paginate_query
+
+        def fake_paginate_query(query, model, limit, sort_keys, **kwargs):
+            pages.append(limit)
+            return paginate_query(query, model, limit, sort_keys, **kwargs)
+
+        self.stubs.Set(sqlalchemy_api, 'paginate_query', fake_paginate_query)
+        result = db.instance_iter_by_filters(self.context, {})
+        result.next()
+        result.next()
+        self.assertEqual([2], pages)
+        self.assertEqual(2, len(list(result)))
+        # The last page is empty, as the one before it was full
+        self.assertEqual([2, 2, 2], pages)
+
     def test_instance_get_all_by_filters_paginate(self):
         self.flags(sql_connection="notdb://")
         test1 = self.create_instances_with_args(display_name='test1')
@@ -222,6 +379,19 @@ class DbApiTestCase(test.TestCase):
         self.assertEqual(0, len(results))
         db.migration_update(ctxt, migration['id'], {"status": "CONFIRMED"})
 
+    def test_instance_type_ids_get_all_by_host(self):
+        ctxt = context.get_admin_context()
+        self.create_instances_with_args(instance_type_id=1)
+        self.create_instances_with_args(instance_type_id=2)
+        self.create_instances_with_args(host='host2', instance_type_id=1)
+        self.create_instances_with_args(host='host2', instance_type_id=1)
+        inst = self.create_instances_with_args(host='host3',
+                                               instance_type_id=3)
+        db.instance_destroy(ctxt, inst['uuid'])
+        self.create_instances_with_args(host=None, instance_type_id=4)
+        result = db.instance_type_ids_get_all_by_host(ctxt)
+        self.assertEqual({'host1': set([1, 2]), 'host2': set([1])}, result)
+
     def test_instance_get_all_hung_in_rebooting(self):
         ctxt = context.get_admin_context()
 
@@ -763,6 +933,43 @@ class DbApiTestCase(test.TestCase):
         _compare(bw_usages[2], expected_bw_usages[2])
         timeutils.clear_time_override()
 
+    def test_bw_usage_update_multi(self):
+        ctxt = context.get_admin_context()
+        now = timeutils.utcnow()
+        start_period = now - datetime.timedelta(seconds=10)
+        refreshed = now - datetime.timedelta(seconds=5)
+        db.bw_usage_update(ctxt, 'fake_uuid1', 'fake_mac1', start_period,
+                           100, 200, 12345, 67890)
+        db.bw_usage_update(ctxt, 'fake_uuid1', 'fake_mac1', now,
+                           1, 2, 3, 4)
+
+        db.bw_usage_update_multi(ctxt, start_period,
+                [{'uuid': 'fake_uuid1', 'mac': 'fake_mac1',
+                  'bw_in': 150, 'bw_out': 250,
+                  'last_ctr_in': 12395, 'last_ctr_out': 67940},
+                 {'uuid': 'fake_uuid1', 'mac': 'fake_mac2',
+                  'bw_in': 0, 'bw_out': 0,
+                  'last_ctr_in': 10, 'last_ctr_out': 20},
+                 {'uuid': 'fake_uuid2', 'mac': 'fake_mac3',
+                  'bw_in': 0, 'bw_out': 0,
+                  'last_ctr_in': 30, 'last_ctr_out': 40}],
+                last_refreshed=refreshed)
+
+        bw_usages = db.bw_usage_get_by_uuids(ctxt,
+                ['fake_uuid1', 'fake_uuid2'], start_period)
+        self.assertEqual([('fake_uuid1', 'fake_mac1', 150, 250, 12395, 67940),
+                          ('fake_uuid1', 'fake_mac2', 0, 0, 10, 20),
+                          ('fake_uuid2', 'fake_mac3', 0, 0, 30, 40)],
+                         sorted((u['uuid'], u['mac'], u['bw_in'], u['bw_out'],
+                                 u['last_ctr_in'], u['last_ctr_out'])
+                                for u in bw_usages))
+        for bw_usage in bw_usages:
+            self.assertEqual(refreshed, bw_usage['last_refreshed'])
+
+        # Other audit periods are left alone.
+        bw_usage = db.bw_usage_get(ctxt, 'fake_uuid1', now, 'fake_mac1')
+        self.assertEqual(1, bw_usage['bw_in'])
+
 
 def _get_fake_aggr_values():
     return {'name': 'fake_aggregate'}
@@ -900,6 +1107,23 @@ class AggregateDBApiTestCase(test.TestCase):
         self.assertEqual(r1['fake_key1'], set(['fake_value1']))
         self.assertFalse('badkey' in r1)
 
+    def test_aggregate_metadata_get_all_by_host(self):
+        ctxt = context.get_admin_context()
+        values = {'name': 'fake_aggregate2'}
+        values2 = {'name': 'fake_aggregate3'}
+        _create_aggregate_with_hosts(context=ctxt)
+        _create_aggregate_with_hosts(context=ctxt, values=values,
+                hosts=['foo.openstack.org'], metadata={'fake_key1': 'v2'})
+        _create_aggregate_with_hosts(context=ctxt, values=values2,
+                hosts=['bar.openstack.org'], metadata={'badkey': 'bad'})
+        r1 = db.aggregate_metadata_get_all_by_host(ctxt)
+        for host in ['foo.openstack.org', 'bar.openstack.org']:
+            self.assertEqual(db.aggregate_metadata_get_by_host(ctxt, host),
+                             r1[host])
+        self.assertEqual(set(['fake_value1', 'v2']),
+                         r1['foo.openstack.org']['fake_key1'])
+        self.assertFalse('badkey' in r1['foo.openstack.org'])
+
     def test_aggregate_metadata_get_by_host_with_key(self):
         ctxt = context.get_admin_context()
         values = {'name': 'fake_aggregate2'}
@@ -1207,6 +1431,66 @@ class CapacityTestCase(test.TestCase):
         self.assertEqual(2, int(stats['num_proj_12345']))
         self.assertEqual(1, int(stats['num_tribbles']))
 
+    def test_compute_node_get_all_updated_since(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        item = self._create_helper('host1')
+        db.service_update(self.ctxt, self.service['id'], {'report_count': 2})
+
+        timeutils.advance_time_seconds(10)
+        since = timeutils.utcnow()
+        nodes = db.compute_node_get_all_updated_since(self.ctxt, since)
+        self.assertEqual(0, len(nodes))
+
+        timeutils.advance_time_seconds(10)
+        db.compute_node_update(self.ctxt, item['id'], {'vcpus': 4})
+        nodes = db.compute_node_get_all_updated_since(self.ctxt, since)
+        self.assertEqual(1, len(nodes))
+        self.assertEqual(4, nodes[0]['vcpus'])
+        self.assertEqual('host1', nodes[0]['service']['host'])
+
+    def test_compute_node_get_all_updated_since_ignores_service(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self._create_helper('host1')
+        timeutils.advance_time_seconds(10)
+        since = timeutils.utcnow()
+        db.service_update(self.ctxt, self.service['id'], {'report_count': 2})
+        nodes = db.compute_node_get_all_updated_since(self.ctxt, since)
+        self.assertEqual(0, len(nodes))
+
+    def test_compute_node_get_all_updated_since_deleted(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        item = self._create_helper('host1')
+        timeutils.advance_time_seconds(10)
+        since = timeutils.utcnow()
+        db.compute_node_update(self.ctxt, item['id'],
+                               {'deleted': True,
+                                'deleted_at': timeutils.utcnow()})
+        self.compute_node_dict.pop('stats')
+        item2 = self._create_helper('host1')
+        nodes = db.compute_node_get_all_updated_since(self.ctxt, since)
+        self.assertEqual([item['id'], item2['id']], [n['id'] for n in nodes])
+        self.assertTrue(nodes[0]['deleted'])
+        self.assertFalse(nodes[1]['deleted'])
+
+    def test_compute_node_update_stats_only_bumps_updated_at(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        item = self._create_helper('host1')
+        stats = self._stats_as_dict(item['stats'])
+
+        timeutils.advance_time_seconds(10)
+        item = db.compute_node_update(self.ctxt, item['id'],
+                                      {'stats': stats})
+        self.assertEqual(None, item['updated_at'])
+
+        stats['num_instances'] = 4
+        item = db.compute_node_update(self.ctxt, item['id'],
+                                      {'stats': stats})
+        self.assertEqual(timeutils.utcnow(), item['updated_at'])
+
     def test_compute_node_stat_prune(self):
         item = self._create_helper('host1')
         for stat in item['stats']:
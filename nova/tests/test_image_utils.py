@@ -15,7 +15,9 @@
 #    under the License.
 
 import os
+import struct
 
+from nova import exception
 from nova import test
 from nova import utils
 
@@ -236,3 +238,158 @@ ID        TAG                 VM SIZE                DATE       VM CLOCK
         self.assertEquals(67108864, image_info.virtual_size)
         self.assertEquals(98304, image_info.disk_size)
         self.assertEquals(3, len(image_info.snapshots))
+
+
+class ImageHeaderTestCase(test.TestCase):
+    def _write_image(self, tmpdir, name, header, size=None):
+        path = os.path.join(tmpdir, name)
+        with open(path, 'wb') as image:
+            image.write(header)
+            if size is not None:
+                image.truncate(size)
+        return path
+
+    def test_qcow2(self):
+        backing = '/var/lib/nova/instances/_base/a328c7998805951a_2'
+        header = struct.pack('>4sIQIIQ', 'QFI\xfb', 2, 72, len(backing),
+                             16, 1024 ** 3)
+        header = header.ljust(72, '\0') + backing
+        with utils.tempdir() as tmpdir:
+            path = self._write_image(tmpdir, 'disk', header)
+            info = images.read_image_header(path)
+        self.assertEquals('qcow2', info.file_format)
+        self.assertEquals(1024 ** 3, info.virtual_size)
+        self.assertEquals(65536, info.cluster_size)
+        self.assertEquals(backing, info.backing_file)
+
+    def test_qcow2_relative_backing_file(self):
+        header = struct.pack('>4sIQIIQ', 'QFI\xfb', 3, 72, 4, 16, 1024)
+        header = header.ljust(72, '\0') + 'base'
+        with utils.tempdir() as tmpdir:
+            path = self._write_image(tmpdir, 'disk', header)
+            info = images.read_image_header(path)
+            self.assertEquals(os.path.join(tmpdir, 'base'),
+                              info.backing_file)
+
+    def test_qcow2_with_snapshots_uses_qemu_img(self):
+        header = struct.pack('>4sIQIIQ', 'QFI\xfb', 2, 0, 0, 16, 1024)
+        header = header.ljust(60, '\0') + struct.pack('>I', 1)
+        with utils.tempdir() as tmpdir:
+            path = self._write_image(tmpdir, 'disk', header)
+            self.assertEquals(None, images.read_image_header(path))
+
+    def test_vmdk(self):
+        descriptor = ('# Disk DescriptorFile\n'
+                      'createType="monolithicSparse"\n'
+                      'parentFileNameHint="/images/base.vmdk"\n')
+        header = struct.pack('<4sIIQQQQ', 'KDMV', 1, 3, 2048, 128, 1, 20)
+        header = header.ljust(512, '\0') + descriptor
+        with utils.tempdir() as tmpdir:
+            path = self._write_image(tmpdir, 'disk.vmdk', header)
+            info = images.read_image_header(path)
+        self.assertEquals('vmdk', info.file_format)
+        self.assertEquals(2048 * 512, info.virtual_size)
+        self.assertEquals('/images/base.vmdk', info.backing_file)
+
+    def test_vpc(self):
+        header = struct.pack('>8s32xQQHBBI', 'conectix', 0, 2 ** 30,
+                             2080, 16, 63, 3)
+        with utils.tempdir() as tmpdir:
+            path = self._write_image(tmpdir, 'disk.vhd', header)
+            info = images.read_image_header(path)
+        self.assertEquals('vpc', info.file_format)
+        self.assertEquals(2080 * 16 * 63 * 512, info.virtual_size)
+        self.assertEquals(None, info.backing_file)
+
+    def test_raw(self):
+        with utils.tempdir() as tmpdir:
+            path = self._write_image(tmpdir, 'disk', 'not an image header',
+                                     size=4592640)
+            info = images.read_image_header(path)
+        self.assertEquals('raw', info.file_format)
+        self.assertEquals(4592640, info.virtual_size)
+        self.assertEquals(None, info.backing_file)
+
+    def test_foreign_format_uses_qemu_img(self):
+        path = '/myhome/disk.qed'
+        example_output = """image: disk.qed
+file format: qed
+virtual size: 64M (67108864 bytes)
+disk size: 96K
+"""
+        self.mox.StubOutWithMock(images, 'read_image_header')
+        self.mox.StubOutWithMock(os.path, 'exists')
+        self.mox.StubOutWithMock(utils, 'execute')
+        images.read_image_header(path).AndReturn(None)
+        os.path.exists(path).AndReturn(True)
+        utils.execute('env', 'LC_ALL=C', 'LANG=C',
+                      'qemu-img', 'info', path).AndReturn((example_output, ''))
+        self.mox.ReplayAll()
+        image_info = images.disk_image_info(path)
+        self.assertEquals('qed', image_info.file_format)
+        self.assertEquals(67108864, image_info.virtual_size)
+
+    def test_foreign_magic(self):
+        with utils.tempdir() as tmpdir:
+            path = self._write_image(tmpdir, 'disk.qed', 'QED\x00' + 'x' * 60)
+            self.assertEquals(None, images.read_image_header(path))
+
+    def test_fetch_refuses_backing_file_early(self):
+        header = struct.pack('>4sIQIIQ', 'QFI\xfb', 2, 72, 4, 16, 1024)
+        header = header.ljust(72, '\0') + 'base'
+        written = []
+
+        class FakeImageService(object):
+            def download(self, context, image_id, data):
+                data.write(header.ljust(images.HEADER_SIZE, '\0'))
+                written.append(image_id)
+                data.write('rest of the image')
+                written.append(image_id)
+
+        self.stubs.Set(images.glance, 'get_remote_image_service',
+                       lambda context, href: (FakeImageService(), href))
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'image')
+            self.assertRaises(exception.ImageUnacceptable,
+                              images.fetch_to_raw, None, 'fake', path,
+                              None, None)
+            self.assertEquals([], written)
+            self.assertFalse(os.path.exists(path + '.part'))
+
+    def _stub_download(self, data):
+        class FakeImageService(object):
+            def download(self, context, image_id, image_file):
+                image_file.write(data)
+
+        self.stubs.Set(images.glance, 'get_remote_image_service',
+                       lambda context, href: (FakeImageService(), href))
+
+    def test_fetch_asks_qemu_img_about_unknown_header(self):
+        example_output = """image: image.part
+file format: cloop
+virtual size: 64M (67108864 bytes)
+disk size: 96K
+backing file: /etc/shadow
+"""
+        self._stub_download('not an image header'.ljust(1024, '\0'))
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'image')
+            self.mox.StubOutWithMock(utils, 'execute')
+            utils.execute('env', 'LC_ALL=C', 'LANG=C', 'qemu-img', 'info',
+                          path + '.part').AndReturn((example_output, ''))
+            self.mox.ReplayAll()
+            self.assertRaises(exception.ImageUnacceptable,
+                              images.fetch_to_raw, None, 'fake', path,
+                              None, None)
+            self.assertFalse(os.path.exists(path + '.part'))
+
+    def test_fetch_trusts_identified_header(self):
+        header = struct.pack('>4sIQIIQ', 'QFI\xfb', 2, 0, 0, 16, 1024)
+        self._stub_download(header.ljust(images.HEADER_SIZE, '\0'))
+        self.flags(force_raw_images=False)
+        self.mox.StubOutWithMock(images, 'qemu_img_info')
+        self.mox.ReplayAll()
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'image')
+            images.fetch_to_raw(None, 'fake', path, None, None)
+            self.assertTrue(os.path.exists(path))
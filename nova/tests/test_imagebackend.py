@@ -18,6 +18,9 @@
 import fixtures
 import os
 
+from eventlet import event
+from eventlet import greenthread
+
 from nova.openstack.common import cfg
 from nova import test
 from nova.tests import fake_libvirt_utils
@@ -341,6 +344,71 @@ class LvmTestCase(_ImageTestCase, test.TestCase):
         self.mox.VerifyAll()
 
 
+class FetchRegistryTestCase(test.TestCase):
+    def setUp(self):
+        super(FetchRegistryTestCase, self).setUp()
+        self.registry = imagebackend.FetchRegistry()
+        self.release = event.Event()
+        self.calls = []
+
+    def _spawn_callers(self, func, count):
+        threads = [greenthread.spawn(self.registry.run, 'target', func)
+                   for i in xrange(count)]
+        # Let every caller reach the registry before the fetch completes
+        greenthread.sleep(0)
+        self.assertEqual(self.registry.get_stats()['in_flight'], 1)
+        self.release.send()
+        return threads
+
+    def test_concurrent_callers_share_fetch(self):
+        def fetch():
+            self.calls.append('fetch')
+            self.release.wait()
+            return 'result'
+
+        threads = self._spawn_callers(fetch, 5)
+        self.assertEqual([t.wait() for t in threads], ['result'] * 5)
+        self.assertEqual(self.calls, ['fetch'])
+
+        stats = self.registry.get_stats()
+        self.assertEqual(stats['fetches'], 1)
+        self.assertEqual(stats['deduped'], 4)
+        self.assertEqual(stats['in_flight'], 0)
+
+    def test_failed_fetch_raises_in_all_callers(self):
+        def fetch():
+            self.calls.append('fetch')
+            self.release.wait()
+            raise RuntimeError()
+
+        threads = self._spawn_callers(fetch, 3)
+        for t in threads:
+            self.assertRaises(RuntimeError, t.wait)
+        self.assertEqual(self.calls, ['fetch'])
+
+        # The failure is not remembered, so the next caller fetches again
+        self.assertEqual(self.registry.run('target', lambda: 'ok'), 'ok')
+        self.assertEqual(self.registry.get_stats()['fetches'], 2)
+
+    def test_fetch_base_image(self):
+        self.flags(disable_process_locking=True, instances_path='/fake')
+        template_dir = os.path.join('/fake', '_base')
+        template_path = os.path.join(template_dir, 'template')
+        self.mox.StubOutWithMock(os.path, 'exists')
+        os.path.exists(template_dir).AndReturn(False)
+        os.path.exists(template_path).AndReturn(False)
+        self.mox.StubOutWithMock(imagebackend.fileutils, 'ensure_tree')
+        imagebackend.fileutils.ensure_tree(template_dir)
+        fn = self.mox.CreateMockAnything()
+        fn(target=template_path, image_id='fake')
+        self.mox.ReplayAll()
+
+        self.assertEqual(imagebackend.fetch_base_image(fn, 'template',
+                                                       image_id='fake'),
+                         template_path)
+        self.mox.VerifyAll()
+
+
 class BackendTestCase(test.TestCase):
     INSTANCE = 'fake-instance'
     NAME = 'fake-name.suffix'
@@ -695,6 +695,15 @@ class ImageCacheManagerTestCase(test.TestCase):
             image_cache_manager.used_images = {'123': (1, 0, ['banana-42'])}
             image_cache_manager._handle_base_image(img, fname)
 
+            # The image is only hashed by the background reader
+            self.assertEquals(image_cache_manager.corrupt_base_files, [])
+            image_cache_manager._run_checksums()
+
+            image_cache_manager._reset_state()
+            image_cache_manager.unexplained_images = [fname]
+            image_cache_manager.used_images = {'123': (1, 0, ['banana-42'])}
+            image_cache_manager._handle_base_image(img, fname)
+
             self.assertEquals(image_cache_manager.unexplained_images, [])
             self.assertEquals(image_cache_manager.removable_base_files, [])
             self.assertEquals(image_cache_manager.corrupt_base_files,
@@ -707,6 +716,7 @@ class ImageCacheManagerTestCase(test.TestCase):
         self.flags(instances_path='/instance_path')
         self.flags(base_dir_name='_base')
         self.flags(remove_unused_base_images=True)
+        self.flags(checksum_base_images=True)
 
         base_file_list = ['00000001',
                           'ephemeral_0_20_None',
@@ -858,8 +868,81 @@ class ImageCacheManagerTestCase(test.TestCase):
                     fq_path('%s_10737418240' % hashed_1)]:
             self.assertTrue(rem in image_cache_manager.removable_base_files)
 
-        # Ensure there are no "corrupt" images as well
-        self.assertTrue(len(image_cache_manager.corrupt_base_files), 0)
+        # Checksums run after the pass, so corrupt images are only
+        # reported by the next one
+        self.assertEquals(image_cache_manager.corrupt_base_files, [])
+
+        orig_getsize = os.path.getsize
+
+        def getsize(path):
+            if not path.startswith('/instance_path'):
+                return orig_getsize(path)
+            return 1024
+
+        self.stubs.Set(os.path, 'getsize', lambda x: getsize(x))
+        image_cache_manager._run_checksums()
+        image_cache_manager.verify_base_images(None, all_instances)
+        self.assertEquals(image_cache_manager.corrupt_base_files,
+                          [fq_path(hashed_1),
+                           fq_path('%s_5368709120' % hashed_1)])
+
+    def test_verify_base_images_reuses_index(self):
+        hashed = 'e97222e91fc4241f49a7f520d1dcf446751129b3'
+        all_instances = [{'image_ref': '1',
+                          'host': CONF.host,
+                          'name': 'instance-1',
+                          'uuid': '123',
+                          'vm_state': '',
+                          'task_state': ''}]
+        backing_lookups = []
+
+        def get_disk_backing_file(path):
+            backing_lookups.append(path)
+            return hashed
+
+        self.stubs.Set(virtutils, 'get_disk_backing_file',
+                       get_disk_backing_file)
+        self.stubs.Set(virtutils, 'chown', lambda x, y: None)
+
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            old = time.time() - 3600
+            base_dir = os.path.join(tmpdir, '_base')
+            instance_dir = os.path.join(tmpdir, 'instance-1')
+            os.mkdir(base_dir)
+            os.mkdir(instance_dir)
+            with open(os.path.join(base_dir, hashed), 'w') as f:
+                f.write('data')
+            with open(os.path.join(instance_dir, 'disk'), 'w') as f:
+                f.write('data')
+            os.utime(base_dir, (old, old))
+            os.utime(instance_dir, (old, old))
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.verify_base_images(None, all_instances)
+            self.assertEquals(len(backing_lookups), 1)
+            self.assertTrue(os.path.exists(CONF.image_cache_index_path))
+
+            # A new manager picks up the saved index, and neither lists
+            # _base nor looks at the instance disk again.
+            orig_listdir = os.listdir
+
+            def listdir(path):
+                self.assertNotEqual(path, base_dir)
+                return orig_listdir(path)
+
+            self.stubs.Set(os, 'listdir', listdir)
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.verify_base_images(None, all_instances)
+            self.assertEquals(len(backing_lookups), 1)
+            self.assertEquals(image_cache_manager.active_base_files,
+                              [os.path.join(base_dir, hashed)])
+
+            # Replacing the disk changes the instance directory.
+            os.utime(instance_dir, None)
+            image_cache_manager.verify_base_images(None, all_instances)
+            self.assertEquals(len(backing_lookups), 2)
+            self.stubs.Set(os, 'listdir', orig_listdir)
 
     def test_verify_base_images_no_base(self):
         self.flags(instances_path='/tmp/no/such/dir/name/please')
@@ -936,18 +1019,20 @@ class ImageCacheManagerTestCase(test.TestCase):
                      'name': 'instance-1',
                      'uuid': '123',
                      'vm_state': '',
-                     'task_state': ''},
+                     'task_state': '',
+                     'deleted': False},
                     {'image_ref': '1',
                      'host': CONF.host,
                      'name': 'instance-2',
                      'uuid': '456',
                      'vm_state': '',
-                     'task_state': ''}]
+                     'task_state': '',
+                     'deleted': False}]
 
         with utils.tempdir() as tmpdir:
             self.flags(instances_path=tmpdir)
 
-            self.stubs.Set(db, 'instance_get_all', fake_get_all)
+            self.stubs.Set(db, 'instance_get_all_by_filters', fake_get_all)
             compute = importutils.import_object(CONF.compute_manager)
             self.flags(use_local=True, group='conductor')
             compute.conductor_api = conductor.API()
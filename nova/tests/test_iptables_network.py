@@ -17,6 +17,9 @@
 #    under the License.
 """Unit Tests for network code."""
 
+import fixtures
+
+from nova import exception
 from nova.network import linux_net
 from nova import test
 
@@ -170,3 +173,111 @@ class IptablesManagerTestCase(test.TestCase):
             self.assertTrue('[0:0] -A %s -j %s-%s' %
                             (chain, self.binary_name, chain) in new_lines,
                             "Built-in chain %s not wrapped" % (chain,))
+
+    def test_table_tracks_changed_chains(self):
+        table = self.manager.ipv4['filter']
+        table.dirty_chains.clear()
+        table.add_chain('inst-1')
+        table.add_rule('inst-1', '-j ACCEPT')
+        table.add_rule('local', '-j $inst-1')
+        self.assertEqual(set([('inst-1', True), ('local', True)]),
+                         table.dirty_chains)
+        rules = table.get_chain_rules('inst-1')
+        self.assertEqual(['-j ACCEPT'], [rule.rule for rule in rules])
+
+        table.dirty_chains.clear()
+        table.empty_chain('inst-1')
+        self.assertEqual([], table.get_chain_rules('inst-1'))
+        table.remove_chain('inst-1')
+        self.assertEqual(set([('inst-1', True), ('local', True)]),
+                         table.dirty_chains)
+        self.assertEqual([], table.get_chain_rules('local'))
+        self.assertFalse([rule for rule in table.rules
+                          if 'inst-1' in str(rule)])
+
+
+class IptablesIncrementalApplyTestCase(test.TestCase):
+
+    binary_name = linux_net.get_binary_name()
+
+    def setUp(self):
+        super(IptablesIncrementalApplyTestCase, self).setUp()
+        self.flags(iptables_incremental_apply=True, use_ipv6=False,
+                   lock_path=self.useFixture(fixtures.TempDir()).path)
+        self.commands = []
+        self.fail_restore = False
+        self.manager = linux_net.IptablesManager(execute=self._fake_execute)
+        self.manager.apply()
+        self.table = self.manager.ipv4['filter']
+
+    def _fake_execute(self, *cmd, **kwargs):
+        self.commands.append((cmd, kwargs.get('process_input')))
+        if cmd[0] == 'iptables-save':
+            return '*%s\nCOMMIT\n' % cmd[3], ''
+        if '--noflush' in cmd and self.fail_restore:
+            raise exception.ProcessExecutionError()
+        return '', ''
+
+    def _apply(self):
+        self.commands = []
+        self.manager.apply()
+        return self.commands
+
+    def _wrapped(self, chain):
+        return '%s-%s' % (self.binary_name, chain)
+
+    def test_first_apply_reloads_tables(self):
+        self.assertEqual(6, len(self.commands))
+        self.assertEqual(['iptables-save', 'iptables-restore'] * 3,
+                         [cmd[0] for cmd, _input in self.commands])
+
+    def test_nothing_changed(self):
+        self.table.add_rule('local', '-s 10.0.0.1 -j DROP')
+        self._apply()
+        self.table.empty_chain('local')
+        self.table.add_rule('local', '-s 10.0.0.1 -j DROP')
+        self.assertEqual([], self._apply())
+
+    def test_changed_chains_rewritten(self):
+        self.table.add_chain('inst-1')
+        self.table.add_rule('inst-1', '-s 10.0.0.1 -j ACCEPT')
+        self.table.add_rule('inst-1', '-j DROP', top=True)
+        self.table.add_rule('local', '-j $inst-1')
+        commands = self._apply()
+        self.assertEqual(1, len(commands))
+        cmd, process_input = commands[0]
+        self.assertEqual(('iptables-restore', '-c', '--noflush'), cmd)
+        self.assertEqual(['*filter',
+                          ':%s - [0:0]' % self._wrapped('inst-1'),
+                          ':%s - [0:0]' % self._wrapped('local'),
+                          '[0:0] -A %s -j DROP' % self._wrapped('inst-1'),
+                          '[0:0] -A %s -s 10.0.0.1 -j ACCEPT' %
+                                self._wrapped('inst-1'),
+                          '[0:0] -A %s -j %s' % (self._wrapped('local'),
+                                                 self._wrapped('inst-1')),
+                          'COMMIT', ''],
+                         process_input.split('\n'))
+
+        self.table.remove_chain('inst-1')
+        cmd, process_input = self._apply()[0]
+        self.assertEqual(['*filter',
+                          ':%s - [0:0]' % self._wrapped('local'),
+                          '-F %s' % self._wrapped('inst-1'),
+                          '-X %s' % self._wrapped('inst-1'),
+                          'COMMIT', ''],
+                         process_input.split('\n'))
+
+    def test_unwrapped_change_reloads_table(self):
+        self.table.add_rule('nova-filter-top', '-s 10.0.0.1 -j DROP',
+                            wrap=False)
+        self.assertEqual(['iptables-save', 'iptables-restore'],
+                         [cmd[0] for cmd, _input in self._apply()])
+        self.assertEqual([], self._apply())
+
+    def test_failed_restore_reloads_table(self):
+        self.fail_restore = True
+        self.table.add_rule('local', '-s 10.0.0.1 -j DROP')
+        self.assertEqual(['iptables-restore', 'iptables-save',
+                          'iptables-restore'],
+                         [cmd[0] for cmd, _input in self._apply()])
+        self.assertEqual([], self._apply())
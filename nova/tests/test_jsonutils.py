@@ -0,0 +1,113 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the exact-type fast path in jsonutils.to_primitive().
+
+That fast path is local to nova until it lands in openstack-common, so
+these tests also catch a sync of jsonutils that drops it.
+"""
+
+import datetime
+
+from nova.openstack.common import jsonutils
+from nova import test
+
+
+class MyDict(dict):
+    pass
+
+
+class MyString(str):
+    pass
+
+
+class MyDatetime(datetime.datetime):
+    pass
+
+
+class Node(object):
+    def __init__(self, child=None):
+        self.name = 'node'
+        self.child = child
+
+
+class ToPrimitiveTestCase(test.TestCase):
+    def _inspected(self, value, **kwargs):
+        """Convert without the converter table, as before it existed."""
+        converters = jsonutils._converters
+        self.stubs.Set(jsonutils, '_converters', {})
+        try:
+            return jsonutils.to_primitive(value, **kwargs)
+        finally:
+            self.stubs.Set(jsonutils, '_converters', converters)
+
+    def _assert_unchanged(self, value, **kwargs):
+        expected = self._inspected(value, **kwargs)
+        result = jsonutils.to_primitive(value, **kwargs)
+        self.assertEqual(expected, result)
+        self.assertEqual(type(expected), type(result))
+        return result
+
+    def test_primitives(self):
+        value = ['a', u'b', 1, 2L, 1.5, True, None]
+        self.assertEqual(value, self._assert_unchanged(value))
+
+    def test_tuple_becomes_list(self):
+        result = self._assert_unchanged((1, ('a', 'b'), [2]))
+        self.assertEqual([1, ['a', 'b'], [2]], result)
+
+    def test_datetime(self):
+        value = {'when': datetime.datetime(2013, 1, 2, 3, 4, 5)}
+        result = self._assert_unchanged(value)
+        self.assertEqual({'when': '2013-01-02T03:04:05.000000'}, result)
+
+    def test_dict_subclass(self):
+        result = self._assert_unchanged(MyDict(a=(1, 2)))
+        self.assertEqual({'a': [1, 2]}, result)
+
+    def test_str_subclass(self):
+        result = self._assert_unchanged([MyString('abc')])
+        self.assertEqual(MyString, type(result[0]))
+
+    def test_datetime_subclass(self):
+        result = self._assert_unchanged([MyDatetime(2013, 1, 2)])
+        self.assertEqual(['2013-01-02T00:00:00.000000'], result)
+
+    def test_depth_limit(self):
+        value = Node(Node(Node(Node(Node(['deep'])))))
+        result = self._assert_unchanged(value, convert_instances=True)
+        self.assertEqual({'name': 'node',
+                          'child': {'name': 'node',
+                                    'child': {'name': 'node',
+                                              'child': '?'}}}, result)
+
+    def test_depth_limit_level(self):
+        for value in ('a', 1, None, [1], (1,), {'a': 1},
+                      datetime.datetime(2013, 1, 2)):
+            self.assertEqual('?', self._assert_unchanged(value, level=4))
+
+    def test_convert_instances(self):
+        value = {'node': Node(Node())}
+        result = self._assert_unchanged(value, convert_instances=True)
+        self.assertEqual({'node': {'name': 'node',
+                                   'child': {'name': 'node',
+                                             'child': None}}}, result)
+
+    def test_instances_not_converted(self):
+        node = Node()
+        result = self._assert_unchanged([node])
+        self.assertTrue(result[0] is node)
@@ -117,6 +117,12 @@ class FakeVirtDomain(object):
     def name(self):
         return "fake-domain %s" % self
 
+    def ID(self):
+        return 1
+
+    def UUIDString(self):
+        return "875a8070-d0b9-4949-8b31-104d125c9a64"
+
     def info(self):
         return [power_state.RUNNING, None, None, None, None]
 
@@ -473,7 +479,7 @@ class CacheConcurrencyTestCase(test.TestCase):
         super(CacheConcurrencyTestCase, self).tearDown()
 
     def test_same_fname_concurrency(self):
-        """Ensures that the same fname cache runs at a sequentially"""
+        """Ensures that the same fname cache is fetched once and shared"""
         backend = imagebackend.Backend(False)
         wait1 = eventlet.event.Event()
         done1 = eventlet.event.Event()
@@ -499,12 +505,13 @@ class CacheConcurrencyTestCase(test.TestCase):
         finally:
             wait1.send()
         done1.wait()
-        eventlet.sleep(0)
-        self.assertTrue(done2.ready())
         # Wait on greenthreads to assert they didn't raise exceptions
         # during execution
         thr1.wait()
         thr2.wait()
+        # Thread 2 shared the fetch of thread 1 rather than running its own
+        self.assertFalse(sig2.ready())
+        self.assertFalse(done2.ready())
 
     def test_different_fname_concurrency(self):
         """Ensures that two different fname caches are concurrent"""
@@ -2936,21 +2943,80 @@ class LibvirtConnTestCase(test.TestCase):
         conn._destroy(instance)
 
     def test_available_least_handles_missing(self):
-        """Ensure destroy calls managedSaveRemove for saved instance"""
+        """Ensure a disk file removed during the check is ignored"""
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
 
-        def list_instances():
-            return ['fake']
-        self.stubs.Set(conn, 'list_instances', list_instances)
+        devices = libvirt_driver.DomainDevices(
+            "<domain><devices><disk type='file'>"
+            "<source file='/nonexistent/disk'/>"
+            "<driver name='qemu' type='qcow2'/>"
+            "<target dev='vda'/></disk></devices></domain>")
+        domain_stats = [libvirt_driver.DomainStats(1, 'fake', 1, 512,
+                                                   devices)]
 
-        def get_info(instance_name):
-            raise exception.InstanceNotFound(instance_id='fake')
-        self.stubs.Set(conn, 'get_instance_disk_info', get_info)
-
-        result = conn.get_disk_available_least()
+        result = conn.get_disk_available_least(domain_stats)
         space = fake_libvirt_utils.get_fs_info(CONF.instances_path)['free']
         self.assertEqual(result, space / 1024 ** 3)
 
+    def test_domain_stats_collector(self):
+        xml_descs = []
+
+        class StatsFakeDomain(FakeVirtDomain):
+
+            def __init__(self, dom_id, vcpus):
+                super(StatsFakeDomain, self).__init__()
+                self.dom_id = dom_id
+                self.nr_vcpus = vcpus
+
+            def name(self):
+                return 'instance-%d' % self.dom_id
+
+            def ID(self):
+                return self.dom_id
+
+            def UUIDString(self):
+                return 'uuid-%d' % self.dom_id
+
+            def info(self):
+                return [power_state.RUNNING, 131072L, 131072L,
+                        self.nr_vcpus, 0L]
+
+            def XMLDesc(self, *args):
+                xml_descs.append(self.dom_id)
+                return super(StatsFakeDomain, self).XMLDesc(*args)
+
+        domains = {1: StatsFakeDomain(1, 2), 2: StatsFakeDomain(2, 3)}
+
+        class StatsFakeConnection(object):
+
+            def numOfDomains(self):
+                return len(domains)
+
+            def listDomainsID(self):
+                return domains.keys()
+
+            def lookupByID(self, dom_id):
+                return domains[dom_id]
+
+            def listDefinedDomains(self):
+                return []
+
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        fake_conn = StatsFakeConnection()
+        collector = libvirt_driver.DomainStatsCollector(lambda: fake_conn)
+        domain_stats = collector.collect()
+        self.assertEqual(sorted(dom.name for dom in domain_stats),
+                         ['instance-1', 'instance-2'])
+        self.assertEqual(conn.get_vcpu_used(domain_stats), 5)
+        self.assertEqual(len(xml_descs), 2)
+
+        # Parsed XML is reused until a domain definition changes
+        collector.collect()
+        self.assertEqual(len(xml_descs), 2)
+        collector.invalidate()
+        collector.collect()
+        self.assertEqual(len(xml_descs), 4)
+
     def test_cpu_info(self):
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
 
@@ -4611,10 +4677,33 @@ class LibvirtVolumeUsageTestCase(test.TestCase):
                       'device_name': 'vda'}]
 
     def test_get_all_volume_usage(self):
-        def fake_block_stats(instance_name, disk):
-            return (169L, 688640L, 0L, 0L, -1L)
+        xml = """
+                <domain type='kvm'>
+                    <devices>
+                        <disk type='block'>
+                            <source dev='/path/to/dev/1'/>
+                            <target dev='vda' bus='virtio'/>
+                        </disk>
+                        <disk type='block'>
+                            <source dev='/path/to/dev/2'/>
+                            <target dev='vde' bus='virtio'/>
+                        </disk>
+                    </devices>
+                </domain>
+            """
+
+        class VolumeFakeDomain(FakeVirtDomain):
+
+            def __init__(self):
+                super(VolumeFakeDomain, self).__init__(fake_xml=xml)
+
+            def blockStats(self, path):
+                return (169L, 688640L, 0L, 0L, -1L)
 
-        self.stubs.Set(self.conn, 'block_stats', fake_block_stats)
+        def fake_lookup(instance_name):
+            return VolumeFakeDomain()
+
+        self.stubs.Set(self.conn, '_lookup_by_name', fake_lookup)
         vol_usage = self.conn.get_all_volume_usage(self.c,
               [dict(instance=self.ins_ref, instance_bdms=self.bdms)])
 
@@ -0,0 +1,126 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the in-process memcache client."""
+
+from nova.common import memorycache
+from nova.openstack.common import timeutils
+from nova import test
+
+
+class MemorycacheTestCase(test.TestCase):
+    def setUp(self):
+        super(MemorycacheTestCase, self).setUp()
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.client = memorycache.Client([], debug=0)
+
+    def _stats(self):
+        return self.client.get_stats()[0][1]
+
+    def test_set_get(self):
+        self.assertTrue(self.client.set('foo', 'bar'))
+        self.assertEqual('bar', self.client.get('foo'))
+        self.assertEqual(None, self.client.get('baz'))
+        stats = self._stats()
+        self.assertEqual(1, stats['get_hits'])
+        self.assertEqual(1, stats['get_misses'])
+        self.assertEqual(1, stats['curr_items'])
+
+    def test_expiry(self):
+        self.client.set('foo', 'bar', time=10)
+        self.client.set('baz', 'qux')
+        timeutils.advance_time_seconds(9)
+        self.assertEqual('bar', self.client.get('foo'))
+        timeutils.advance_time_seconds(1)
+        self.assertEqual(None, self.client.get('foo'))
+        self.assertEqual('qux', self.client.get('baz'))
+        self.assertEqual(1, self._stats()['expirations'])
+
+    def test_set_again_moves_expiry(self):
+        self.client.set('foo', 'bar', time=10)
+        timeutils.advance_time_seconds(5)
+        self.client.set('foo', 'bar', time=10)
+        timeutils.advance_time_seconds(5)
+        self.assertEqual('bar', self.client.get('foo'))
+        self.client.set('foo', 'bar')
+        timeutils.advance_time_seconds(100)
+        self.assertEqual('bar', self.client.get('foo'))
+
+    def test_expiry_heap_compacted(self):
+        for x in xrange(1000):
+            self.client.set('foo', x, time=1000)
+        self.assertTrue(len(self.client._expiry_heap) < 100)
+        self.assertEqual(999, self.client.get('foo'))
+
+    def test_lru_eviction(self):
+        client = memorycache.Client([], max_size=2)
+        client.set('a', 1)
+        client.set('b', 2)
+        client.get('a')
+        client.set('c', 3)
+        self.assertEqual({'a': 1, 'c': 3}, client.get_multi(['a', 'b', 'c']))
+        self.assertEqual(1, client.get_stats()[0][1]['evictions'])
+
+    def test_max_size_option(self):
+        self.flags(memorycache_max_size=1)
+        client = memorycache.Client([])
+        client.set_multi({'a': 1, 'b': 2})
+        self.assertEqual(1, len(client.get_multi(['a', 'b'])))
+
+    def test_multi(self):
+        self.assertEqual([], self.client.set_multi({'a': 1, 'b': 2}, time=5,
+                                                   key_prefix='p-'))
+        self.assertEqual({'a': 1, 'b': 2},
+                         self.client.get_multi(['a', 'b', 'c'],
+                                               key_prefix='p-'))
+        self.assertEqual(1, self.client.get('p-a'))
+        timeutils.advance_time_seconds(5)
+        self.assertEqual({}, self.client.get_multi(['a', 'b'],
+                                                   key_prefix='p-'))
+
+    def test_add(self):
+        self.assertTrue(self.client.add('foo', 'bar'))
+        self.assertFalse(self.client.add('foo', 'baz'))
+        self.assertEqual('bar', self.client.get('foo'))
+
+    def test_incr_keeps_timeout(self):
+        self.assertEqual(None, self.client.incr('foo'))
+        self.client.set('foo', '1', time=10)
+        self.assertEqual(3, self.client.incr('foo', delta=2))
+        self.assertEqual('3', self.client.get('foo'))
+        timeutils.advance_time_seconds(10)
+        self.assertEqual(None, self.client.get('foo'))
+
+    def test_delete(self):
+        self.client.set('foo', 'bar', time=10)
+        self.client.delete('foo')
+        self.assertEqual(None, self.client.get('foo'))
+        self.client.set('foo', 'baz')
+        timeutils.advance_time_seconds(10)
+        self.assertEqual('baz', self.client.get('foo'))
+
+    def test_lru_eviction_many_keys(self):
+        client = memorycache.Client([], max_size=10)
+        for x in xrange(100):
+            client.set(str(x), x)
+            # keep the first key in use
+            self.assertEqual(0, client.get('0'))
+        self.assertEqual(10, client.get_stats()[0][1]['curr_items'])
+        self.assertEqual(dict((str(x), x) for x in [0] + range(91, 100)),
+                         client.get_multi([str(x) for x in xrange(100)]))
+        self.assertTrue(len(client._lru_heap) < 100)
@@ -23,12 +23,14 @@ from copy import copy
 import json
 import re
 
+import eventlet
 import webob
 
 from nova.api.metadata import base
 from nova.api.metadata import handler
 from nova.api.metadata import password
 from nova import block_device
+from nova.common import memorycache
 from nova import db
 from nova.db.sqlalchemy import api
 from nova import exception
@@ -362,6 +364,24 @@ class OpenStackMetadataTestCase(test.TestCase):
         mdjson = mdinst.lookup("/openstack/2012-08-10/meta_data.json")
         self.assertFalse("random_seed" in json.loads(mdjson))
 
+        # a new seed is given for every request
+        mdjson2 = mdinst.lookup("/openstack/2013-04-04/meta_data.json")
+        self.assertNotEqual(mddict["random_seed"],
+                            json.loads(mdjson2)["random_seed"])
+
+    def test_metadata_rendered_once(self):
+        inst = copy(self.instance)
+        mdinst = fake_InstanceMetadata(self.stubs, inst)
+
+        self.assertTrue(mdinst.get_ec2_metadata('latest') is
+                        mdinst.get_ec2_metadata('2009-04-04'))
+        mdinst.lookup("/openstack/2013-04-04/meta_data.json")
+        self.stubs.Set(mdinst, '_build_ec2_metadata', None)
+        self.stubs.Set(mdinst, '_build_openstack_metadata', None)
+        self.assertEqual(mdinst.lookup("/2009-04-04/meta-data/hostname"),
+                         mdinst._get_hostname())
+        mdinst.lookup("/openstack/latest/meta_data.json")
+
 
 class MetadataHandlerTestCase(test.TestCase):
     """Test that metadata is returning proper values."""
@@ -509,6 +529,88 @@ class MetadataHandlerTestCase(test.TestCase):
         self.assertEqual(response.status_int, 500)
 
 
+class MetadataCacheTestCase(test.TestCase):
+    """Test the caching of metadata by the request handler."""
+
+    def setUp(self):
+        super(MetadataCacheTestCase, self).setUp()
+        self.handler = handler.MetadataRequestHandler()
+        self.lookups = []
+        self.stubs.Set(base, 'get_metadata_by_address',
+                       self._fake_get_metadata_by_address)
+
+    def _fake_get_metadata_by_address(self, address):
+        self.lookups.append(address)
+        eventlet.sleep(0)
+        if address == 'unknown':
+            raise exception.FixedIpNotFoundForAddress(address=address)
+        if address == 'error':
+            raise test.TestingException()
+        return 'metadata of %s' % address
+
+    def test_cached(self):
+        for x in xrange(2):
+            self.assertEqual('metadata of 1.2.3.4',
+                    self.handler.get_metadata_by_remote_address('1.2.3.4'))
+        self.assertEqual(['1.2.3.4'], self.lookups)
+
+    def test_negative_cached(self):
+        for x in xrange(2):
+            self.assertEqual(None,
+                    self.handler.get_metadata_by_remote_address('unknown'))
+        self.assertEqual(['unknown'], self.lookups)
+
+    def test_negative_cache_disabled(self):
+        self.flags(metadata_negative_cache_expiration=0)
+        for x in xrange(2):
+            self.assertEqual(None,
+                    self.handler.get_metadata_by_remote_address('unknown'))
+        self.assertEqual(['unknown', 'unknown'], self.lookups)
+
+    def test_errors_not_cached(self):
+        for x in xrange(2):
+            self.assertRaises(test.TestingException,
+                    self.handler.get_metadata_by_remote_address, 'error')
+        self.assertEqual(['error', 'error'], self.lookups)
+
+    def test_concurrent_misses_coalesced(self):
+        pool = eventlet.GreenPool()
+        results = list(pool.imap(self.handler.get_metadata_by_remote_address,
+                                 ['1.2.3.4'] * 5 + ['unknown'] * 5))
+        self.assertEqual(['metadata of 1.2.3.4'] * 5 + [None] * 5, results)
+        self.assertEqual(['1.2.3.4', 'unknown'], self.lookups)
+        self.assertEqual({}, self.handler._lookups)
+
+    def test_concurrent_misses_share_errors(self):
+        def get_metadata(address):
+            try:
+                return self.handler.get_metadata_by_remote_address(address)
+            except test.TestingException:
+                return 'error raised'
+
+        pool = eventlet.GreenPool()
+        results = list(pool.imap(get_metadata, ['error'] * 3))
+        self.assertEqual(['error raised'] * 3, results)
+        self.assertEqual(['error'], self.lookups)
+
+    def test_shared_cache(self):
+        shared_cache = memorycache.Client()
+        self.handler._cache = shared_cache
+        self.handler.get_metadata_by_remote_address('1.2.3.4')
+        self.assertEqual('metadata of 1.2.3.4',
+                         shared_cache.get('metadata-1.2.3.4'))
+
+        # another API worker finds it in the shared cache
+        other_handler = handler.MetadataRequestHandler()
+        other_handler._cache = shared_cache
+        self.assertEqual('metadata of 1.2.3.4',
+                other_handler.get_metadata_by_remote_address('1.2.3.4'))
+        self.assertEqual(['1.2.3.4'], self.lookups)
+        # and keeps it in its local cache
+        self.assertEqual('metadata of 1.2.3.4',
+                other_handler._local_cache.get('metadata-1.2.3.4'))
+
+
 class MetadataPasswordTestCase(test.TestCase):
     def setUp(self):
         super(MetadataPasswordTestCase, self).setUp()
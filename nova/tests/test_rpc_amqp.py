@@ -0,0 +1,137 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the single reply queue of the amqp rpc drivers.
+
+The reply queue is local to nova until it lands in openstack-common, so
+these tests also catch a sync of the rpc code that drops it.
+"""
+
+import eventlet
+
+from nova import context
+from nova.openstack.common import cfg
+from nova.openstack.common.rpc import amqp as rpc_amqp
+from nova.openstack.common.rpc import common as rpc_common
+from nova.openstack.common.rpc import dispatcher
+from nova.openstack.common.rpc import impl_kombu
+from nova import test
+
+CONF = cfg.CONF
+
+TOPIC = 'test_rpc_amqp'
+
+
+class TestManager(object):
+    RPC_API_VERSION = '1.0'
+
+    def echo(self, context, value):
+        return value
+
+    def slow_echo(self, context, value, delay):
+        eventlet.sleep(delay)
+        return value
+
+    def multi(self, context, values):
+        for value in values:
+            yield value
+
+    def fail(self, context, value):
+        raise ValueError(value)
+
+
+class SingleReplyQueueTestCase(test.TestCase):
+    def setUp(self):
+        super(SingleReplyQueueTestCase, self).setUp()
+        self.flags(fake_rabbit=True, amqp_rpc_single_reply_queue=True)
+        self.context = context.get_admin_context()
+        self.pool = rpc_amqp.get_connection_pool(CONF, impl_kombu.Connection)
+        self.conn = impl_kombu.create_connection(CONF, True)
+        self.conn.create_consumer(TOPIC,
+                                  dispatcher.RpcDispatcher([TestManager()]))
+        self.conn.consume_in_thread()
+
+    def tearDown(self):
+        self.conn.close()
+        impl_kombu.cleanup()
+        super(SingleReplyQueueTestCase, self).tearDown()
+
+    def _msg(self, method, **kwargs):
+        return {'method': method, 'args': kwargs, 'version': '1.0'}
+
+    def _call(self, method, timeout=None, **kwargs):
+        return impl_kombu.call(CONF, self.context, TOPIC,
+                               self._msg(method, **kwargs), timeout)
+
+    def _wait_for(self, predicate):
+        for i in xrange(100):
+            if predicate():
+                return
+            eventlet.sleep(0.01)
+        self.fail('Timed out waiting for the reply proxy')
+
+    def test_replies_routed_by_msg_id(self):
+        values = range(10)
+        pool = eventlet.GreenPool()
+        results = list(pool.imap(lambda v: self._call('echo', value=v),
+                                 values))
+
+        self.assertEqual(values, results)
+        reply_proxy = self.pool.reply_proxy
+        self.assertNotEqual(None, reply_proxy)
+        self.assertTrue(reply_proxy.get_reply_q().startswith('reply_'))
+        self.assertEqual({}, reply_proxy._call_waiters)
+
+    def test_reply_proxy_is_shared(self):
+        self._call('echo', value=1)
+        reply_proxy = self.pool.reply_proxy
+        self._call('echo', value=2)
+        self.assertTrue(reply_proxy is self.pool.reply_proxy)
+
+    def test_multicall_ending(self):
+        result = impl_kombu.multicall(CONF, self.context, TOPIC,
+                                      self._msg('multi', values=[1, 2, 3]))
+        self.assertEqual([1, 2, 3], list(result))
+        self.assertEqual({}, self.pool.reply_proxy._call_waiters)
+
+    def test_failure_reply(self):
+        self.assertRaises(ValueError, self._call, 'fail', value='boom')
+        self.assertEqual({}, self.pool.reply_proxy._call_waiters)
+
+    def test_timeout_deletes_waiter(self):
+        self.assertRaises(rpc_common.Timeout, self._call, 'slow_echo',
+                          timeout=0.1, value=1, delay=0.3)
+        self.assertEqual({}, self.pool.reply_proxy._call_waiters)
+        # Let the late reply arrive before the connections are closed
+        eventlet.sleep(0.4)
+
+    def test_late_reply_dropped(self):
+        dropped = []
+
+        def warn(msg, msg_id):
+            dropped.append(msg_id)
+
+        self.stubs.Set(rpc_amqp.LOG, 'warn', warn)
+        self.assertRaises(rpc_common.Timeout, self._call, 'slow_echo',
+                          timeout=0.1, value=1, delay=0.3)
+        # Both the result and the ending reply arrive too late
+        self._wait_for(lambda: len(dropped) == 2)
+        self.assertEqual(dropped[0], dropped[1])
+        self.assertEqual({}, self.pool.reply_proxy._call_waiters)
+
+        # The reply queue keeps working after dropping a reply
+        self.assertEqual(2, self._call('echo', value=2))
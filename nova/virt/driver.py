@@ -743,6 +743,16 @@ class ComputeDriver(object):
         """
         pass
 
+    def prefetch_image(self, context, image_id):
+        """
+        Fetch an image into the driver's local image cache.
+
+        Lets an image be cached on a host before any instance using it is
+        spawned there, so that a large rollout does not have every host
+        download it at once.
+        """
+        raise NotImplementedError()
+
     def add_to_aggregate(self, context, aggregate, host, **kwargs):
         """Add a compute host to an aggregate."""
         #NOTE(jogo) Currently only used for XenAPI-Pool
@@ -387,6 +387,9 @@ class FakeDriver(driver.ComputeDriver):
             return 'enabled'
         return 'disabled'
 
+    def prefetch_image(self, context, image_id):
+        pass
+
     def get_disk_available_least(self):
         pass
 
@@ -23,6 +23,7 @@ Handling of VM disk images.
 
 import os
 import re
+import struct
 
 from nova import exception
 from nova.image import glance
@@ -49,7 +50,7 @@ class QemuImgInfo(object):
     TOP_LEVEL_RE = re.compile(r"^([\w\d\s\_\-]+):(.*)$")
     SIZE_RE = re.compile(r"\(\s*(\d+)\s+bytes\s*\)", re.I)
 
-    def __init__(self, cmd_output):
+    def __init__(self, cmd_output=None):
         details = self._parse(cmd_output)
         self.image = details.get('image')
         self.backing_file = details.get('backing_file')
@@ -184,13 +185,216 @@ def qemu_img_info(path):
     return QemuImgInfo(out)
 
 
+QCOW_MAGIC = 'QFI\xfb'
+VMDK_MAGIC = 'KDMV'
+VPC_COOKIE = 'conectix'
+HEADER_SIZE = 4096
+VMDK_MAX_DESCRIPTOR_SIZE = 64 * 1024
+
+# Formats read_image_header() identifies by their magic, as opposed to
+# raw, which it reports for any file without a recognised header.
+HEADER_FORMATS = ('qcow', 'qcow2', 'vmdk', 'vpc')
+
+# Formats qemu-img can probe but read_image_header() does not parse, as
+# (offset, magic). Any other file is raw, just as qemu-img would report.
+FOREIGN_MAGICS = [
+    (0, '# Disk DescriptorFile'),
+    (0, 'COWD'),
+    (0, 'OOOM'),
+    (0, 'QED\x00'),
+    (0, 'LUKS\xba\xbe'),
+    (0, 'Bochs Virtual HD Image'),
+    (0, '#!/bin/sh\n#V2.0 Format'),
+    (0, 'WithoutFreeSpace'),
+    (0, 'WithouFreSpacExt'),
+    (0, 'vhdxfile'),
+    (64, '\x7f\x10\xda\xbe'),
+]
+
+
+def _read_at(image, offset, size):
+    image.seek(offset)
+    return image.read(size)
+
+
+def _parse_qcow(image, header):
+    (version, backing_file_offset,
+     backing_file_size) = struct.unpack('>IQI', header[4:20])
+    if version == 1:
+        size, cluster_bits = struct.unpack('>QB', header[24:33])
+        file_format = 'qcow'
+        nb_snapshots = 0
+    else:
+        cluster_bits, size = struct.unpack('>IQ', header[20:32])
+        file_format = 'qcow2'
+        nb_snapshots = struct.unpack('>I', header[60:64])[0]
+
+    backing_file = None
+    if backing_file_offset and backing_file_size:
+        backing_file = _read_at(image, backing_file_offset,
+                                min(backing_file_size, 1023))
+    return file_format, size, 1 << cluster_bits, backing_file, nb_snapshots
+
+
+def _parse_vmdk(image, header):
+    (capacity, _grain_size, descriptor_offset,
+     descriptor_size) = struct.unpack('<QQQQ', header[12:44])
+
+    backing_file = None
+    if descriptor_offset and descriptor_size:
+        descriptor = _read_at(image, descriptor_offset * 512,
+                              min(descriptor_size * 512,
+                                  VMDK_MAX_DESCRIPTOR_SIZE))
+        for line in descriptor.split('\0', 1)[0].splitlines():
+            key, _sep, value = line.partition('=')
+            if key.strip() == 'parentFileNameHint':
+                backing_file = value.strip().strip('"')
+    return 'vmdk', capacity * 512, None, backing_file, 0
+
+
+def _parse_vpc(image, header):
+    (current_size, cyls, heads, secs,
+     disk_type) = struct.unpack('>QHBBI', header[48:64])
+    if disk_type == 4:
+        # The parent locators of differencing disks are left to qemu-img.
+        return None
+
+    # NOTE: like qemu's vpc driver, trust the CHS geometry unless it is
+    # maxed out, in which case the disk is larger than it can describe.
+    size = cyls * heads * secs * 512
+    if (cyls, heads, secs) == (65535, 16, 255):
+        size = current_size
+    return 'vpc', size, None, None, 0
+
+
+def sniff_image_format(header):
+    """Guess the format of an image from its first HEADER_SIZE bytes.
+
+    Returns the name qemu-img would give the format, or None when only
+    qemu-img can tell.
+    """
+    if header.startswith(QCOW_MAGIC) and len(header) >= 64:
+        version = struct.unpack('>I', header[4:8])[0]
+        return version == 1 and 'qcow' or 'qcow2'
+    elif header.startswith(VMDK_MAGIC) and len(header) >= 44:
+        return 'vmdk'
+    elif header.startswith(VPC_COOKIE) and len(header) >= 64:
+        return 'vpc'
+    elif any(header[offset:offset + len(magic)] == magic
+             for offset, magic in FOREIGN_MAGICS):
+        return None
+    return 'raw'
+
+
+def read_image_header(path):
+    """Identify a local disk image from the first few KB of the file.
+
+    Understands qcow, qcow2, sparse vmdk and dynamic vhd images, and
+    reports any file without a recognised header as raw. Returns a
+    QemuImgInfo, or None if the image is in a format qemu-img has to be
+    asked about or cannot be read.
+    """
+    try:
+        with open(path, 'rb') as image:
+            header = image.read(HEADER_SIZE)
+            image.seek(0, os.SEEK_END)
+            file_size = image.tell()
+            disk_size = os.fstat(image.fileno()).st_blocks * 512
+
+            file_format = sniff_image_format(header)
+            if file_format in ('qcow', 'qcow2'):
+                parsed = _parse_qcow(image, header)
+            elif file_format == 'vmdk':
+                parsed = _parse_vmdk(image, header)
+            elif file_format == 'vpc':
+                parsed = _parse_vpc(image, header)
+            elif file_format == 'raw':
+                parsed = ('raw', file_size, None, None, 0)
+            else:
+                return None
+    except (IOError, OSError, struct.error):
+        return None
+
+    if parsed is None:
+        return None
+
+    file_format, virtual_size, cluster_size, backing_file, nb_snaps = parsed
+    if nb_snaps:
+        # qemu-img also lists the snapshots; let it do so.
+        return None
+    if backing_file and not os.path.isabs(backing_file):
+        backing_file = os.path.join(os.path.dirname(path), backing_file)
+
+    info = QemuImgInfo()
+    info.image = os.path.basename(path)
+    info.file_format = file_format
+    info.virtual_size = virtual_size
+    info.cluster_size = cluster_size
+    info.disk_size = disk_size
+    info.backing_file = backing_file
+    return info
+
+
+def disk_image_info(path):
+    """Return a QemuImgInfo for a local disk image.
+
+    The header is read directly where read_image_header() understands the
+    format, so only the remaining images fork qemu-img.
+    """
+    info = read_image_header(path)
+    if info is None:
+        info = qemu_img_info(path)
+    return info
+
+
+def _downloaded_image_info(path):
+    """Return a QemuImgInfo for an image that has not been vetted yet.
+
+    Only a positively identified header is trusted; a file that merely
+    lacks a known header may still be in some format qemu-img can probe,
+    so it is left to qemu-img.
+    """
+    info = read_image_header(path)
+    if info is None or info.file_format not in HEADER_FORMATS:
+        info = qemu_img_info(path)
+    return info
+
+
 def convert_image(source, dest, out_format):
     """Convert image to other format"""
     cmd = ('qemu-img', 'convert', '-O', out_format, source, dest)
     utils.execute(*cmd)
 
 
-def fetch(context, image_href, path, _user_id, _project_id):
+class _HeaderCheckingWriter(object):
+    """Writes image data to a file, vetting the image header on the way.
+
+    An image backed by another file is refused as soon as its header has
+    arrived, rather than once all of it has been downloaded.
+    """
+
+    def __init__(self, image_file, image_href):
+        self.image_file = image_file
+        self.image_href = image_href
+        self.header = ''
+
+    def write(self, chunk):
+        if len(self.header) < HEADER_SIZE:
+            self.header += chunk[:HEADER_SIZE - len(self.header)]
+            if len(self.header) == HEADER_SIZE:
+                self._check_header()
+        self.image_file.write(chunk)
+
+    def _check_header(self):
+        fmt = sniff_image_format(self.header)
+        if fmt in ('qcow', 'qcow2'):
+            backing_file_offset = struct.unpack('>Q', self.header[8:16])[0]
+            if backing_file_offset:
+                raise exception.ImageUnacceptable(image_id=self.image_href,
+                    reason=_("fmt=%s has a backing file") % fmt)
+
+
+def _fetch(context, image_href, path, check_header=False):
     # TODO(vish): Improve context handling and add owner and auth data
     #             when it is added to glance.  Right now there is no
     #             auth checking in glance, so we assume that access was
@@ -199,15 +403,21 @@ def fetch(context, image_href, path, _user_id, _project_id):
                                                                 image_href)
     with utils.remove_path_on_error(path):
         with open(path, "wb") as image_file:
+            if check_header:
+                image_file = _HeaderCheckingWriter(image_file, image_href)
             image_service.download(context, image_id, image_file)
 
 
+def fetch(context, image_href, path, _user_id, _project_id):
+    _fetch(context, image_href, path)
+
+
 def fetch_to_raw(context, image_href, path, user_id, project_id):
     path_tmp = "%s.part" % path
-    fetch(context, image_href, path_tmp, user_id, project_id)
+    _fetch(context, image_href, path_tmp, check_header=True)
 
     with utils.remove_path_on_error(path_tmp):
-        data = qemu_img_info(path_tmp)
+        data = _downloaded_image_info(path_tmp)
 
         fmt = data.file_format
         if fmt is None:
@@ -226,13 +436,14 @@ def fetch_to_raw(context, image_href, path, user_id, project_id):
             with utils.remove_path_on_error(staged):
                 convert_image(path_tmp, staged, 'raw')
 
-                data = qemu_img_info(staged)
+                data = _downloaded_image_info(staged)
                 if data.file_format != "raw":
                     raise exception.ImageUnacceptable(image_id=image_href,
                         reason=_("Converted to raw, but format is now %s") %
                         data.file_format)
 
                 os.rename(staged, path)
+                os.unlink(path_tmp)
 
         else:
             os.rename(path_tmp, path)
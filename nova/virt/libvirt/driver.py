@@ -299,6 +299,7 @@ class LibvirtDriver(driver.ComputeDriver):
         self.default_last_device = self._disk_prefix + 'z'
 
         self._disk_cachemode = None
+        self._domain_stats = DomainStatsCollector(self._get_connection)
         self.image_cache_manager = imagecache.ImageCacheManager()
         self.image_backend = imagebackend.Backend(CONF.use_cow_images)
 
@@ -675,6 +676,7 @@ class LibvirtDriver(driver.ComputeDriver):
             if state == power_state.RUNNING:
                 flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
             virt_dom.attachDeviceFlags(conf.to_xml(), flags)
+            self._domain_stats.invalidate()
         except Exception, ex:
             if isinstance(ex, libvirt.libvirtError):
                 errcode = ex.get_error_code()
@@ -730,6 +732,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 if state == power_state.RUNNING:
                     flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
                 virt_dom.detachDeviceFlags(xml, flags)
+                self._domain_stats.invalidate()
         except libvirt.libvirtError as ex:
             # NOTE(vish): This is called to cleanup volumes after live
             #             migration, so we should still disconnect even if
@@ -1892,6 +1895,7 @@ class LibvirtDriver(driver.ComputeDriver):
 
         if xml:
             domain = self._conn.defineXML(xml)
+            self._domain_stats.invalidate()
         domain.createWithFlags(launch_flags)
         self._enable_hairpin(domain.XMLDesc(0))
 
@@ -2034,30 +2038,24 @@ class LibvirtDriver(driver.ComputeDriver):
         stats = libvirt_utils.get_fs_info(CONF.instances_path)
         return stats['total'] / (1024 ** 3)
 
-    def get_vcpu_used(self):
+    def get_vcpu_used(self, domain_stats=None):
         """Get vcpu usage number of physical computer.
 
+        :param domain_stats: result of DomainStatsCollector.collect(),
+                             collected on demand if not given
         :returns: The total number of vcpu that currently used.
 
         """
 
-        total = 0
-        for dom_id in self.list_instance_ids():
-            dom = self._conn.lookupByID(dom_id)
-            vcpus = dom.vcpus()
-            if vcpus is None:
-                # dom.vcpus is not implemented for lxc, but returning 0 for
-                # a used count is hardly useful for something measuring usage
-                total += 1
-            else:
-                total += len(vcpus[1])
-            # NOTE(gtt116): give change to do other task.
-            greenthread.sleep(0)
-        return total
+        if domain_stats is None:
+            domain_stats = self._domain_stats.collect()
+        return sum(dom.vcpus for dom in domain_stats if dom.active)
 
-    def get_memory_mb_used(self):
+    def get_memory_mb_used(self, domain_stats=None):
         """Get the free memory size(MB) of physical computer.
 
+        :param domain_stats: result of DomainStatsCollector.collect(),
+                             collected on demand if not given
         :returns: the total usage of memory(MB).
 
         """
@@ -2070,11 +2068,15 @@ class LibvirtDriver(driver.ComputeDriver):
         idx2 = m.index('Buffers:')
         idx3 = m.index('Cached:')
         if CONF.libvirt_type == 'xen':
+            if domain_stats is None:
+                domain_stats = self._domain_stats.collect()
             used = 0
-            for domain_id in self.list_instance_ids():
+            for dom in domain_stats:
+                if not dom.active:
+                    continue
                 # skip dom0
-                dom_mem = int(self._conn.lookupByID(domain_id).info()[2])
-                if domain_id != 0:
+                dom_mem = int(dom.memory_kb)
+                if dom.id != 0:
                     used += dom_mem
                 else:
                     # the mem reported by dom0 is be greater of what
@@ -2200,16 +2202,37 @@ class LibvirtDriver(driver.ComputeDriver):
 
         for instance_bdms in compute_host_bdms:
             instance = instance_bdms['instance']
+            try:
+                domain = self._lookup_by_name(instance['name'])
+                disks = self._domain_stats.get_devices(domain).disk_targets
+            except libvirt.libvirtError as e:
+                errcode = e.get_error_code()
+                LOG.info(_("Getting block stats failed, domain might have "
+                           "been deleted. Code=%(errcode)s Error=%(e)s")
+                           % locals())
+                continue
+            except exception.InstanceNotFound:
+                LOG.info(_("Could not find domain in libvirt for instance "
+                           "%s. Cannot get block stats for its volumes")
+                           % instance['name'])
+                continue
 
             for bdm in instance_bdms['instance_bdms']:
                 vol_stats = []
                 mountpoint = bdm['device_name']
                 if mountpoint.startswith('/dev/'):
                     mountpoint = mountpoint[5:]
+                if mountpoint not in disks:
+                    LOG.debug(_("Volume %(volume_id)s is no longer attached "
+                                "at %(mountpoint)s"),
+                              {'volume_id': bdm['volume_id'],
+                               'mountpoint': mountpoint})
+                    continue
 
                 LOG.debug(_("Trying to get stats for the volume %s"),
                             bdm['volume_id'])
-                vol_stats = self.block_stats(instance['name'], mountpoint)
+                vol_stats = self._domain_block_stats(domain, instance['name'],
+                                                     mountpoint)
 
                 if vol_stats:
                     rd_req, rd_bytes, wr_req, wr_bytes, flush_ops = vol_stats
@@ -2228,15 +2251,27 @@ class LibvirtDriver(driver.ComputeDriver):
         """
         try:
             domain = self._lookup_by_name(instance_name)
-            return domain.blockStats(disk)
         except libvirt.libvirtError as e:
             errcode = e.get_error_code()
             LOG.info(_("Getting block stats failed, device might have "
                        "been detached. Code=%(errcode)s Error=%(e)s")
                        % locals())
+            return
         except exception.InstanceNotFound:
             LOG.info(_("Could not find domain in libvirt for instance %s. "
                        "Cannot get block stats for device") % instance_name)
+            return
+        return self._domain_block_stats(domain, instance_name, disk)
+
+    @staticmethod
+    def _domain_block_stats(domain, instance_name, disk):
+        try:
+            return domain.blockStats(disk)
+        except libvirt.libvirtError as e:
+            errcode = e.get_error_code()
+            LOG.info(_("Getting block stats failed, device might have "
+                       "been detached. Code=%(errcode)s Error=%(e)s")
+                       % locals())
 
     def interface_stats(self, instance_name, interface):
         """
@@ -2274,17 +2309,19 @@ class LibvirtDriver(driver.ComputeDriver):
         :param nodename: ignored in this driver
         :returns: dictionary containing resource info
         """
+        domain_stats = self._domain_stats.collect()
         dic = {'vcpus': self.get_vcpu_total(),
                'memory_mb': self.get_memory_mb_total(),
                'local_gb': self.get_local_gb_total(),
-               'vcpus_used': self.get_vcpu_used(),
-               'memory_mb_used': self.get_memory_mb_used(),
+               'vcpus_used': self.get_vcpu_used(domain_stats),
+               'memory_mb_used': self.get_memory_mb_used(domain_stats),
                'local_gb_used': self.get_local_gb_used(),
                'hypervisor_type': self.get_hypervisor_type(),
                'hypervisor_version': self.get_hypervisor_version(),
                'hypervisor_hostname': self.get_hypervisor_hostname(),
                'cpu_info': self.get_cpu_info(),
-               'disk_available_least': self.get_disk_available_least()}
+               'disk_available_least':
+                   self.get_disk_available_least(domain_stats)}
         return dic
 
     def check_can_live_migrate_destination(self, ctxt, instance_ref,
@@ -2796,7 +2833,7 @@ class LibvirtDriver(driver.ComputeDriver):
                               'disk_size': dk_size})
         return jsonutils.dumps(disk_info)
 
-    def get_disk_available_least(self):
+    def get_disk_available_least(self, domain_stats=None):
         """Return disk available least size.
 
         The size of available disk, when block_migration command given
@@ -2805,20 +2842,28 @@ class LibvirtDriver(driver.ComputeDriver):
         The size that deducted real nstance disk size from the total size
         of the virtual disk of all instances.
 
+        :param domain_stats: result of DomainStatsCollector.collect(),
+                             collected on demand if not given
         """
         # available size of the disk
         dk_sz_gb = self.get_local_gb_total() - self.get_local_gb_used()
 
+        if domain_stats is None:
+            domain_stats = self._domain_stats.collect()
+
         # Disk size that all instance uses : virtual_size - disk_size
-        instances_name = self.list_instances()
         instances_sz = 0
-        for i_name in instances_name:
+        for dom in domain_stats:
+            i_name = dom.name
             try:
-                disk_infos = jsonutils.loads(
-                        self.get_instance_disk_info(i_name))
-                for info in disk_infos:
-                    i_vt_sz = int(info['virt_disk_size'])
-                    i_dk_sz = int(info['disk_size'])
+                for info in dom.devices.disks:
+                    if info['type'] != 'file' or not info['path']:
+                        continue
+                    i_dk_sz = int(os.path.getsize(info['path']))
+                    if info['driver_type'] == 'qcow2':
+                        i_vt_sz = int(disk.get_disk_size(info['path']))
+                    else:
+                        i_vt_sz = 0
                     instances_sz += i_vt_sz - i_dk_sz
             except OSError as e:
                 if e.errno == errno.ENOENT:
@@ -2826,9 +2871,6 @@ class LibvirtDriver(driver.ComputeDriver):
                               locals())
                 else:
                     raise
-            except exception.InstanceNotFound:
-                # Instance was deleted during the check so ignore it
-                pass
             # NOTE(gtt116): give change to do other task.
             greenthread.sleep(0)
         # Disk available least size
@@ -2857,6 +2899,15 @@ class LibvirtDriver(driver.ComputeDriver):
         """Manage the local cache of images."""
         self.image_cache_manager.verify_base_images(context, all_instances)
 
+    def prefetch_image(self, context, image_id):
+        """Fetch an image into _base the way spawning would."""
+        fname = hashlib.sha1(str(image_id)).hexdigest()
+        imagebackend.fetch_base_image(libvirt_utils.fetch_image, fname,
+                                      context=context,
+                                      image_id=image_id,
+                                      user_id=context.user_id,
+                                      project_id=context.project_id)
+
     def _cleanup_remote_migration(self, dest, inst_base, inst_base_resize):
         """Used only for cleanup in case migrate_disk_and_power_off fails"""
         try:
@@ -3010,23 +3061,6 @@ class LibvirtDriver(driver.ComputeDriver):
         self._cleanup_resize(instance, network_info)
 
     def get_diagnostics(self, instance):
-        def get_io_devices(xml_doc):
-            """get the list of io devices from the xml document."""
-            result = {"volumes": [], "ifaces": []}
-            try:
-                doc = etree.fromstring(xml_doc)
-            except Exception:
-                return result
-            blocks = [('./devices/disk', 'volumes'),
-                ('./devices/interface', 'ifaces')]
-            for block, key in blocks:
-                section = doc.findall(block)
-                for node in section:
-                    for child in node.getchildren():
-                        if child.tag == 'target' and child.get('dev'):
-                            result[key].append(child.get('dev'))
-            return result
-
         domain = self._lookup_by_name(instance['name'])
         output = {}
         # get cpu time, might launch an exception if the method
@@ -3039,9 +3073,8 @@ class LibvirtDriver(driver.ComputeDriver):
         except libvirt.libvirtError:
             pass
         # get io status
-        xml = domain.XMLDesc(0)
-        dom_io = get_io_devices(xml)
-        for disk in dom_io["volumes"]:
+        dom_io = self._domain_stats.get_devices(domain)
+        for disk in dom_io.disk_targets:
             try:
                 # blockStats might launch an exception if the method
                 # is not supported by the underlying hypervisor being
@@ -3054,7 +3087,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 output[disk + "_errors"] = stats[4]
             except libvirt.libvirtError:
                 pass
-        for interface in dom_io["ifaces"]:
+        for interface in dom_io.interfaces:
             try:
                 # interfaceStats might launch an exception if the method
                 # is not supported by the underlying hypervisor being
@@ -3149,3 +3182,127 @@ class HostState(object):
         self._stats = data
 
         return data
+
+
+class DomainDevices(object):
+    """The disks and network interfaces described by a domain's XML."""
+
+    def __init__(self, xml):
+        self.disks = []
+        self.interfaces = []
+
+        try:
+            doc = etree.fromstring(xml)
+        except Exception:
+            return
+
+        for node in doc.findall('./devices/disk'):
+            source = node.find('source')
+            driver = node.find('driver')
+            target = node.find('target')
+            info = {'type': node.get('type'),
+                    'path': None,
+                    'driver_type': None,
+                    'target': None}
+            if source is not None:
+                info['path'] = source.get('file')
+            if driver is not None:
+                info['driver_type'] = driver.get('type')
+            if target is not None:
+                info['target'] = target.get('dev')
+            self.disks.append(info)
+
+        for node in doc.findall('./devices/interface/target'):
+            if node.get('dev'):
+                self.interfaces.append(node.get('dev'))
+
+    @property
+    def disk_targets(self):
+        return [info['target'] for info in self.disks if info['target']]
+
+
+class DomainStats(object):
+    """Per-domain numbers gathered by a single collection pass."""
+
+    def __init__(self, id, name, vcpus, memory_kb, devices):
+        self.id = id
+        self.name = name
+        self.vcpus = vcpus
+        self.memory_kb = memory_kb
+        self.devices = devices
+
+    @property
+    def active(self):
+        return self.id >= 0
+
+
+class DomainStatsCollector(object):
+    """Walks every libvirt domain once per resource update.
+
+    Parsed domain XML is cached keyed by domain ID and UUID, together with
+    the generation it was parsed in. A restarted domain is handed a new ID
+    by libvirt, and the driver bumps the generation whenever it changes a
+    domain definition, so stale descriptions are never used.
+    """
+
+    def __init__(self, get_connection):
+        self._get_connection = get_connection
+        self._generation = 0
+        self._devices = {}
+
+    def invalidate(self):
+        """Discard every cached domain description."""
+        self._generation += 1
+
+    @staticmethod
+    def _cache_key(domain):
+        return (domain.ID(), domain.UUIDString())
+
+    def get_devices(self, domain):
+        """Return the DomainDevices of a virDomain, parsing it if needed."""
+        key = self._cache_key(domain)
+        cached = self._devices.get(key)
+        if cached is not None and cached[0] == self._generation:
+            return cached[1]
+
+        devices = DomainDevices(domain.XMLDesc(0))
+        self._devices[key] = (self._generation, devices)
+        return devices
+
+    def collect(self):
+        """Return a DomainStats for every running and defined domain."""
+        conn = self._get_connection()
+        result = []
+        seen = set()
+
+        # listDomainsID() fails on an empty host with some libvirt versions
+        dom_ids = conn.listDomainsID() if conn.numOfDomains() else []
+        for dom_id in dom_ids:
+            try:
+                domain = conn.lookupByID(dom_id)
+                info = domain.info()
+                devices = self.get_devices(domain)
+                seen.add(self._cache_key(domain))
+                name = domain.name()
+            except libvirt.libvirtError:
+                # Domain was deleted while listing... ignore it
+                continue
+            # NOTE: lxc may not report vcpus, but returning 0 for a used
+            # count is hardly useful for something measuring usage.
+            result.append(DomainStats(dom_id, name, info[3] or 1, info[2],
+                                      devices))
+            greenthread.sleep(0)
+
+        for name in conn.listDefinedDomains():
+            try:
+                domain = conn.lookupByName(name)
+                devices = self.get_devices(domain)
+                seen.add(self._cache_key(domain))
+            except libvirt.libvirtError:
+                continue
+            result.append(DomainStats(-1, name, 0, 0, devices))
+            greenthread.sleep(0)
+
+        for key in set(self._devices) - seen:
+            del self._devices[key]
+        return result
@@ -18,11 +18,16 @@
 import abc
 import contextlib
 import os
+import sys
+import time
+
+from eventlet import event
 
 from nova.openstack.common import cfg
 from nova.openstack.common import excutils
 from nova.openstack.common import fileutils
 from nova.openstack.common import lockutils
+from nova.openstack.common import log as logging
 from nova import utils
 from nova.virt.disk import api as disk
 from nova.virt.libvirt import config as vconfig
@@ -49,6 +54,105 @@ CONF = cfg.CONF
 CONF.register_opts(__imagebackend_opts)
 CONF.import_opt('base_dir_name', 'nova.virt.libvirt.imagecache')
 
+LOG = logging.getLogger(__name__)
+
+
+class FetchRegistry(object):
+    """Single-flight registry for base image fetches.
+
+    The first caller to ask for a key runs the fetch; callers arriving
+    while it is in progress wait for it and share its result, instead of
+    queueing on the file lock and each re-checking the target in turn.
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self.fetches = 0
+        self.deduped = 0
+        self.wait_time = 0.0
+
+    def run(self, key, func, *args, **kwargs):
+        """Run func for key unless a fetch for key is in flight.
+
+        If the fetch in flight fails, its exception is raised to every
+        caller waiting for it.
+        """
+        waiter = self._in_flight.get(key)
+        if waiter is not None:
+            self.deduped += 1
+            start = time.time()
+            try:
+                return waiter.wait()
+            finally:
+                waited = time.time() - start
+                self.wait_time += waited
+                LOG.debug(_('Waited %(waited).2fs for in-flight fetch of '
+                            '%(key)s'), locals())
+
+        waiter = event.Event()
+        self._in_flight[key] = waiter
+        self.fetches += 1
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                waiter.send_exception(*sys.exc_info())
+        else:
+            waiter.send(result)
+            return result
+        finally:
+            del self._in_flight[key]
+
+    def get_stats(self):
+        return {'fetches': self.fetches,
+                'deduped': self.deduped,
+                'wait_time': self.wait_time,
+                'in_flight': len(self._in_flight)}
+
+
+FETCHES = FetchRegistry()
+
+
+def _lock_path():
+    # NOTE(mikal): We need a lock directory which is shared along with
+    # instance files, to cover the scenario where multiple compute nodes
+    # are trying to create a base file at the same time
+    return os.path.join(CONF.instances_path, 'locks')
+
+
+def _fetch_once(fetch_func, filename, target, *args, **kwargs):
+    """Fetch target unless it exists, sharing fetches in flight.
+
+    The external lock still serialises fetches across processes and
+    hosts sharing the instances directory.  Fetches are only shared when
+    both the lock name and the target match: an image generated in place
+    has the disk as its target, whatever template it is made from.
+    """
+    @lockutils.synchronized(filename, 'nova-', external=True,
+                            lock_path=_lock_path())
+    def call_if_not_exists():
+        if not os.path.exists(target):
+            fetch_func(target=target, *args, **kwargs)
+
+    FETCHES.run((filename, target), call_if_not_exists)
+
+
+def fetch_base_image(fetch_func, filename, *args, **kwargs):
+    """Fetch a base image into the image cache ahead of any instance.
+
+    :fetch_func: Function that creates the base image
+                 Should accept `target` argument.
+    :filename: Name of the file in the image directory
+
+    Returns the path to the base image.
+    """
+    base_dir = os.path.join(CONF.instances_path, CONF.base_dir_name)
+    if not os.path.exists(base_dir):
+        fileutils.ensure_tree(base_dir)
+    base = os.path.join(base_dir, filename)
+    _fetch_once(fetch_func, filename, base, *args, **kwargs)
+    return base
+
 
 class Image(object):
     __metaclass__ = abc.ABCMeta
@@ -64,10 +168,7 @@ class Image(object):
         self.driver_format = driver_format
         self.is_block_dev = is_block_dev
 
-        # NOTE(mikal): We need a lock directory which is shared along with
-        # instance files, to cover the scenario where multiple compute nodes
-        # are trying to create a base file at the same time
-        self.lock_path = os.path.join(CONF.instances_path, 'locks')
+        self.lock_path = _lock_path()
 
     @abc.abstractmethod
     def create_image(self, prepare_template, base, size, *args, **kwargs):
@@ -107,18 +208,15 @@ class Image(object):
 
         Ensures that template and image not already exists.
         Ensures that base directory exists.
-        Synchronizes on template fetching.
+        Synchronizes on template fetching, sharing fetches in flight.
 
         :fetch_func: Function that creates the base image
                      Should accept `target` argument.
         :filename: Name of the file in the image directory
         :size: Size of created image in bytes (optional)
         """
-        @lockutils.synchronized(filename, 'nova-', external=True,
-                                lock_path=self.lock_path)
         def call_if_not_exists(target, *args, **kwargs):
-            if not os.path.exists(target):
-                fetch_func(target=target, *args, **kwargs)
+            _fetch_once(fetch_func, filename, target, *args, **kwargs)
 
         if not os.path.exists(self.path):
             base_dir = os.path.join(CONF.instances_path, CONF.base_dir_name)
@@ -22,12 +22,15 @@ http://wiki.openstack.org/nova-image-cache-management.
 
 """
 
+import collections
 import hashlib
 import json
 import os
 import re
 import time
 
+from eventlet import greenthread
+
 from nova.compute import task_states
 from nova.compute import vm_states
 from nova.openstack.common import cfg
@@ -35,7 +38,6 @@ from nova.openstack.common import fileutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import lockutils
 from nova.openstack.common import log as logging
-from nova import utils
 from nova.virt.libvirt import utils as virtutils
 
 
@@ -68,6 +70,14 @@ imagecache_opts = [
     cfg.IntOpt('checksum_interval_seconds',
                default=3600,
                help='How frequently to checksum base images'),
+    cfg.IntOpt('checksum_read_rate_mb',
+               default=50,
+               help='Maximum rate in MB/s at which base images are read '
+                    'when checksumming them. 0 means unlimited'),
+    cfg.StrOpt('image_cache_index_path',
+               default='$instances_path/imagecache-$host.json',
+               help='Where the image cache manager keeps what it learnt '
+                    'about base images and instance disks between passes'),
     ]
 
 CONF = cfg.CONF
@@ -75,6 +85,8 @@ CONF.register_opts(imagecache_opts)
 CONF.import_opt('host', 'nova.config')
 CONF.import_opt('instances_path', 'nova.compute.manager')
 
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
 
 def get_info_filename(base_path):
     """Construct a filename for storing addtional information about a base
@@ -202,19 +214,151 @@ def read_stored_checksum(target, timestamped=True):
     return read_stored_info(target, field='sha1', timestamped=timestamped)
 
 
+def hash_file(path):
+    """Checksum a file without reading faster than checksum_read_rate_mb."""
+
+    rate = CONF.checksum_read_rate_mb * 1024 * 1024
+    checksum = hashlib.sha1()
+    start = time.time()
+    read = 0
+    with open(path, 'r') as img_file:
+        for chunk in iter(lambda: img_file.read(CHECKSUM_CHUNK_SIZE), ''):
+            checksum.update(chunk)
+            read += len(chunk)
+            delay = 0
+            if rate:
+                delay = read / float(rate) - (time.time() - start)
+            # Give other threads a chance to run
+            time.sleep(max(delay, 0))
+    return checksum.hexdigest()
+
+
 def write_stored_checksum(target):
     """Write a checksum to disk for a file in _base."""
 
-    with open(target, 'r') as img_file:
-        checksum = utils.hash_file(img_file)
-    write_stored_info(target, field='sha1', value=checksum)
+    write_stored_info(target, field='sha1', value=hash_file(target))
+
+
+def _get_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _settled_mtime(mtime):
+    """Return mtime if a listing taken now can be reused while it holds.
+
+    A directory changed within the last second may change again without
+    its mtime moving on filesystems with coarse timestamps.
+    """
+    if mtime is not None and mtime < time.time() - 1:
+        return mtime
+    return None
+
+
+class ImageCacheIndex(object):
+    """What earlier passes learnt about _base and the instance disks.
+
+    The listing of _base and the backing file of each instance disk are
+    reused for as long as the mtime of the directory they came from is
+    unchanged, and the results of background checksums for as long as the
+    size of the base file is. The index is saved to
+    image_cache_index_path so that it survives a restart.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.base_dir = None
+        self.instance_dirs = {}
+        self.checksums = {}
+
+        try:
+            with open(path, 'r') as f:
+                d = jsonutils.loads(f.read())
+        except (IOError, ValueError):
+            return
+        self.base_dir = d.get('base_dir')
+        self.instance_dirs = d.get('instance_dirs', {})
+        self.checksums = d.get('checksums', {})
+
+    def get_base_images(self, base_dir):
+        """Return the cached [name, original] entries of _base, or None."""
+        mtime = _get_mtime(base_dir)
+        if (mtime is not None and self.base_dir and
+            self.base_dir[:2] == [base_dir, mtime]):
+            return self.base_dir[2]
+
+    def set_base_images(self, base_dir, mtime, entries):
+        mtime = _settled_mtime(mtime)
+        self.base_dir = mtime and [base_dir, mtime, entries] or None
+
+    def get_backing_file(self, instance_dir):
+        """Return (found, backing file) for the disk of an instance."""
+        mtime = _get_mtime(instance_dir)
+        cached = self.instance_dirs.get(instance_dir)
+        if mtime is not None and cached and cached[0] == mtime:
+            return True, cached[1]
+        return False, None
+
+    def set_backing_file(self, instance_dir, mtime, backing_file):
+        mtime = _settled_mtime(mtime)
+        if mtime:
+            self.instance_dirs[instance_dir] = [mtime, backing_file]
+        else:
+            self.instance_dirs.pop(instance_dir, None)
+
+    def prune_instance_dirs(self, instance_dirs):
+        for instance_dir in set(self.instance_dirs) - set(instance_dirs):
+            del self.instance_dirs[instance_dir]
+
+    def get_checksum_result(self, base_file):
+        """Return the last background checksum result for a base file."""
+        cached = self.checksums.get(base_file)
+        if cached:
+            try:
+                if os.path.getsize(base_file) == cached[0]:
+                    return cached[1]
+            except OSError:
+                pass
+
+    def set_checksum_result(self, base_file, size, result):
+        self.checksums[base_file] = [size, result]
+
+    def forget(self, base_file):
+        self.checksums.pop(base_file, None)
+
+    def save(self):
+        d = {'base_dir': self.base_dir,
+             'instance_dirs': self.instance_dirs,
+             'checksums': self.checksums}
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(jsonutils.dumps(d))
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError), e:
+            LOG.warning(_('Could not save image cache index %(path)s: '
+                          '%(error)s'),
+                        {'path': self.path,
+                         'error': e})
 
 
 class ImageCacheManager(object):
     def __init__(self):
         self.lock_path = os.path.join(CONF.instances_path, 'locks')
+        self._index = None
+        self._checksum_queue = collections.deque()
+        self._checksum_worker = None
         self._reset_state()
 
+    @property
+    def index(self):
+        if self._index is None or self._index.path != \
+                CONF.image_cache_index_path:
+            self._index = ImageCacheIndex(CONF.image_cache_index_path)
+        return self._index
+
     def _reset_state(self):
         """Reset state variables used for each pass."""
 
@@ -231,10 +375,9 @@ class ImageCacheManager(object):
     def _store_image(self, base_dir, ent, original=False):
         """Store a base image for later examination."""
         entpath = os.path.join(base_dir, ent)
-        if os.path.isfile(entpath):
-            self.unexplained_images.append(entpath)
-            if original:
-                self.originals.append(entpath)
+        self.unexplained_images.append(entpath)
+        if original:
+            self.originals.append(entpath)
 
     def _list_base_images(self, base_dir):
         """Return a list of the images present in _base.
@@ -245,16 +388,30 @@ class ImageCacheManager(object):
 
         Note that this does not return a value. It instead populates a class
         variable with a list of images that we need to try and explain.
+
+        The directory is only listed again once its mtime has changed.
         """
-        digest_size = hashlib.sha1().digestsize * 2
-        for ent in os.listdir(base_dir):
-            if len(ent) == digest_size:
-                self._store_image(base_dir, ent, original=True)
+        entries = self.index.get_base_images(base_dir)
+        if entries is None:
+            mtime = _get_mtime(base_dir)
+            entries = []
+            digest_size = hashlib.sha1().digestsize * 2
+            for ent in os.listdir(base_dir):
+                if len(ent) == digest_size:
+                    original = True
+                elif (len(ent) > digest_size + 2 and
+                      ent[digest_size] == '_' and
+                      not is_valid_info_file(os.path.join(base_dir, ent))):
+                    original = False
+                else:
+                    continue
+
+                if os.path.isfile(os.path.join(base_dir, ent)):
+                    entries.append([ent, original])
+            self.index.set_base_images(base_dir, mtime, entries)
 
-            elif (len(ent) > digest_size + 2 and
-                  ent[digest_size] == '_' and
-                  not is_valid_info_file(os.path.join(base_dir, ent))):
-                self._store_image(base_dir, ent, original=False)
+        for ent, original in entries:
+            self._store_image(base_dir, ent, original=original)
 
     def _list_running_instances(self, context, all_instances):
         """List running instances (on all compute nodes)."""
@@ -286,37 +443,57 @@ class ImageCacheManager(object):
             self.image_popularity.setdefault(image_ref_str, 0)
             self.image_popularity[image_ref_str] += 1
 
+    def _get_backing_file(self, ent):
+        """Return the backing file of an instance's disk, if it has one.
+
+        The answer is reused until the instance directory changes, which
+        is what happens when its disk is created or replaced.
+        """
+        instance_dir = os.path.join(CONF.instances_path, ent)
+        found, backing_file = self.index.get_backing_file(instance_dir)
+        if found:
+            return backing_file
+
+        mtime = _get_mtime(instance_dir)
+        backing_file = None
+        disk_path = os.path.join(instance_dir, 'disk')
+        if os.path.exists(disk_path):
+            LOG.debug(_('%s has a disk file'), ent)
+            backing_file = virtutils.get_disk_backing_file(disk_path)
+        self.index.set_backing_file(instance_dir, mtime, backing_file)
+        return backing_file
+
     def _list_backing_images(self):
         """List the backing images currently in use."""
         inuse_images = []
+        instance_dirs = []
         for ent in os.listdir(CONF.instances_path):
             if ent in self.instance_names:
                 LOG.debug(_('%s is a valid instance name'), ent)
-                disk_path = os.path.join(CONF.instances_path, ent, 'disk')
-                if os.path.exists(disk_path):
-                    LOG.debug(_('%s has a disk file'), ent)
-                    backing_file = virtutils.get_disk_backing_file(disk_path)
+                instance_dirs.append(os.path.join(CONF.instances_path, ent))
+                backing_file = self._get_backing_file(ent)
+                if backing_file:
                     LOG.debug(_('Instance %(instance)s is backed by '
                                 '%(backing)s'),
                               {'instance': ent,
                                'backing': backing_file})
 
-                    if backing_file:
-                        backing_path = os.path.join(CONF.instances_path,
-                                                    CONF.base_dir_name,
-                                                    backing_file)
-                        if not backing_path in inuse_images:
-                            inuse_images.append(backing_path)
-
-                        if backing_path in self.unexplained_images:
-                            LOG.warning(_('Instance %(instance)s is using a '
-                                          'backing file %(backing)s which '
-                                          'does not appear in the image '
-                                          'service'),
-                                        {'instance': ent,
-                                         'backing': backing_file})
-                            self.unexplained_images.remove(backing_path)
-
+                    backing_path = os.path.join(CONF.instances_path,
+                                                CONF.base_dir_name,
+                                                backing_file)
+                    if not backing_path in inuse_images:
+                        inuse_images.append(backing_path)
+
+                    if backing_path in self.unexplained_images:
+                        LOG.warning(_('Instance %(instance)s is using a '
+                                      'backing file %(backing)s which '
+                                      'does not appear in the image '
+                                      'service'),
+                                    {'instance': ent,
+                                     'backing': backing_file})
+                        self.unexplained_images.remove(backing_path)
+
+        self.index.prune_instance_dirs(instance_dirs)
         return inuse_images
 
     def _find_base_file(self, base_dir, fingerprint):
@@ -381,8 +558,7 @@ class ImageCacheManager(object):
                     write_stored_info(base_file, field='sha1',
                                       value=stored_checksum)
 
-                with open(base_file, 'r') as f:
-                    current_checksum = utils.hash_file(f)
+                current_checksum = hash_file(base_file)
 
                 if current_checksum != stored_checksum:
                     LOG.error(_('image %(id)s at (%(base_file)s): image '
@@ -413,6 +589,33 @@ class ImageCacheManager(object):
 
         return inner_verify_checksum()
 
+    def _queue_checksum(self, img_id, base_file):
+        """Have a base image checksummed by the background reader."""
+        if (img_id, base_file) not in self._checksum_queue:
+            self._checksum_queue.append((img_id, base_file))
+
+    def _run_checksums(self):
+        """Checksum the queued base images, one at a time."""
+        while self._checksum_queue:
+            img_id, base_file = self._checksum_queue.popleft()
+            try:
+                size = os.path.getsize(base_file)
+                result = self._verify_checksum(img_id, base_file)
+            except (IOError, OSError), e:
+                LOG.warning(_('image %(id)s at (%(base_file)s): could not '
+                              'be checksummed: %(error)s'),
+                            {'id': img_id,
+                             'base_file': base_file,
+                             'error': e})
+                continue
+            self.index.set_checksum_result(base_file, size, result)
+        self.index.save()
+
+    def _start_checksums(self):
+        if self._checksum_queue and (self._checksum_worker is None or
+                                     self._checksum_worker.dead):
+            self._checksum_worker = greenthread.spawn(self._run_checksums)
+
     def _remove_base_file(self, base_file):
         """Remove a single base file if it is old enough.
 
@@ -437,6 +640,7 @@ class ImageCacheManager(object):
             LOG.info(_('Removing base file: %s'), base_file)
             try:
                 os.remove(base_file)
+                self.index.forget(base_file)
                 signature = get_info_filename(base_file)
                 if os.path.exists(signature):
                     os.remove(signature)
@@ -459,16 +663,16 @@ class ImageCacheManager(object):
         if base_file in self.unexplained_images:
             self.unexplained_images.remove(base_file)
 
-        if (base_file and os.path.exists(base_file)
-            and os.path.isfile(base_file)):
-            # _verify_checksum returns True if the checksum is ok, and None if
-            # there is no checksum file
-            checksum_result = self._verify_checksum(img_id, base_file)
+        if (CONF.checksum_base_images and base_file and
+            os.path.exists(base_file) and os.path.isfile(base_file)):
+            # NOTE: base images are hashed by a background reader rather than
+            # in this periodic task, so this reports the result of the last
+            # check: True if the checksum is ok, and None if there is no
+            # checksum file or the image has not been checked yet.
+            checksum_result = self.index.get_checksum_result(base_file)
             if not checksum_result is None:
                 image_bad = not checksum_result
-
-            # Give other threads a chance to run
-            time.sleep(0)
+            self._queue_checksum(img_id, base_file)
 
         instances = []
         if img_id in self.used_images:
@@ -516,7 +720,12 @@ class ImageCacheManager(object):
                     os.utime(base_file, None)
 
     def verify_base_images(self, context, all_instances):
-        """Verify that base images are in a reasonable state."""
+        """Verify that base images are in a reasonable state.
+
+        Base images are checksummed in the background after the pass, so
+        corrupt_base_files reports the checks of the previous pass: an
+        image that has gone bad is only listed by the next one.
+        """
 
         # NOTE(mikal): The new scheme for base images is as follows -- an
         # image is streamed from the image service to _base (filename is the
@@ -579,5 +788,8 @@ class ImageCacheManager(object):
                 for base_file in self.removable_base_files:
                     self._remove_base_file(base_file)
 
+        self.index.save()
+        self._start_checksums()
+
         # That's it
         LOG.debug(_('Verification complete'))
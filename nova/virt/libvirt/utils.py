@@ -257,7 +257,7 @@ def get_disk_size(path):
     :returns: Size (in bytes) of the given disk image as it would be seen
               by a virtual machine.
     """
-    size = images.qemu_img_info(path).virtual_size
+    size = images.disk_image_info(path).virtual_size
     return int(size)
 
 
@@ -267,7 +267,7 @@ def get_disk_backing_file(path):
     :param path: Path to the disk image
     :returns: a path to the image's backing store
     """
-    backing_file = images.qemu_img_info(path).backing_file
+    backing_file = images.disk_image_info(path).backing_file
     if backing_file:
         backing_file = os.path.basename(backing_file)
 
@@ -443,7 +443,7 @@ def get_disk_type(path):
     if path.startswith('/dev'):
         return 'lvm'
 
-    return images.qemu_img_info(path).file_format
+    return images.disk_image_info(path).file_format
 
 
 def get_fs_info(path):
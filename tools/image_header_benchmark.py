@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compare identifying disk images with `qemu-img info` and with the header
+reader in nova.virt.images, over a directory of images generated with
+qemu-img create: raw, qcow2, qcow2 backed by the raw base, vmdk and vpc.
+
+    tools/image_header_benchmark.py [--images N]
+"""
+
+import optparse
+import os
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir, os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from nova import utils
+from nova.virt import images
+
+FORMATS = ['raw', 'qcow2', 'qcow2-backed', 'vmdk', 'vpc']
+
+
+def create_images(tmpdir, count):
+    base = os.path.join(tmpdir, 'base')
+    utils.execute('qemu-img', 'create', '-f', 'raw', base, '64M')
+    paths = []
+    for i in xrange(count):
+        fmt = FORMATS[i % len(FORMATS)]
+        path = os.path.join(tmpdir, 'disk-%d.%s' % (i, fmt))
+        if fmt == 'qcow2-backed':
+            utils.execute('qemu-img', 'create', '-f', 'qcow2',
+                          '-o', 'backing_file=%s' % base, path)
+        else:
+            utils.execute('qemu-img', 'create', '-f', fmt, path, '1G')
+        paths.append(path)
+    return paths
+
+
+def run(func, paths):
+    start = time.time()
+    results = [func(path) for path in paths]
+    return results, time.time() - start
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--images', type='int', default=500)
+    options, args = parser.parse_args()
+
+    with utils.tempdir() as tmpdir:
+        paths = create_images(tmpdir, options.images)
+        native, native_time = run(images.read_image_header, paths)
+        forked, forked_time = run(images.qemu_img_info, paths)
+
+    mismatches = 0
+    for path, ours, theirs in zip(paths, native, forked):
+        if ours is None:
+            continue
+        if ((ours.file_format, ours.virtual_size, ours.backing_file) !=
+            (theirs.file_format, theirs.virtual_size, theirs.backing_file)):
+            mismatches += 1
+            print('%s: header says %s, qemu-img says %s' %
+                  (os.path.basename(path), ours, theirs))
+
+    print('qemu-img info:     %.1f images/s' % (len(paths) / forked_time))
+    print('read_image_header: %.1f images/s (%d left to qemu-img, '
+          '%d mismatches)' % (len(paths) / native_time,
+                              native.count(None), mismatches))
+
+
+if __name__ == '__main__':
+    main()
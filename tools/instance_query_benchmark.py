@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compare listing instances with every relation joined into one query and
+with instance_get_all_by_filters, over a SQLite database seeded with
+instances that carry metadata and system metadata.
+
+    tools/instance_query_benchmark.py [--instances N] [--metadata N]
+                                      [--system-metadata N] [--repeat N]
+"""
+
+import optparse
+import os
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir, os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from sqlalchemy.orm import joinedload
+
+from nova import context
+from nova import db
+from nova.db import migration
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy import session as db_session
+from nova.openstack.common import cfg
+from nova import utils
+
+CONF = cfg.CONF
+
+COLLECTIONS = ['security_groups', 'system_metadata', 'metadata']
+ALL_COLUMNS = ['info_cache', 'instance_type'] + COLLECTIONS
+
+
+def seed(ctxt, count, metadata, system_metadata):
+    for i in xrange(count):
+        db.instance_create(ctxt, {
+                'project_id': 'project%d' % (i % 10),
+                'user_id': 'user',
+                'host': 'host%d' % (i % 20),
+                'display_name': 'instance-%d' % i,
+                'security_groups': ['default'],
+                'metadata': dict(('key%d' % k, 'value')
+                                 for k in xrange(metadata)),
+                'system_metadata': dict(('sys%d' % k, 'value')
+                                        for k in xrange(system_metadata))})
+
+
+def joined_query():
+    """The query instance_get_all_by_filters used to make."""
+    query = db_session.get_session().query(models.Instance)
+    for column in ALL_COLUMNS:
+        query = query.options(joinedload(column))
+    return query
+
+
+def run_joined():
+    query = joined_query()
+    rows = len(query.session.execute(query.statement).fetchall())
+    start = time.time()
+    instances = query.all()
+    return len(instances), rows, time.time() - start
+
+
+def run_batched(ctxt, columns_to_join):
+    start = time.time()
+    instances = db.instance_get_all_by_filters(ctxt, {},
+            columns_to_join=columns_to_join)
+    elapsed = time.time() - start
+    rows = len(instances)
+    for column in columns_to_join:
+        if column in COLLECTIONS:
+            rows += sum(len(instance[column]) for instance in instances)
+    return len(instances), rows, elapsed
+
+
+def best(func, repeat, *args):
+    results = [func(*args) for i in xrange(repeat)]
+    return min(results, key=lambda result: result[2])
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--instances', type='int', default=1000)
+    parser.add_option('--metadata', type='int', default=10)
+    parser.add_option('--system-metadata', type='int', default=30)
+    parser.add_option('--repeat', type='int', default=3)
+    options, args = parser.parse_args()
+
+    CONF([], project='nova')
+    with utils.tempdir() as tmpdir:
+        CONF.set_override('sql_connection',
+                          'sqlite:///%s' % os.path.join(tmpdir, 'nova.sqlite'))
+        CONF.set_override('sqlite_synchronous', False)
+        migration.db_sync()
+        ctxt = context.get_admin_context()
+        seed(ctxt, options.instances, options.metadata,
+             options.system_metadata)
+
+        runs = [('one joined query', best(run_joined, options.repeat))]
+        for columns_to_join in (ALL_COLUMNS, ['info_cache'], []):
+            label = 'columns_to_join=[%s]' % ','.join(columns_to_join)
+            runs.append((label, best(run_batched, options.repeat, ctxt,
+                                     columns_to_join)))
+
+    for label, (count, rows, elapsed) in runs:
+        print('%-75s\n    %d instances, %7d rows, %.3fs' %
+              (label, count, rows, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Time jsonutils over a GET /servers/detail response body and over a
+conductor payload of instance models, as the API and RPC layers use it:
+to_primitive(), dumps() and loads().
+
+    tools/json_serialization_benchmark.py [--servers N] [--instances N]
+                                          [--metadata N] [--repeat N]
+"""
+
+import datetime
+import optparse
+import os
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir, os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from nova.db.sqlalchemy import models
+from nova.openstack.common import jsonutils
+from nova.openstack.common import timeutils
+
+
+def make_links(href):
+    return [{'rel': 'self', 'href': href},
+            {'rel': 'bookmark', 'href': href}]
+
+
+def make_servers(count, metadata):
+    """A GET /servers/detail response body."""
+    servers = []
+    for i in xrange(count):
+        uuid = '%08d-aaaa-bbbb-cccc-dddddddddddd' % i
+        servers.append({
+            'id': uuid,
+            'name': u'server-%d' % i,
+            'user_id': 'fake_user',
+            'tenant_id': 'fake_project',
+            'updated': '2013-01-01T00:00:00Z',
+            'created': '2013-01-01T00:00:00Z',
+            'hostId': 'abcdef0123456789',
+            'accessIPv4': '',
+            'accessIPv6': '',
+            'status': 'ACTIVE',
+            'progress': 100,
+            'image': {'id': '1', 'links': make_links('http://nova/images/1')},
+            'flavor': {'id': '2',
+                       'links': make_links('http://nova/flavors/2')},
+            'metadata': dict(('key%d' % k, 'value%d' % k)
+                             for k in xrange(metadata)),
+            'addresses': {
+                'private': [{'version': 4, 'addr': '10.0.%d.%d' %
+                             (i / 256 % 256, i % 256)}]},
+            'links': make_links('http://nova/servers/%s' % uuid)})
+    return {'servers': servers}
+
+
+def make_instances(count, metadata):
+    """Instance models with their joins, as the conductor returns them."""
+    now = timeutils.utcnow()
+    instances = []
+    for i in xrange(count):
+        instance = models.Instance(
+                id=i,
+                uuid='%08d-aaaa-bbbb-cccc-dddddddddddd' % i,
+                created_at=now,
+                updated_at=now,
+                launched_at=now - datetime.timedelta(hours=i),
+                deleted=False,
+                project_id='fake_project',
+                user_id='fake_user',
+                host='host%d' % (i % 20),
+                display_name=u'server-%d' % i,
+                vm_state='active',
+                power_state=1,
+                memory_mb=2048,
+                vcpus=1,
+                root_gb=20)
+        instance.metadata = [models.InstanceMetadata(key='key%d' % k,
+                                                     value='value%d' % k)
+                             for k in xrange(metadata)]
+        instance.system_metadata = [
+                models.InstanceSystemMetadata(key='sys%d' % k, value='value')
+                for k in xrange(metadata)]
+        instance.info_cache = models.InstanceInfoCache(network_info='[]')
+        instances.append(instance)
+    return instances
+
+
+def best(func, repeat, *args):
+    results = []
+    for i in xrange(repeat):
+        start = time.time()
+        result = func(*args)
+        results.append((time.time() - start, result))
+    return min(results)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--servers', type='int', default=1000)
+    parser.add_option('--instances', type='int', default=200)
+    parser.add_option('--metadata', type='int', default=10)
+    parser.add_option('--repeat', type='int', default=5)
+    options, args = parser.parse_args()
+
+    payloads = [
+        ('server list', make_servers(options.servers, options.metadata)),
+        ('conductor instances', make_instances(options.instances,
+                                               options.metadata)),
+    ]
+
+    for label, payload in payloads:
+        primitive_time, primitive = best(jsonutils.to_primitive,
+                                         options.repeat, payload)
+        dumps_time, encoded = best(jsonutils.dumps, options.repeat,
+                                   primitive)
+        loads_time, _decoded = best(jsonutils.loads, options.repeat,
+                                    encoded)
+        print('%-20s %8d bytes\n    to_primitive %.3fs, dumps %.3fs, '
+              'loads %.3fs' % (label, len(encoded), primitive_time,
+                               dumps_time, loads_time))
+
+
+if __name__ == '__main__':
+    main()
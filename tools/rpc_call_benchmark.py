@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure rpc.call() throughput with the kombu driver against the in-memory
+fake broker (fake_rabbit), with a reply queue per call and with the
+single reply queue of amqp_rpc_single_reply_queue.
+
+    tools/rpc_call_benchmark.py [--calls N] [--concurrency N]
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import optparse
+import os
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir, os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from nova import context
+from nova.openstack.common import cfg
+from nova.openstack.common import rpc
+from nova.openstack.common.rpc import dispatcher
+
+CONF = cfg.CONF
+CONF.import_opt('amqp_rpc_single_reply_queue',
+                'nova.openstack.common.rpc.amqp')
+TOPIC = 'rpc_call_benchmark'
+
+
+class EchoManager(object):
+    RPC_API_VERSION = '1.0'
+
+    def echo(self, context, value):
+        return value
+
+
+def run(calls, concurrency):
+    conn = rpc.create_connection(new=True)
+    conn.create_consumer(TOPIC, dispatcher.RpcDispatcher([EchoManager()]))
+    conn.consume_in_thread()
+    ctxt = context.get_admin_context()
+
+    def call(value):
+        result = rpc.call(ctxt, TOPIC, {'method': 'echo',
+                                        'args': {'value': value},
+                                        'version': '1.0'})
+        assert result == value
+        return result
+
+    pool = eventlet.GreenPool(concurrency)
+    # Warm up the connection pool.
+    list(pool.imap(call, xrange(concurrency)))
+    start = time.time()
+    list(pool.imap(call, xrange(calls)))
+    elapsed = time.time() - start
+    conn.close()
+    rpc.cleanup()
+    return calls / elapsed
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--calls', type='int', default=2000)
+    parser.add_option('--concurrency', type='int', default=20)
+    options, args = parser.parse_args()
+
+    CONF([], project='nova')
+    CONF.set_override('rpc_backend', 'nova.openstack.common.rpc.impl_kombu')
+    CONF.set_override('fake_rabbit', True)
+    for single_reply_queue in (False, True):
+        CONF.set_override('amqp_rpc_single_reply_queue', single_reply_queue)
+        rate = run(options.calls, options.concurrency)
+        print('amqp_rpc_single_reply_queue=%s: %.0f calls/s' %
+              (single_reply_queue, rate))
+
+
+if __name__ == '__main__':
+    main()
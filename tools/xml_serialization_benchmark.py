@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compare serializing a GET /servers/detail response to XML by walking the
+template tree and with the compiled template, checking that both give
+the same bytes, with serializing it to JSON for reference.
+
+    tools/xml_serialization_benchmark.py [--servers N] [--metadata N]
+                                         [--repeat N]
+"""
+
+import optparse
+import os
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir, os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from lxml import etree
+
+from nova.api.openstack.compute.contrib import disk_config
+from nova.api.openstack.compute.contrib import extended_status
+from nova.api.openstack.compute import servers
+from nova.openstack.common import jsonutils
+
+
+def make_links(href):
+    return [{'rel': 'self', 'href': href},
+            {'rel': 'bookmark', 'href': href}]
+
+
+def make_servers(count, metadata):
+    detail = []
+    for i in xrange(count):
+        uuid = '%08d-aaaa-bbbb-cccc-dddddddddddd' % i
+        detail.append({
+            'id': uuid,
+            'name': 'server-%d' % i,
+            'user_id': 'fake_user',
+            'tenant_id': 'fake_project',
+            'updated': '2013-01-01T00:00:00Z',
+            'created': '2013-01-01T00:00:00Z',
+            'hostId': 'abcdef0123456789',
+            'accessIPv4': '',
+            'accessIPv6': '',
+            'status': 'ACTIVE',
+            'progress': 100,
+            'image': {'id': '1', 'links': make_links('http://nova/images/1')},
+            'flavor': {'id': '2',
+                       'links': make_links('http://nova/flavors/2')},
+            'metadata': dict(('key%d' % k, 'value%d' % k)
+                             for k in xrange(metadata)),
+            'addresses': {
+                'private': [{'version': 4, 'addr': '10.0.%d.%d' %
+                             (i / 256 % 256, i % 256)},
+                            {'version': 6, 'addr': 'fe80::%x' % i}],
+                'public': [{'version': 4, 'addr': '172.16.%d.%d' %
+                            (i / 256 % 256, i % 256)}]},
+            'links': make_links('http://nova/servers/%s' % uuid),
+            'OS-EXT-STS:task_state': None,
+            'OS-EXT-STS:vm_state': 'active',
+            'OS-EXT-STS:power_state': 1,
+            'OS-DCF:diskConfig': 'AUTO'})
+    return {'servers': detail}
+
+
+def make_template():
+    """The template serializing GET /servers/detail with extensions."""
+    tmpl = servers.ServersTemplate()
+    tmpl.attach(extended_status.ExtendedStatusesTemplate())
+    tmpl.attach(disk_config.ServersDiskConfigTemplate())
+    return tmpl
+
+
+def serialize_walked(obj):
+    """Serialize as Template.serialize() used to, walking the tree."""
+    tmpl = make_template()
+    elem = tmpl._serialize(None, obj, tmpl._siblings(), tmpl._nsmap())
+    return etree.tostring(elem, **tmpl.serialize_options)
+
+
+def serialize_compiled(obj):
+    return make_template().serialize(obj)
+
+
+def serialize_json(obj):
+    return jsonutils.dumps(obj)
+
+
+def best(func, repeat, obj):
+    results = []
+    for i in xrange(repeat):
+        start = time.time()
+        result = func(obj)
+        results.append((time.time() - start, result))
+    return min(results)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--servers', type='int', default=1000)
+    parser.add_option('--metadata', type='int', default=5)
+    parser.add_option('--repeat', type='int', default=5)
+    options, args = parser.parse_args()
+
+    obj = make_servers(options.servers, options.metadata)
+
+    runs = []
+    for label, func in (('walked template', serialize_walked),
+                        ('compiled template', serialize_compiled),
+                        ('json', serialize_json)):
+        elapsed, result = best(func, options.repeat, obj)
+        runs.append((label, elapsed, result))
+        print('%-20s %8d bytes, %.3fs' % (label, len(result), elapsed))
+
+    if runs[0][2] != runs[1][2]:
+        print('compiled template output differs from walked template')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()